@@ -0,0 +1,353 @@
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import platform
+import Queue
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import bigrammer
+import profiling
+import sensplit
+
+# Bigrammer benchmarks
+#
+# Generates synthetic corpora whose word frequencies follow Zipf's law, then times each stage of a
+# model build and each kind of query on them. Every case runs in its own process, so the peak RSS it
+# reports belongs to that case alone (setup included) and no models are cached between cases.
+#
+# Results are written to a JSON file. Given a baseline results file, the run is compared against
+# it and any case that got slower (or bigger) by more than the threshold is reported as a regression.
+#
+#   python benchmark.py --sizes 10000,100000,1000000 --output results.json
+#   python benchmark.py --compare results.json
+
+#corpus sizes, in tokens, benchmarked by default
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+#how much slower (or bigger) a case may get than its baseline before it counts as a regression
+DEFAULT_THRESHOLD = 0.2
+
+#how many queries the query cases make
+NUM_QUERIES = 10000
+
+#how many generated words are written at a time
+WRITE_BATCH = 10000
+
+#how often a case's process is checked on while waiting for its result, in seconds
+POLL_INTERVAL = 1.0
+
+#letters used to spell the synthetic words. Every word also starts with "x", which keeps them all
+#clear of the stop word list.
+WORD_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+#Corpora ---------------------------------------------------------------------------------------------------------
+
+#@return    Returns the made up word for a word rank
+def zipfWord(rank):
+    word = "x"
+    while True:
+        word += WORD_LETTERS[rank % len(WORD_LETTERS)]
+        rank //= len(WORD_LETTERS)
+        if rank == 0:
+            return word
+
+#Writes a corpus of words drawn from a Zipf distribution (the word of rank r turns up in proportion
+#to 1/r^exponent), split into sentences of random length averaging senLength words.
+# @filename     Where to write the corpus
+# @numTokens    How many words to write
+# @vocabSize    How many different words to draw from
+# @senLength    Average words per sentence
+# @exponent     The Zipf exponent; larger makes the common words more common
+# @seed         Random seed, so the same arguments always make the same corpus
+def makeZipfCorpus(filename, numTokens, vocabSize=10000, senLength=12, exponent=1.0, seed=0):
+    rng = random.Random(seed)
+    words = [zipfWord(rank) for rank in range(vocabSize)]
+
+    cumulative = []
+    total = 0.0
+    for rank in range(1, vocabSize + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+
+    corpusFile = open(filename, "w")
+    try:
+        written = 0
+        untilSentenceEnd = rng.randint(1, 2 * senLength - 1)
+        batch = []
+        while written < numTokens:
+            word = words[bisect.bisect_left(cumulative, rng.random() * total)]
+            written += 1
+            untilSentenceEnd -= 1
+            if untilSentenceEnd == 0 or written == numTokens:
+                word += "."
+                untilSentenceEnd = rng.randint(1, 2 * senLength - 1)
+            batch.append(word)
+            if len(batch) == WRITE_BATCH:
+                corpusFile.write(" ".join(batch) + "\n")
+                batch = []
+        if len(batch) > 0:
+            corpusFile.write(" ".join(batch) + "\n")
+    finally:
+        corpusFile.close()
+
+#@return    Returns the filename of a synthetic corpus in corpusDir, making it if it doesn't exist yet
+def getZipfCorpus(corpusDir, numTokens, vocabSize, senLength, exponent, seed):
+    filename = os.path.join(corpusDir, "zipf-%d-%d-%d-%g-%d.txt" % (numTokens, vocabSize, senLength, exponent, seed))
+    if not os.path.exists(filename):
+        makeZipfCorpus(filename + ".tmp", numTokens, vocabSize, senLength, exponent, seed)
+        os.rename(filename + ".tmp", filename)
+    return filename
+
+
+#Cases -----------------------------------------------------------------------------------------------------------
+
+#Each case takes a corpus filename, does whatever setup it needs, and returns the function to time.
+
+def _senSplitter(corpusFilename):
+    return lambda: sensplit.sen_splitter(corpusFilename)
+
+def _countCorpus(corpusFilename):
+    return lambda: bigrammer.countCorpus(corpusFilename)
+
+def _makeBigramFreqList(corpusFilename):
+    return lambda: bigrammer.makeBigramFreqList(corpusFilename)
+
+def _getBigramProbTable(corpusFilename):
+    bigramFrequencyList = bigrammer.makeBigramFreqList(corpusFilename)
+    tokenFrequencyList = bigrammer.makeWordFreqList(corpusFilename)
+    return lambda: bigrammer.getBigramProbTable(bigramFrequencyList, tokenFrequencyList)
+
+def _getLikelyNextWord(corpusFilename):
+    bigramFrequencyList = bigrammer.makeBigramFreqList(corpusFilename)
+    table = bigrammer.getBigramProbTable(bigramFrequencyList, bigrammer.makeWordFreqList(corpusFilename))
+    words = _queryWords(table.vocabulary)
+    return lambda: [bigrammer.getLikelyNextWord(table, word) for word in words]
+
+def _compileModel(corpusFilename):
+    modelFilename = corpusFilename + ".bench" + bigrammer.MODEL_EXTENSION
+    return lambda: bigrammer.compileModel(corpusFilename, modelFilename).close()
+
+def _loadModel(corpusFilename):
+    bigrammer.loadModel(corpusFilename).close()
+    return lambda: bigrammer.loadModel(corpusFilename).close()
+
+def _getBigramChances(corpusFilename):
+    model = bigrammer.loadModel(corpusFilename)
+    words = _queryWords(model.vocabulary())
+    pairs = zip(words, reversed(words))
+    return lambda: list(bigrammer.getBigramChances(model, pairs))
+
+def _predictNextWords(corpusFilename):
+    model = bigrammer.loadModel(corpusFilename)
+    words = _queryWords(model.vocabulary())
+    return lambda: list(bigrammer.predictNextWords(model, words, 5))
+
+def _printLikelySen(corpusFilename):
+    bigrammer.loadModel(corpusFilename).close()
+    return lambda: bigrammer.printLikelySen(corpusFilename)
+
+#@return    Returns NUM_QUERIES words picked from a vocabulary, the same ones every run
+def _queryWords(vocabulary):
+    vocabulary = sorted(vocabulary)
+    rng = random.Random(0)
+    return [rng.choice(vocabulary) for i in range(NUM_QUERIES)]
+
+#(case name, setup function, what the case's rate is measured in)
+#cases that work through the corpus report tokens per second, query cases report queries per second,
+#and cases that do a fixed amount of work report neither
+CASES = [
+    ("sen_splitter", _senSplitter, "tokens"),
+    ("countCorpus", _countCorpus, "tokens"),
+    ("makeBigramFreqList", _makeBigramFreqList, "tokens"),
+    ("getBigramProbTable", _getBigramProbTable, "tokens"),
+    ("getLikelyNextWord", _getLikelyNextWord, "queries"),
+    ("compileModel", _compileModel, "tokens"),
+    ("loadModel", _loadModel, None),
+    ("getBigramChances", _getBigramChances, "queries"),
+    ("predictNextWords", _predictNextWords, "queries"),
+    ("printLikelySen", _printLikelySen, None),
+]
+
+
+#Running ---------------------------------------------------------------------------------------------------------
+
+#Runs one case in this process and puts its result on a queue. Runs in a child process.
+def _runCase(setup, corpusFilename, results, profile):
+    try:
+        #keep the printing functions quiet
+        sys.stdout = open(os.devnull, "w")
+        run = setup(corpusFilename)
+        stages = None
+        if profile:
+            stages = profiling.start()
+        start = time.time()
+        run()
+        seconds = time.time() - start
+        if profile:
+            stages = profiling.stop().asDict()
+        results.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, stages, None))
+    except MemoryError:
+        results.put((None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, None, "out of memory"))
+    except Exception, error:
+        results.put((None, None, None, repr(error)))
+
+#Runs one case in its own process.
+# @profile  Whether to record the time of each build and query stage too (see profiling)
+#@return    Returns (seconds, peak RSS in kilobytes, stages, error), where stages is None unless
+#           profiled, and error is None if the case worked. A process that dies without a result (killed
+#           for running out of memory, say) gets "exit code N" as its error.
+def runCase(setup, corpusFilename, profile=False):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_runCase, args=(setup, corpusFilename, results, profile))
+    process.start()
+    try:
+        while process.is_alive():
+            try:
+                return results.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                pass
+
+        #the result may have been put just before the process exited
+        try:
+            return results.get(timeout=POLL_INTERVAL)
+        except Queue.Empty:
+            process.join()
+            return None, None, None, "exit code " + str(process.exitcode)
+    finally:
+        process.join()
+
+#Runs every case on a synthetic corpus of every size.
+# @sizes        Corpus sizes in tokens
+# @caseNames    Names of the cases to run; all of them if None
+# @corpusDir    Where the synthetic corpora are kept between runs
+# @profile      Whether to add the time of each build and query stage to every result
+#@return    Returns the results, ready to be written as JSON
+def runBenchmarks(sizes, caseNames=None, corpusDir=None, vocabSize=10000, senLength=12, exponent=1.0, seed=0,
+                  profile=False):
+    if corpusDir is None:
+        corpusDir = os.path.join(tempfile.gettempdir(), "bigrammer-bench")
+    if not os.path.isdir(corpusDir):
+        os.makedirs(corpusDir)
+
+    results = []
+    for numTokens in sizes:
+        corpusFilename = getZipfCorpus(corpusDir, numTokens, vocabSize, senLength, exponent, seed)
+        for name, setup, rateUnit in CASES:
+            if caseNames is not None and name not in caseNames:
+                continue
+
+            seconds, peakRss, stages, error = runCase(setup, corpusFilename, profile)
+            result = {"case": name, "tokens": numTokens, "seconds": seconds, "peakRssKb": peakRss}
+            if stages is not None:
+                result["stages"] = stages
+            if error is not None:
+                result["error"] = error
+            elif rateUnit == "tokens":
+                result["tokensPerSec"] = numTokens / seconds if seconds > 0 else None
+            elif rateUnit == "queries":
+                result["queriesPerSec"] = NUM_QUERIES / seconds if seconds > 0 else None
+            results.append(result)
+            print _formatResult(result)
+
+        for leftover in (corpusFilename + bigrammer.MODEL_EXTENSION, corpusFilename + ".bench" + bigrammer.MODEL_EXTENSION):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "vocabSize": vocabSize,
+        "senLength": senLength,
+        "exponent": exponent,
+        "seed": seed,
+        "results": results,
+    }
+
+def _formatResult(result):
+    if "error" in result:
+        return "%-20s %12d  %s" % (result["case"], result["tokens"], result["error"])
+    return "%-20s %12d %10.3fs %10d KB" % (result["case"], result["tokens"], result["seconds"], result["peakRssKb"])
+
+
+#Comparing -------------------------------------------------------------------------------------------------------
+
+#Compares results against a baseline.
+# @threshold    How much larger a case's time or peak RSS may be, as a fraction of the baseline
+#@return    Returns a list of messages, one per regression
+def compareResults(results, baseline, threshold=DEFAULT_THRESHOLD):
+    baselineResults = dict(((result["case"], result["tokens"]), result) for result in baseline["results"])
+
+    regressions = []
+    for result in results["results"]:
+        old = baselineResults.get((result["case"], result["tokens"]))
+        if old is None:
+            continue
+        name = "%s at %d tokens" % (result["case"], result["tokens"])
+        if "error" in result and "error" not in old:
+            regressions.append(name + " failed: " + result["error"])
+            continue
+        for field, unit in (("seconds", "s"), ("peakRssKb", " KB")):
+            if result.get(field) is None or not old.get(field):
+                continue
+            if result[field] > old[field] * (1 + threshold):
+                regressions.append("%s: %s went from %g%s to %g%s (+%d%%)" % (name, field, old[field], unit, result[field],
+                                                                              unit, 100 * (result[field] / float(old[field]) - 1)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark bigrammer on synthetic Zipf corpora.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma separated corpus sizes in tokens (default %(default)s)")
+    parser.add_argument("--cases", help="comma separated cases to run (default all): " + ", ".join(name for name, setup, rateUnit in CASES))
+    parser.add_argument("--vocab-size", type=int, default=10000, help="distinct words in the corpora (default %(default)s)")
+    parser.add_argument("--sen-length", type=int, default=12, help="average words per sentence (default %(default)s)")
+    parser.add_argument("--exponent", type=float, default=1.0, help="Zipf exponent (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default %(default)s)")
+    parser.add_argument("--corpus-dir", help="where to keep the generated corpora (default a temp folder)")
+    parser.add_argument("--output", default="bench_results.json", help="results file to write (default %(default)s)")
+    parser.add_argument("--compare", help="baseline results file to check for regressions against")
+    parser.add_argument("--profile", action="store_true",
+                        help="record the time, items and peak memory of each build and query stage in the results")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown that counts as a regression, as a fraction (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    #read the baseline first, in case the results are about to be written over it
+    baseline = None
+    if args.compare:
+        baselineFile = open(args.compare, "r")
+        try:
+            baseline = json.load(baselineFile)
+        finally:
+            baselineFile.close()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    caseNames = args.cases.split(",") if args.cases else None
+    results = runBenchmarks(sizes, caseNames, args.corpus_dir, args.vocab_size, args.sen_length, args.exponent, args.seed,
+                            args.profile)
+
+    resultsFile = open(args.output, "w")
+    try:
+        json.dump(results, resultsFile, indent=2, sort_keys=True)
+    finally:
+        resultsFile.close()
+
+    if baseline is not None:
+        regressions = compareResults(results, baseline, args.threshold)
+        for regression in regressions:
+            print "REGRESSION: " + regression
+        if len(regressions) > 0:
+            return 1
+        print "No regressions against '" + args.compare + "'."
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,24 @@
 import sensplit
-import copy
+import modelfile
+import counts
+import smoothing
+import generate
+import profiling
+import sketch
+import external
+import scoring
+import ngrams
+import array
+import bisect
+import collections
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import weakref
 
 # Bigrammer corpus analyzing program
 # by Logan Mitchell, Lindsay McNamara, and Colleen Darling (2011)
@@ -8,121 +27,179 @@ import copy
 # in small to medium sized corpora. It can also pull various statistics about the
 # corpora, such as word frequency and likelyhood.
 
+#compiled models are written next to the corpus with this extension added
+MODEL_EXTENSION = ".bgm"
+
+STOPWORDS_FILENAME = "stopwords.txt"
+
+#characters stripped from every token
+PUNCTUATION = ".,:;!?()[]\"'-"
+UNICODE_PUNCTUATION_TABLE = dict((ord(punct), None) for punct in PUNCTUATION)
+
+#(file size and modified time, stop word set, SHA-1 digest of the file) of the stop word file as it was
+#last read by getStopWords; read again whenever the size or modified time changes
+_stopWords = None
+
+#the sentence generator of each model, made the first time sentences are made from it
+_sentenceGenerators = weakref.WeakKeyDictionary()
+
+#the document scorer of each model, made the first time documents are scored against it
+_documentScorers = weakref.WeakKeyDictionary()
+
+#the smallest piece of a corpus worth counting in its own process
+MIN_SHARD_SIZE = 1 << 20
+
+#how much of a file is read at a time when hashing it
+HASH_CHUNK_SIZE = 1 << 20
+
+#how many bytes of models the model registry keeps loaded by default
+MODEL_CACHE_BYTES = 512 << 20
+
+#about how many bytes new bigram counts can take up while a corpus is counted, before they are spilled
+#to temporary files (see external.py). None keeps them all in memory. Corpora whose counts fit in the
+#budget never touch the disk. The final count arrays, and the copies made while writing a compiled
+#model, still take memory in proportion to the number of distinct bigrams.
+COUNT_MEMORY_BUDGET = 256 << 20
+
+#bigrams added to a BigramModel are kept on the side, where queries read them, until there are more than
+#FOLD_BIGRAMS of them or more than 1 / FOLD_FRACTION as many as the model already has; then they are
+#folded into its count arrays all at once
+FOLD_BIGRAMS = 1 << 16
+FOLD_FRACTION = 8
+
 #Main functions --------------------------------------------------------------------------------------------------
 
-#Checks for the probability of a given bigram in a known corpus
+#Checks for the probability of a given bigram in a known corpus, P(word2 | word1). This is getNgramChance
+#with two words, so it gives the same numbers.
 #(note: this assumes the bigram is for two words, not letters/syllables.)
 # @corpusFilename   The filename of the corpus to load. Usually a txt file.
 # @bigramword1      The first word of the bigram to check
 # @bigramword2      The second word of the bigram to check
 def getBigramChance(corpusFilename, bigramWord1, bigramWord2):
+    getNgramChance(corpusFilename, [bigramWord1, bigramWord2])
 
-    bigramFrequencyList = makeBigramFreqList(corpusFilename) #get frequency of each bigram
 
-    #quick check if we should continue - if file is not found, don't move on.
-    if len(bigramFrequencyList) == 0:
-        return
-    
-    tokenFrequencyList = makeWordFreqList(corpusFilename) #track frequency of each token
+#Checks for the probability of the last of some words following the ones before it in a known corpus,
+#P(last word | words before it), using an n-gram model of the same order as there are words. N-grams
+#that never occur back off to shorter ones (see ngrams.py).
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+# @ngramWords       The words of the n-gram, in order
+def getNgramChance(corpusFilename, ngramWords):
+    if len(ngramWords) == 0:
+        raise ValueError("an n-gram needs at least one word")
 
-    #now that we have our lists, we do the statistical analysis part (as long as we have lists):
-    if len(tokenFrequencyList) > 0 and len(bigramFrequencyList) > 0:
+    try:
+        model = getModel(corpusFilename, order=len(ngramWords))
+    except MemoryError:
+        print "Unable to get n-gram chance; corpus size was too large. (Out of memory)"
+        return
 
-        try:
-            #get bigram probability tables
-            bigramProbabilityTable = getBigramProbTable(bigramFrequencyList, tokenFrequencyList)
-        except MemoryError:
-            print "Unable to get bigram chance; corpus size was too large. (Out of memory)"
-            return
+    #quick check if we should continue - if file is not found, don't move on.
+    if model is None or model.vocabSize == 0:
+        return
 
-        #lastly check the user bigram pair.
-        userBigram = bigramWord1.lower() + " " + bigramWord2.lower()
+    with profiling.stage("chance", 1):
+        prob = model.ngramProb([word.lower() for word in ngramWords])
 
-        #once we have the probilities, check if the input bigram exists in the table.    
-        #if it exists, print the probability.
-        if userBigram in bigramProbabilityTable:
-            print "Probability of [" + userBigram + "]: " + str(bigramProbabilityTable[userBigram]*100) + "%"
-        else:
-            print "Probability of [" + userBigram + "]: 0% (Does not occur)"
+    userNgram = " ".join([word.lower() for word in ngramWords])
+    if prob is not None:
+        print "Probability of [" + userNgram + "]: " + str(prob*100) + "%"
+    else:
+        print "Probability of [" + userNgram + "]: 0% (Does not occur)"
 
 
 #Predicts which word is likely to come next, using a given corpus as training data and a word to follow up on.
+#This is predictNextWordInContext with one word.
 # @corpusFilename   The filename of the corpus to load. Usually a txt file.
-# @bigramword1      The first word of the bigram to check
-# @bigramword2      The second word of the bigram to check
 # @predictWord      The word which will be checked for the most likely followup word, based on the corpus.
 def predictNextWord(corpusFilename, predictWord):
+    predictNextWordInContext(corpusFilename, [predictWord])
+
+
+#Predicts which word is likely to come after some words, using an n-gram model one order higher than
+#there are words (see getNgramChance). Nothing is predicted after a word that isn't in the corpus.
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+# @contextWords     The words to follow up on, in order. The last one can't be a stop word.
+def predictNextWordInContext(corpusFilename, contextWords):
+    if len(contextWords) == 0:
+        raise ValueError("a context needs at least one word")
+    predictWord = contextWords[-1]
 
     #display an error if they want to analyze a stop word.
     if isStopWord(predictWord):
         print "Cannot predict word following '" + predictWord + "'; '" + predictWord + "' is removed in corpus processing."
         return
     
-    bigramFrequencyList = makeBigramFreqList(corpusFilename) #get frequency of each bigram
-    tokenFrequencyList = makeWordFreqList(corpusFilename) #track frequency of each token
+    try:
+        model = getModel(corpusFilename, order=len(contextWords) + 1)
+    except MemoryError:
+        print "Unable to predict word; corpus size was too large. (Out of memory)"
+        return
 
-    if len(tokenFrequencyList) > 0 and len(bigramFrequencyList) > 0:
-
-        try:
-            #get bigram probability table
-            bigramProbabilityTable = getBigramProbTable(bigramFrequencyList, tokenFrequencyList)
-        except MemoryError:
-            print "Unable to predict word; corpus size was too large. (Out of memory)"
-            return
+    if model is not None and model.vocabSize > 0:
 
         #get the most likely word and print the details about it
-        probPair = getLikelyNextWord(bigramProbabilityTable, predictWord)
+        with profiling.stage("predict", 1):
+            probPairs = model.topNextWordsAfter([word.lower() for word in contextWords], 1)
             
-        if len(probPair[0]) > 0:
-            print "Next most likely word following '" + predictWord + "' is '" + probPair[0] + "'"
+        if len(probPairs) > 0:
+            print "Next most likely word following '" + " ".join(contextWords) + "' is '" + probPairs[0][0] + "'"
         else:
             #in cases where the word does not appear in the corpus at all...
             print "Unable to predict word based on chosen corpus."
 
 
-#Print a likely sentence (minus function words) given a corpus, based on highest probabilities alone.
-#finds a probable word, then makes a sentence out of it based on what is most likely to come next.
+#Finds the k words most likely to follow a word, using a given corpus as training data. This is
+#predictTopKInContext with one word.
 # @corpusFilename   The filename of the corpus to load. Usually a txt file.
-def printLikelySen(corpusFilename):
+# @predictWord      The word to find followup words for.
+# @k                How many words to return.
+#@return    Returns a list of up to k (word, probability) pairs, most likely first. Empty if the word
+#           is a stop word or doesn't appear in the corpus.
+def predictTopK(corpusFilename, predictWord, k):
+    return predictTopKInContext(corpusFilename, [predictWord], k)
 
-    bigramFrequencyList = makeBigramFreqList(corpusFilename) #get frequency of each bigram
-    tokenFrequencyList = makeWordFreqList(corpusFilename) #track frequency of each token
 
-    if len(tokenFrequencyList) > 0 and len(bigramFrequencyList) > 0:
-        
-        #get probability tables
-        try:
-            wordProbabilityTable = getWordProbTable(tokenFrequencyList)
-            bigramProbabilityTable = getBigramProbTable(bigramFrequencyList, tokenFrequencyList)
-        except MemoryError:
-            print "Unable to form sentence; corpus size was too large. (Out of memory)"
-            return
+#Finds the k words most likely to follow some words, with the conditional probabilities of getNgramChance.
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+# @contextWords     The words to find followup words for, in order.
+# @k                How many words to return.
+#@return    Returns a list of up to k (word, probability) pairs, most likely first. Empty if the last
+#           word is a stop word or doesn't appear in the corpus.
+def predictTopKInContext(corpusFilename, contextWords, k):
+    if len(contextWords) == 0:
+        raise ValueError("a context needs at least one word")
+
+    if isStopWord(contextWords[-1]):
+        return []
 
-        #find largest probability for a single word
-        likelyWord = ''
-        likelyProb = 0
-        for word in wordProbabilityTable.keys():
-            prob = wordProbabilityTable[word]
-            if prob > likelyProb:
-                likelyProb = prob
-                likelyWord = word
+    try:
+        model = getModel(corpusFilename, order=len(contextWords) + 1)
+    except MemoryError:
+        print "Unable to predict words; corpus size was too large. (Out of memory)"
+        return []
+
+    if model is None:
+        return []
 
-        #now that we have the most likely word, make a sentence of 8 or less words using the bigram probabilities...
+    with profiling.stage("topk", 1):
+        return model.topNextWordsAfter([word.lower() for word in contextWords], k)
 
-        senLength = 1
-        sen = likelyWord
-        prevSenWord = likelyWord
-        while senLength < 8:
-            nextWord = getLikelyNextWord(bigramProbabilityTable, prevSenWord)[0]
-            if len(nextWord) == 0:
-                sen += "."
-                break
-            sen +=  " " + nextWord
-            prevSenWord = nextWord
-            senLength += 1
-            if senLength == 8:
-                sen += "."
 
+#Print a likely sentence (minus function words) given a corpus, based on highest probabilities alone.
+#finds a probable word, then makes a sentence out of it based on what is most likely to come next.
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+def printLikelySen(corpusFilename):
+
+    try:
+        model = getModel(corpusFilename)
+    except MemoryError:
+        print "Unable to form sentence; corpus size was too large. (Out of memory)"
+        return
+
+    if model is not None and model.vocabSize > 0:
+        with profiling.stage("sentence", 1):
+            sen = makeLikelySen(model)
         print sen
 
 
@@ -130,109 +207,1088 @@ def printLikelySen(corpusFilename):
 def printFreqList(filename):
 
     try:
-        bigramFrequencyList = makeBigramFreqList(filename)
+        model = getModel(filename)
     except MemoryError:
-            print "Unable to create frequency list; corpus size was too large. (Out of memory)"
-            return
+        print "Unable to create frequency list; corpus size was too large. (Out of memory)"
+        return
 
-    for key in bigramFrequencyList.keys():
-        print "Freq [" + key + "]:" + str(bigramFrequencyList[key])
+    if model is not None:
+        for bigram, freq, prob in model.bigrams():
+            print "Freq [" + bigram + "]:" + str(freq)
 
 #prints the bigram probability table for a corpus
 def printBigramProbTable(filename):
 
     try:
-        bigramFrequencyList = makeBigramFreqList(filename) #get frequency of each bigram
-        tokenFrequencyList = makeWordFreqList(filename) #track frequency of each token
+        model = getModel(filename)
     except MemoryError:
-        print "Unable to create frequency tables; corpus size was too large. (Out of memory)"
+        print "Unable to create bigram probability table; corpus size was too large. (Out of memory)"
         return
 
-    #now that we have our lists, we do the statistical analysis part (as long as we have lists):
-    if len(tokenFrequencyList) > 0 and len(bigramFrequencyList) > 0:
-             
-        #get bigram probability tables
-        try:
-            bigramProbabilityTable = getBigramProbTable(bigramFrequencyList, tokenFrequencyList)
-        except MemoryError:
-            print "Unable to create bigram probability table; corpus size was too large. (Out of memory)"
-            return
+    #as long as we have a table, print it:
+    if model is not None and model.vocabSize > 0:
 
         total = 0
-        for key in bigramProbabilityTable.keys():
-            print "Probability [" + key + "]:" + str(bigramProbabilityTable[key])
-            total += bigramProbabilityTable[key]
+        for bigram, freq, prob in model.bigrams():
+            print "Probability [" + bigram + "]:" + str(prob)
+            total += prob
 
         print "Total: " + str(total)
 
 
-#Helper Functions ----------------------------------------------------------------------------------------------
-
-#Gets the most likely word to follow the predcitWord given the bigramProbabilityTable
-#@return    Returns a list of two elements; the first is the likely next word, and the second is the probability of that word
-def getLikelyNextWord(bigramProbabilityTable, predictWord):
-    
-    returnPair = [] #holds word and predictChance, to be returned.
-
-    predictList = {}
+#Batch queries ---------------------------------------------------------------------------------------------------
+
+#These take a model (or a corpus filename, which is loaded once) and any number of queries, and
+#generate the results as structured data instead of printing them. Results come out one at a time,
+#so a query file of any size can be answered without holding it all in memory.
+
+#Gets the probability of every bigram in a sequence of word pairs.
+# @corpus   A corpus filename, or a model (from loadModel, or a BigramModel)
+# @pairs    (word1, word2) pairs, or "word1 word2" strings
+#generates (word1, word2, probability) for each pair, in order. The probability is None when either
+#word doesn't appear in the corpus. A pair that isn't two words gets (its words joined by spaces, None,
+#None), so the results still line up with the pairs.
+def getBigramChances(corpus, pairs):
+    model = _queryModel(corpus, "Unable to get bigram chances")
+
+    for pair in pairs:
+        if isinstance(pair, basestring):
+            pair = pair.split()
+        if len(pair) != 2:
+            yield " ".join(pair), None, None
+            continue
+        word1, word2 = pair
+
+        prob = None
+        if model is not None:
+            with profiling.stage("chance", 1):
+                prob = model.bigramProb(word1.lower(), word2.lower())
+        yield word1, word2, prob
+
+#Predicts the words likely to follow every word in a sequence.
+# @corpus   A corpus filename, or a model (from loadModel, or a BigramModel)
+# @words    The words to predict followup words for
+# @k        How many words to predict for each word
+#generates (word, predictions) for each word, in order, where predictions is a list of up to k
+#(word, probability) pairs, most likely first. It's empty for stop words and words not in the corpus.
+def predictNextWords(corpus, words, k=1):
+    model = _queryModel(corpus, "Unable to predict words")
+
+    stopWords = getStopWords()
+    for word in words:
+        predictions = []
+        if model is not None and not isStopWord(word, stopWords):
+            with profiling.stage("predict", 1):
+                predictions = model.topNextWords(word.lower(), k)
+        yield word, predictions
+
+#Makes a batch of sentences from one model.
+# @corpus   A corpus filename, or a model (from loadModel, or a BigramModel)
+# @count    How many sentences to make
+# @mode     generate.SAMPLE (the default), generate.GREEDY or generate.BEAM
+#The other arguments are as for generate.SentenceGenerator.generate.
+#@return    Returns a list of sentences, each ending in a period. Empty if the corpus can't be loaded.
+def generateSentences(corpus, count, mode=generate.SAMPLE, length=generate.SENTENCE_LENGTH, start=None,
+                      temperature=1.0, beamWidth=generate.BEAM_WIDTH, seed=None):
+    model = _queryModel(corpus, "Unable to form sentences")
+    if model is None:
+        return []
 
-    #cycle through all bigrams and check for ones that start with the input word
-    for bigram in bigramProbabilityTable.keys():
-        bigramParts = bigram.split()
+    with profiling.stage("sentence", count):
+        return getSentenceGenerator(model).generate(count, mode, length, start, temperature, beamWidth, seed)
+
+#@return    Returns the sentence generator of a model, which keeps its sampling tables for as long as
+#           the model is around
+def getSentenceGenerator(model):
+    generator = _sentenceGenerators.get(model)
+    if generator is None:
+        generator = _sentenceGenerators[model] = generate.SentenceGenerator(model)
+    return generator
+
+#Scores documents against a model: their log probability and perplexity (see scoring.py). Documents
+#are tokenized the same way the corpus was, and scored in batches, so any number can be scored.
+# @corpus       A corpus filename, or a model (from loadModel, or a BigramModel)
+# @documents    Strings of text, each scored on its own
+#generates a scoring.DocumentScore (logProb, tokens, oov, perplexity) for each document, in order.
+#Nothing is generated if the corpus can't be loaded.
+def scoreDocuments(corpus, documents):
+    model = _queryModel(corpus, "Unable to score documents")
+    if model is None:
+        return
 
-        if bigramParts[0] == predictWord.lower():
-            predictList[bigramParts[1]] = bigramProbabilityTable[bigram]
+    stopWords = getStopWords()
+    tokenized = ([tokenize(sen, stopWords) for sen in sensplit.iter_text_sentences(document)] for document in documents)
+    for documentScore in getDocumentScorer(model).score(tokenized):
+        yield documentScore
+
+#@return    Returns the document scorer of a model, which keeps its log probabilities for as long as the
+#           model is around (or until text is added to a BigramModel)
+def getDocumentScorer(model):
+    scorer = _documentScorers.get(model)
+    if scorer is None or scorer.modelVersion != getattr(model, "version", 0):
+        scorer = _documentScorers[model] = scoring.DocumentScorer(model)
+    return scorer
+
+#generates each line of a file as a document, skipping blank lines
+def readDocumentFile(filename):
+    documentFile = open(filename, "r")
+    try:
+        for line in documentFile:
+            if len(line.strip()) > 0:
+                yield line
+    finally:
+        documentFile.close()
+
+#Scores every line of a document file (one document per line) and writes the scores to an open file,
+#as "logProb<tab>tokens<tab>oov<tab>perplexity" lines. Documents with no known words get "-" for perplexity.
+def writeDocumentScores(corpus, documentFilename, outFile):
+    for documentScore in scoreDocuments(corpus, readDocumentFile(documentFilename)):
+        perplexity = "-" if documentScore.perplexity is None else repr(documentScore.perplexity)
+        outFile.write(repr(documentScore.logProb) + "\t" + str(documentScore.tokens) + "\t" +
+                      str(documentScore.oov) + "\t" + perplexity + "\n")
+
+#generates the words of each line of a query file, skipping blank lines
+def readQueryFile(filename):
+    queryFile = open(filename, "r")
+    try:
+        for line in queryFile:
+            words = line.split()
+            if len(words) > 0:
+                yield words
+    finally:
+        queryFile.close()
+
+#Writes the probability of every bigram in a query file (one "word1 word2" pair per line) to an
+#open file, as "word1 word2<tab>probability" lines. Bigrams with a word not in the corpus get "-", and
+#so do lines that aren't two words, which are written back as they are.
+def writeBigramChances(corpus, queryFilename, outFile):
+    for word1, word2, prob in getBigramChances(corpus, readQueryFile(queryFilename)):
+        if word2 is None:
+            outFile.write(word1 + "\t-\n")
+        elif prob is None:
+            outFile.write(word1 + " " + word2 + "\t-\n")
+        else:
+            outFile.write(word1 + " " + word2 + "\t" + repr(prob) + "\n")
+
+#Writes the k words most likely to follow each word of a query file (one word per line) to an
+#open file, as "word<tab>next1 probability1<tab>next2 probability2..." lines.
+def writeNextWords(corpus, queryFilename, outFile, k=1):
+    words = (query[0] for query in readQueryFile(queryFilename))
+    for word, predictions in predictNextWords(corpus, words, k):
+        outFile.write(word)
+        for nextWord, prob in predictions:
+            outFile.write("\t" + nextWord + " " + repr(prob))
+        outFile.write("\n")
+
+#@return    Returns the model to answer a batch of queries with, loading it if given a corpus filename
+def _queryModel(corpus, errorMessage):
+    if not isinstance(corpus, basestring):
+        return corpus
 
-    if len(predictList) > 0:
+    try:
+        model = getModel(corpus)
+    except MemoryError:
+        print errorMessage + "; corpus size was too large. (Out of memory)"
+        return None
+
+    if model is None or model.vocabSize == 0:
+        return None
+    return model
+
+
+#Models ----------------------------------------------------------------------------------------------------------
+
+#An in-memory bigram model that can keep growing. New text is counted on its own and added to the raw
+#counts, and the count of counts is kept up to date as it goes, so adding text costs about as much as
+#counting it. Smoothing and normalization are only redone the next time the model is queried.
+#
+#New bigram counts stay in the counts' pending dictionary, which queries read alongside the arrays, and
+#are only folded into the arrays once there are enough of them (see FOLD_BIGRAMS). The normalizing total
+#is kept from two parts: weighted count of counts over the rows no new text touched (see
+#smoothing.weightedCountOfCounts), summed when the first text is added, and a count histogram of each
+#touched row. So redoing the normalization costs about as much as the text added, not the whole model.
+#Queries work like CompiledModel's (by word, with ties going to the first word alphabetically).
+class BigramModel(object):
+
+    # @corpusCounts     Raw counts to start from (a CorpusCounts). The model starts empty if None.
+    # @smoothingMode    smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING
+    def __init__(self, corpusCounts=None, smoothingMode=smoothing.GOOD_TURING):
+        if corpusCounts is None:
+            corpusCounts = counts.CorpusCounts()
+        corpusCounts.freeze()
+        self.counts = corpusCounts
+        self.smoothingMode = smoothingMode
+
+        #how many distinct bigrams have each count. N0 is worked out from the vocabulary size when needed.
+        self.countStats = smoothing.countOfCounts(corpusCounts.bigramCounts)
+        self.countStats[0] = 0
+        self.numSeenBigrams = corpusCounts.numBigrams()
+
+        self.stale = True
+        self.version = 0 #goes up every time counts are added, so anything cached from the model can tell
+        self.totalWords = None
+        self.sortedWords = None
+
+        #kept from the first add after the counts were last folded; None while every count is in the arrays
+        self.untouchedByCount = None #weighted count of counts of the untouched rows (see refresh)
+        self.untouchedInverse = 0.0
+        self.untouchedRowLengths = 0.0
+        self.foldedWords = 0 #the vocabulary size when the overlay was started
+        self.touchedRows = {} #word id -> {raw count: number of bigrams in its row with that count}
+        self.pendingSuccessors = {} #word id -> ids of the second words of its bigrams in counts.pending
+
+    #Makes a model from the raw counts stored in a compiled model, without reading the corpus again.
+    @staticmethod
+    def fromCompiled(compiledModel):
+        return BigramModel(compiledModel.corpusCounts(), compiledModel.smoothingMode)
+
+    @property
+    def vocabSize(self):
+        return self.counts.numWords()
+
+    #Updating ------------------------------------------------------------------------------------------------
+
+    #adds a string of text to the model
+    def addText(self, text):
+        self.addCounts(countSentences(sensplit.iter_text_sentences(text)))
+
+    #adds the text of a file to the model
+    # @workers  How many processes to count the file with (see countCorpus)
+    def addFile(self, filename, workers=1):
+        self.addCounts(countCorpus(filename, workers))
+
+    #adds already counted text (a CorpusCounts) to the model
+    def addCounts(self, newCounts):
+        newCounts.freeze()
+        with profiling.stage("update", newCounts.numBigrams()):
+            self._addCounts(newCounts)
+
+    def _addCounts(self, newCounts):
+        vocabulary = self.counts.vocabulary
+        countStats = self.countStats
+        if self.untouchedByCount is None:
+            self._startOverlay()
+
+        numOldWords = len(vocabulary)
+        idMap = [vocabulary.intern(word) for word in newCounts.vocabulary]
+        #every word whose count changes is touched before it does
+        for newId in range(len(newCounts.wordCounts)):
+            self._touchRow(idMap[newId])
+
+        #move each bigram from its old count to its new one in the count of counts and its row
+        for newId1, newId2, index in newCounts.bigrams():
+            wordId1 = idMap[newId1]
+            wordId2 = idMap[newId2]
+            oldCount = self.counts.bigramCount(wordId1, wordId2)
+            rowCounts = self.touchedRows[wordId1]
+
+            if oldCount > 0:
+                countStats[oldCount] -= 1
+                rowCounts[oldCount] -= 1
+                if rowCounts[oldCount] == 0:
+                    del rowCounts[oldCount]
+            else:
+                self.numSeenBigrams += 1
+            count = oldCount + newCounts.bigramCounts[index]
+            if count >= len(countStats):
+                countStats.extend([0] * (count + 1 - len(countStats)))
+            countStats[count] += 1
+            rowCounts[count] = rowCounts.get(count, 0) + 1
+            self.pendingSuccessors.setdefault(wordId1, set()).add(wordId2)
+
+        self.counts.merge(newCounts)
+        if self.totalWords is not None:
+            self.totalWords += sum(newCounts.wordCounts)
+        if self.sortedWords is not None:
+            for wordId in range(numOldWords, len(vocabulary)):
+                bisect.insort(self.sortedWords, vocabulary.word(wordId))
+        self.stale = True
+        self.version += 1
+
+    #Starts keeping new counts on the side of the (frozen) count arrays, by summing up every row as it is.
+    def _startOverlay(self):
+        corpusCounts = self.counts
+        corpusCounts.freeze()
+        self.untouchedByCount, self.untouchedInverse, self.untouchedRowLengths = \
+            smoothing.weightedCountOfCounts(corpusCounts.rowStarts, corpusCounts.bigramCounts, corpusCounts.wordCounts)
+        self.foldedWords = corpusCounts.numWords()
+        self.touchedRows = {}
+        self.pendingSuccessors = {}
+
+    #Moves a row from the untouched sums to its own count histogram, the first time its word is counted
+    #again since the overlay was started.
+    def _touchRow(self, wordId):
+        if wordId in self.touchedRows:
+            return
+        rowCounts = {}
+        start, end = self.counts.row(wordId)
+        for index in range(start, end):
+            count = self.counts.bigramCounts[index]
+            rowCounts[count] = rowCounts.get(count, 0) + 1
+
+        #words new since then were never in the sums
+        if wordId < self.foldedWords:
+            weight = 1.0 / self.counts.wordCounts[wordId]
+            for count, numBigrams in rowCounts.iteritems():
+                self.untouchedByCount[count] -= numBigrams * weight
+            self.untouchedInverse -= weight
+            self.untouchedRowLengths -= (end - start) * weight
+        self.touchedRows[wordId] = rowCounts
+
+    #Folds the new counts into the count arrays, so everything can be read from them again.
+    def _fold(self):
+        if self.untouchedByCount is None:
+            return
+        self.counts.freeze()
+        self.untouchedByCount = None
+        self.touchedRows = {}
+        self.pendingSuccessors = {}
+        #the total is worked out from the arrays again
+        self.stale = True
+
+    #Redoes the smoothing and normalization if anything was added since the last time.
+    def refresh(self):
+        if not self.stale:
+            return
 
-        #find largest probability bigram of the ones we found, and note the values for it
+        corpusCounts = self.counts
+        if self.untouchedByCount is not None and \
+                len(corpusCounts.pending) > max(FOLD_BIGRAMS, corpusCounts.numBigrams() // FOLD_FRACTION):
+            self._fold()
+        if self.untouchedByCount is None:
+            corpusCounts.freeze()
+        vocabSize = corpusCounts.numWords()
+
+        with profiling.stage("smooth", len(self.countStats)):
+            bigramStats = list(self.countStats)
+            bigramStats[0] = vocabSize * vocabSize - self.numSeenBigrams
+            self.adjustedCounts = smoothing.adjustedCounts(bigramStats, self.smoothingMode)
+
+        #the probabilities are worked out from the counts as they are looked up; only the totals are kept
+        with profiling.stage("normalize", len(self.touchedRows) if self.untouchedByCount else corpusCounts.numBigrams()):
+            self.wordProbs = counts.WordProbView(corpusCounts)
+            self.bigramProbs = counts.BigramProbView(corpusCounts, adjustedCounts=self.adjustedCounts,
+                                                     unseenCounts=[self.adjustedCounts[0]] * vocabSize)
+            if vocabSize > 0:
+                if self.totalWords is None:
+                    self.totalWords = self.wordProbs.total()
+                self.wordProbs.totalCount = self.totalWords
+                if self.untouchedByCount is None:
+                    self.bigramProbs.total()
+                else:
+                    self.bigramProbs.totalProb = self._overlayTotal()
+
+        if self.sortedWords is None:
+            self.sortedWords = sorted(corpusCounts.vocabulary)
+        self.successorIndex = {} #word id -> ranked successors, filled in as words are queried
+        self.stale = False
+
+    #@return    Returns the total smoothing.bigramProbTotal would work out for the counts as they are
+    #           now, from the untouched sums and the histograms of the touched rows
+    def _overlayTotal(self):
+        adjustedCounts = self.adjustedCounts
+        wordCounts = self.counts.wordCounts
+        vocabSize = self.counts.numWords()
+
+        total = adjustedCounts[0] * (vocabSize * self.untouchedInverse - self.untouchedRowLengths)
+        for count in range(1, len(self.untouchedByCount)):
+            total += adjustedCounts[count] * self.untouchedByCount[count]
+        for wordId, rowCounts in self.touchedRows.iteritems():
+            rowTotal = adjustedCounts[0] * (vocabSize - sum(rowCounts.itervalues()))
+            for count, numBigrams in rowCounts.iteritems():
+                rowTotal += adjustedCounts[count] * numBigrams
+            total += rowTotal / wordCounts[wordId]
+        return total
+
+    #writes the model to an open file in the compiled model format
+    # @corpusInfo   See modelfile.writeModelFile
+    def write(self, modelFile, corpusInfo):
+        self._fold()
+        self.refresh()
+        with profiling.stage("write") as stage:
+            start = modelFile.tell()
+            bigramProbs, unseenProbs = smoothing.bigramProbs(self.counts.rowStarts, self.counts.bigramCounts,
+                                                             self.bigramProbs.unseenCounts, self.counts.wordCounts,
+                                                             self.adjustedCounts)
+            modelfile.writeModelFile(modelFile, corpusInfo, self.counts, self.wordProbArray(), self.adjustedCounts,
+                                     bigramProbs, unseenProbs)
+            stage.items = modelFile.tell() - start
+
+    #Access by id --------------------------------------------------------------------------------------------
+    #Word ids are the counts' ids (first seen order), not sorted like a CompiledModel's.
+
+    def word(self, wordId):
+        return self.counts.vocabulary.word(wordId)
+
+    #@return    Returns the id of a word, or -1 if the word is not in the model
+    def wordId(self, word):
+        return self.counts.vocabulary.wordId(word)
+
+    def unseenProb(self, wordId):
+        self.refresh()
+        return self.bigramProbs.unseenValue(wordId)
+
+    #@return    Returns the probability of every word, by word id
+    def wordProbArray(self):
+        return smoothing.wordProbs(self.counts.wordCounts)
+
+    #@return    Returns (words, rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs) by id, as
+    #           CompiledModel.probArrays does
+    def probArrays(self):
+        self._fold()
+        self.refresh()
+        bigramProbs, unseenProbs = smoothing.bigramProbs(self.counts.rowStarts, self.counts.bigramCounts,
+                                                         self.bigramProbs.unseenCounts, self.counts.wordCounts,
+                                                         self.adjustedCounts)
+        return (list(self.counts.vocabulary), self.counts.rowStarts, self.counts.bigramWords, bigramProbs,
+                unseenProbs, self.wordProbArray())
+
+    #@return    Returns (second word ids, probabilities) of the observed bigrams starting with a word id,
+    #           in order of second word id
+    def successorIds(self, wordId):
+        self.refresh()
+        start, end = self.counts.row(wordId)
+        pendingIds = self.pendingSuccessors.get(wordId)
+        if pendingIds:
+            successorIds = sorted(set(self.counts.bigramWords[start:end]) | pendingIds)
+            return array.array('I', successorIds), array.array('d', [self._pairProb(wordId, wordId2)
+                                                                     for wordId2 in successorIds])
+        return self.counts.bigramWords[start:end], array.array('d', [self.bigramProbs.prob(wordId, index)
+                                                                     for index in range(start, end)])
+
+    #Queries -------------------------------------------------------------------------------------------------
+
+    #generates every word in the model, in sorted order
+    def vocabulary(self):
+        self.refresh()
+        return iter(self.sortedWords)
+
+    def wordCount(self, word):
+        wordId = self.counts.vocabulary.wordId(word)
+        if wordId < 0:
+            return 0
+        return self.counts.wordCount(wordId)
+
+    def wordProb(self, word):
+        self.refresh()
+        wordId = self.counts.vocabulary.wordId(word)
+        if wordId < 0:
+            return 0.0
+        return self.wordProbs.value(wordId)
+
+    #@return    Returns the most likely single word, or '' if the model is empty
+    def likelyWord(self):
+        self.refresh()
         likelyWord = ''
         likelyProb = 0
-        totalPredictChance = 0
-        for word in predictList.keys():
-            prob = predictList[word]
-            totalPredictChance += prob
+        for word in self.sortedWords:
+            prob = self.wordProbs.value(self.counts.vocabulary.wordId(word))
             if prob > likelyProb:
                 likelyProb = prob
                 likelyWord = word
+        return likelyWord
+
+    #@return    Returns the smoothed frequency of a bigram, or None if either word is not in the model
+    def bigramFreq(self, word1, word2):
+        self.refresh()
+        wordId1 = self.counts.vocabulary.wordId(word1)
+        wordId2 = self.counts.vocabulary.wordId(word2)
+        if wordId1 < 0 or wordId2 < 0:
+            return None
+        return self.adjustedCounts[self.counts.bigramCount(wordId1, wordId2)]
+
+    #@return    Returns the probability of a bigram, or None if either word is not in the model
+    def bigramProb(self, word1, word2):
+        self.refresh()
+        wordId1 = self.counts.vocabulary.wordId(word1)
+        wordId2 = self.counts.vocabulary.wordId(word2)
+        if wordId1 < 0 or wordId2 < 0:
+            return None
+        return self._pairProb(wordId1, wordId2)
+
+    #@return    Returns the probability of a pair of word ids, whether or not its count is pending, the
+    #           same way BigramProbView.prob and unseenValue work it out
+    def _pairProb(self, wordId1, wordId2):
+        adjustedCount = self.adjustedCounts[self.counts.bigramCount(wordId1, wordId2)]
+        return float(adjustedCount) / self.counts.wordCounts[wordId1] / self.bigramProbs.total()
+
+    #@return    Returns a (word, probability) pair for the most likely word to follow a word, or None
+    def likelyNextWord(self, word):
+        likelyWords = self.topNextWords(word, 1)
+        if len(likelyWords) == 0:
+            return None
+        return likelyWords[0]
+
+    #@return    Returns a list of up to k (word, probability) pairs for the words most likely to follow
+    #           a word, most likely first. Never seen bigrams are ranked by their smoothed probability.
+    def topNextWords(self, word, k):
+        self.refresh()
+        wordId = self.counts.vocabulary.wordId(word)
+        if wordId < 0:
+            return []
+
+        successors, successorWords = self._successors(wordId)
+        unseen = self.bigramProbs.unseenValue(wordId)
+        unseenWords = (nextWord for nextWord in self.sortedWords if nextWord not in successorWords)
+        unseenWord = next(unseenWords, None)
+        rank = 0
+
+        likelyWords = []
+        while len(likelyWords) < k:
+            nextWord = None
+            nextProb = 0
+            if rank < len(successors):
+                nextWord, nextProb = successors[rank]
+
+            if unseenWord is not None and (unseen > nextProb or (unseen == nextProb and unseenWord < nextWord)):
+                nextWord = unseenWord
+                nextProb = unseen
+                unseenWord = next(unseenWords, None)
+            else:
+                rank += 1
+
+            #stop once nothing is left, or only impossible words are
+            if nextWord is None or nextProb <= 0:
+                break
+            likelyWords.append((nextWord, nextProb))
+
+        return likelyWords
+
+    #@return    Returns the observed successors of a word id as a list of (word, probability) sorted
+    #           most likely first, and the set of those words.
+    def _successors(self, wordId):
+        if wordId not in self.successorIndex:
+            word = self.counts.vocabulary.word
+            start, end = self.counts.row(wordId)
+            bigramWords = self.counts.bigramWords
+            pendingIds = self.pendingSuccessors.get(wordId, ())
+            successors = [(word(bigramWords[index]), self.bigramProbs.prob(wordId, index))
+                          for index in range(start, end) if bigramWords[index] not in pendingIds]
+            successors.extend([(word(wordId2), self._pairProb(wordId, wordId2)) for wordId2 in pendingIds])
+            successors.sort(key=lambda pair: (-pair[1], pair[0]))
+            self.successorIndex[wordId] = (successors, set([pair[0] for pair in successors]))
+        return self.successorIndex[wordId]
+
+    #generates (bigram, smoothed frequency, probability) for every pair of words in the model,
+    #including the ones that never occur, in sorted order.
+    def bigrams(self):
+        self._fold()
+        self.refresh()
+        vocabulary = self.counts.vocabulary
+        for word1 in self.sortedWords:
+            wordId1 = vocabulary.wordId(word1)
+            unseen = self.bigramProbs.unseenValue(wordId1)
+            for word2 in self.sortedWords:
+                index = self.counts.bigramIndex(wordId1, vocabulary.wordId(word2))
+                if index < 0:
+                    yield word1 + " " + word2, self.adjustedCounts[0], unseen
+                else:
+                    yield word1 + " " + word2, self.adjustedCounts[self.counts.bigramCounts[index]], \
+                        self.bigramProbs.prob(wordId1, index)
+
+
+#Compiled models -------------------------------------------------------------------------------------------------
+
+#Builds the model for a corpus and writes it to a compiled model file, so later queries can skip
+#reading, tokenizing and smoothing the corpus. If the model file cannot be written (for example the
+#corpus is in a read-only folder) the model is compiled to a temporary file instead.
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+# @modelFilename    Where to write the compiled model. Defaults to the corpus filename + MODEL_EXTENSION.
+# @smoothingMode    smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING
+# @workers          How many processes to count the corpus with (see countCorpus)
+# @memoryBudget     Bytes the bigram counts can take up while counting (see countCorpus)
+#@return    Returns the loaded CompiledModel, or None if the corpus could not be read.
+def compileModel(corpusFilename, modelFilename=None, smoothingMode=smoothing.GOOD_TURING, workers=1,
+                 memoryBudget=None):
+    if modelFilename is None:
+        modelFilename = corpusFilename + MODEL_EXTENSION
+
+    try:
+        corpusStat = os.stat(corpusFilename)
+    except OSError:
+        print "ERROR: File '" + corpusFilename + "' not found."
+        return None
+
+    #count with the same stop words the model is stamped with, even if the file changes meanwhile
+    stopWords, stopwordsHash = loadStopWords()
+    corpusInfo = {
+        "corpusHash": hashFile(corpusFilename),
+        "stopwordsHash": stopwordsHash,
+        "corpusSize": corpusStat.st_size,
+        "corpusMtime": corpusStat.st_mtime,
+        "smoothingMode": smoothingMode,
+    }
+
+    model = BigramModel(countCorpus(corpusFilename, workers, memoryBudget, stopWords), smoothingMode)
+    return writeCompiledModel(model, corpusInfo, modelFilename)
+
+#Writes a BigramModel to a compiled model file and loads it back. If the model file cannot be
+#written, the model is written to a temporary file instead.
+# @corpusInfo   See modelfile.writeModelFile
+#@return    Returns the loaded CompiledModel
+def writeCompiledModel(model, corpusInfo, modelFilename):
+    #write to a temporary file of its own first, so nobody ever maps a half written model and two
+    #writers can't mix their output
+    try:
+        fd, tempFilename = tempfile.mkstemp(prefix=os.path.basename(modelFilename) + ".", suffix=".tmp",
+                                            dir=os.path.dirname(os.path.abspath(modelFilename)))
+        try:
+            tempModelFile = os.fdopen(fd, "wb")
+            try:
+                model.write(tempModelFile, corpusInfo)
+            finally:
+                tempModelFile.close()
+            try:
+                os.rename(tempFilename, modelFilename)
+            except OSError:
+                #Windows won't rename over an existing file
+                os.remove(modelFilename)
+                os.rename(tempFilename, modelFilename)
+        except:
+            if os.path.exists(tempFilename):
+                os.remove(tempFilename)
+            raise
+        return modelfile.CompiledModel(modelFilename)
+    except (IOError, OSError):
+        tempModelFile = tempfile.TemporaryFile()
+        try:
+            model.write(tempModelFile, corpusInfo)
+            tempModelFile.flush()
+            return modelfile.CompiledModel(tempModelFile)
+        finally:
+            tempModelFile.close()
+
+#Loads the compiled model for a corpus, compiling it first if it is missing or stale.
+#A model is stale if the corpus or the stop word list changed since it was compiled, or it was
+#smoothed differently. The corpus size and modified time are checked first; the corpus is only
+#re-hashed if they differ.
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+# @smoothingMode    smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING
+# @workers          How many processes to count the corpus with, if it has to be compiled
+#@return    Returns a CompiledModel, or None if the corpus could not be read.
+def loadModel(corpusFilename, smoothingMode=smoothing.GOOD_TURING, workers=1):
+    with profiling.stage("load") as stage:
+        model = _loadModel(corpusFilename, smoothingMode, workers)
+        if model is not None:
+            stage.items = model.memorySize()
+    return model
+
+def _loadModel(corpusFilename, smoothingMode, workers):
+    modelFilename = corpusFilename + MODEL_EXTENSION
+
+    try:
+        corpusStat = os.stat(corpusFilename)
+    except OSError:
+        print "ERROR: File '" + corpusFilename + "' not found."
+        return None
+
+    try:
+        model = modelfile.CompiledModel(modelFilename)
+    except (IOError, OSError, ValueError):
+        return compileModel(corpusFilename, modelFilename, smoothingMode, workers)
+
+    if model.smoothingMode == smoothingMode and model.stopwordsHash == loadStopWords()[1] \
+            and model.corpusSize == corpusStat.st_size:
+        if model.corpusMtime == corpusStat.st_mtime or model.corpusHash == hashFile(corpusFilename):
+            return model
+
+    model.close()
+    return compileModel(corpusFilename, modelFilename, smoothingMode, workers)
+
+#@return    Returns the SHA-1 digest of a file's contents, or all zeros if it can't be read.
+def hashFile(filename):
+    digest = hashlib.sha1()
+    try:
+        hashedFile = open(filename, "rb")
+    except IOError:
+        return "\0" * digest.digest_size
+    try:
+        with profiling.stage("hash") as stage:
+            chunk = hashedFile.read(HASH_CHUNK_SIZE)
+            while chunk:
+                digest.update(chunk)
+                stage.items += len(chunk)
+                chunk = hashedFile.read(HASH_CHUNK_SIZE)
+    finally:
+        hashedFile.close()
+    return digest.digest()
+
+
+#N-gram models ---------------------------------------------------------------------------------------------------
+
+#Models of any order are built in memory from the corpus and kept in the model registry; only bigram
+#models are compiled to disk. See ngrams.py for the layout and the backoff.
 
-        returnPair.append(likelyWord)
-        #gives probability of this word out of all the recorded bigrams that have this word in it
-        returnPair.append(int(float(likelyProb)*100))
-        return returnPair
-                
+#Counts a corpus into an n-gram model.
+# @corpusFilename   The filename of the corpus to load. Usually a txt file.
+# @order            The longest n-grams to count
+# @smoothingMode    smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING
+#@return    Returns an ngrams.NgramModel, or None if the corpus could not be read.
+def loadNgramModel(corpusFilename, order, smoothingMode=smoothing.GOOD_TURING):
+    if not os.path.isfile(corpusFilename):
+        print "ERROR: File '" + corpusFilename + "' not found."
+        return None
+
+    with profiling.stage("load") as stage:
+        ngramCounts = ngrams.NgramCounts(order)
+        stopWords = getStopWords()
+        with profiling.stage("count") as countStage:
+            for sen in sensplit.iter_sentences(corpusFilename):
+                tokens = tokenize(sen, stopWords)
+                ngramCounts.addSentence(tokens)
+                countStage.items += len(tokens)
+        model = ngrams.NgramModel(ngramCounts, smoothingMode)
+        stage.items = model.memorySize()
+    return model
+
+
+#Model registry --------------------------------------------------------------------------------------------------
+
+#Keeps the models of recently used corpora loaded, so repeated queries on a corpus cost a lookup
+#instead of a load. A cached model is used for as long as the corpus and stop word files keep the
+#same size and modified time; otherwise it is loaded again (and recompiled if the contents changed).
+#When the models take up more than maxBytes, the least recently used ones are dropped. The most
+#recently used model is always kept, even if it is larger than maxBytes on its own.
+class ModelRegistry(object):
+
+    # @maxBytes     How many bytes of models to keep loaded
+    def __init__(self, maxBytes=MODEL_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict() #(corpus path, ...) -> (file stats, model, size), oldest first
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    #@return    Returns the model of a corpus, loading it if it isn't cached or is out of date, or None
+    #           if the corpus could not be read. An order of None gives the CompiledModel, and a number
+    #           an ngrams.NgramModel of that order (2 included).
+    def get(self, corpusFilename, smoothingMode=smoothing.GOOD_TURING, workers=1, order=None):
+        if order is None:
+            load = lambda: loadModel(corpusFilename, smoothingMode, workers)
+        else:
+            load = lambda: loadNgramModel(corpusFilename, order, smoothingMode)
+        return self._get((os.path.abspath(corpusFilename), smoothingMode, order), corpusFilename, load)
+
+    #@return    Returns the sketch.SketchModel of a corpus, counting it if it isn't cached or is out of
+    #           date, or None if the corpus could not be read. Takes the same arguments as sketchCorpus.
+    def getSketch(self, corpusFilename, width=sketch.SKETCH_WIDTH, depth=sketch.SKETCH_DEPTH, topN=sketch.TOP_N,
+                  maxWords=sketch.MAX_WORDS):
+        load = lambda: loadSketchModel(corpusFilename, width, depth, topN, maxWords)
+        return self._get((os.path.abspath(corpusFilename), "sketch", width, depth, topN, maxWords), corpusFilename, load)
+
+    #@return    Returns the cached model under a key if its corpus and the stop words haven't changed since,
+    #           otherwise the model load() returns (None if it couldn't), which is then cached.
+    def _get(self, key, corpusFilename, load):
+        fileStats = (_fileStat(corpusFilename), _fileStat(STOPWORDS_FILENAME))
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                if entry[0] == fileStats:
+                    self.hits += 1
+                    self.entries[key] = entry
+                    return entry[1]
+                self.totalBytes -= entry[2]
+            self.misses += 1
+
+        model = load()
+        if model is None:
+            return None
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.totalBytes -= old[2]
+            self.entries[key] = (fileStats, model, model.memorySize())
+            self.totalBytes += model.memorySize()
+            self._evict()
+        return model
+
+    #drops the least recently used models until the rest fit in maxBytes
+    def _evict(self):
+        while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.totalBytes -= entry[2]
+            self.evictions += 1
+
+    #changes the byte budget, dropping models if they no longer fit
+    def resize(self, maxBytes):
+        with self.lock:
+            self.maxBytes = maxBytes
+            self._evict()
+
+    #drops every cached model
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.totalBytes = 0
+
+    #@return    Returns a dictionary of the cache counters and how much it holds
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": len(self.entries),
+                "bytes": self.totalBytes,
+                "maxBytes": self.maxBytes,
+            }
+
+#the registry every main function loads models through
+_modelRegistry = ModelRegistry()
+
+#@return    Returns the registry the main functions load their models through
+def getModelRegistry():
+    return _modelRegistry
+
+#Gets the model of a corpus through the model registry. Takes the same arguments as loadModel, and the
+#order of n-gram model to get instead of the compiled bigram model (see ModelRegistry.get).
+def getModel(corpusFilename, smoothingMode=smoothing.GOOD_TURING, workers=1, order=None):
+    return _modelRegistry.get(corpusFilename, smoothingMode, workers, order)
+
+#Gets the sketch of a corpus through the model registry. Takes the same arguments as sketchCorpus.
+def getSketchModel(corpusFilename, width=sketch.SKETCH_WIDTH, depth=sketch.SKETCH_DEPTH, topN=sketch.TOP_N,
+                   maxWords=sketch.MAX_WORDS):
+    return _modelRegistry.getSketch(corpusFilename, width, depth, topN, maxWords)
+
+#@return    Returns the size and modified time of a file, or None if it doesn't exist
+def _fileStat(filename):
+    try:
+        fileStat = os.stat(filename)
+    except OSError:
+        return None
+    return fileStat.st_size, fileStat.st_mtime
+
+
+#Approximate models ----------------------------------------------------------------------------------------------
+
+#For corpora too big to count exactly. A sketch.SketchModel counts in a fixed amount of memory set by
+#its arguments, whatever the size of the corpus. See sketch.py for the error bounds. Like exact models,
+#sketches are cached in the model registry (see getSketchModel), so a corpus is only counted once.
+
+#Checks for the estimated probability of a bigram, like getBigramChance, counting the corpus approximately.
+#The probability is P(word2 | word1), unsmoothed, so it is a little higher than getBigramChance's for
+#bigrams that occur, which give some of their probability to the ones that don't.
+# @corpusFilename   The filename of the corpus to count
+#The other arguments are as for sketchCorpus.
+def getApproxBigramChance(corpusFilename, bigramWord1, bigramWord2, width=sketch.SKETCH_WIDTH,
+                          depth=sketch.SKETCH_DEPTH, topN=sketch.TOP_N, maxWords=sketch.MAX_WORDS):
+    model = getSketchModel(corpusFilename, width, depth, topN, maxWords)
+    if model is None or model.vocabSize == 0:
+        return
+
+    userBigram = bigramWord1.lower() + " " + bigramWord2.lower()
+    with profiling.stage("chance", 1):
+        prob = model.bigramProb(bigramWord1.lower(), bigramWord2.lower())
+        lowest, highest = model.bigramFreqBounds(bigramWord1.lower(), bigramWord2.lower())
+    if prob is None or highest == 0:
+        print "Probability of [" + userBigram + "]: 0% (Does not occur)"
     else:
-        #if we find nothing, return empty strings.
+        confidence = model.errorBounds()["confidence"]
+        print "Probability of [" + userBigram + "]: about " + str(prob*100) + "% (seen " + str(lowest) + " to " + \
+              str(highest) + " times, " + str(confidence*100) + "% confidence)"
+
+#Counts a corpus approximately into a model of fixed size.
+# @corpusFilename   The corpus to count
+# @width            Counters per sketch row. Counts are over by at most about e / width of the total.
+# @depth            Rows per sketch. Counts are within that with probability 1 - e^-depth.
+# @topN             How many successors of each word are kept for predictions
+# @maxWords         How many words have their successors kept
+#@return    Returns a sketch.SketchModel. Query it directly, or pass it to getBigramChances,
+#           predictNextWords or generateSentences (GREEDY or BEAM).
+def sketchCorpus(corpusFilename, width=sketch.SKETCH_WIDTH, depth=sketch.SKETCH_DEPTH, topN=sketch.TOP_N,
+                 maxWords=sketch.MAX_WORDS):
+    model = sketch.SketchModel(width, depth, topN, maxWords)
+    stopWords = getStopWords()
+    with profiling.stage("sketch") as stage:
+        for sen in sensplit.iter_sentences(corpusFilename):
+            tokens = tokenize(sen, stopWords)
+            model.addSentence(tokens)
+            stage.items += len(tokens)
+    return model
+
+#Counts a corpus approximately, like sketchCorpus, unless it doesn't exist.
+#@return    Returns a sketch.SketchModel, or None if the corpus could not be found
+def loadSketchModel(corpusFilename, width=sketch.SKETCH_WIDTH, depth=sketch.SKETCH_DEPTH, topN=sketch.TOP_N,
+                    maxWords=sketch.MAX_WORDS):
+    if not os.path.isfile(corpusFilename):
+        print "ERROR: File '" + corpusFilename + "' not found."
+        return None
+    return sketchCorpus(corpusFilename, width, depth, topN, maxWords)
+
+
+#Helper Functions ----------------------------------------------------------------------------------------------
+
+#A dictionary-like bigram table that only stores the bigrams actually seen in the corpus.
+#Any other pair of known words reads back as the 'unseen' value for its first word, so lookups,
+#'in' checks, len() and iteration all behave as if the full combinatorial table had been filled in,
+#but memory only grows with the number of distinct observed bigrams.
+class BigramTable(object):
+
+    # @vocabulary   The known words (usually the token frequency list). Every pair of these is a valid key.
+    # @observed     BigramFreqView of "word1 word2" -> value for bigrams that occur in the corpus
+    # @unseen       WordFreqView of word1 -> value for bigrams starting with word1 that never occur
+    def __init__(self, vocabulary, observed, unseen):
+        self.vocabulary = vocabulary
+        self.observed = observed
+        self.unseen = unseen
+
+    def __getitem__(self, bigram):
+        if bigram in self.observed:
+            return self.observed[bigram]
+        parts = bigram.split()
+        if len(parts) == 2 and parts[0] in self.vocabulary and parts[1] in self.vocabulary:
+            return self.unseen[parts[0]]
+        raise KeyError(bigram)
+
+    def __contains__(self, bigram):
+        if bigram in self.observed:
+            return True
+        parts = bigram.split()
+        return len(parts) == 2 and parts[0] in self.vocabulary and parts[1] in self.vocabulary
+
+    def __len__(self):
+        return len(self.vocabulary) * len(self.vocabulary)
+
+    def __iter__(self):
+        return self.keys()
+
+    def get(self, bigram, default=None):
+        if bigram in self:
+            return self[bigram]
+        return default
+
+    #generates every "word1 word2" key; this is V^2 keys, so it is never built as a list.
+    def keys(self):
+        for word1 in self.vocabulary:
+            for word2 in self.vocabulary:
+                yield word1 + " " + word2
+
+    def items(self):
+        for bigram in self.keys():
+            yield bigram, self[bigram]
+
+    #@return    Returns a list of (word2, value) for the observed bigrams starting with word1, largest value first.
+    #           Ties are sorted alphabetically.
+    def successors(self, word1):
+        return self.observed.successors(word1)
+
+
+#Makes a likely sentence of 8 or less words from a model, starting from its most likely word and
+#following the most likely next word each time.
+#@return    Returns the sentence, ending in a period
+def makeLikelySen(model):
+    return getSentenceGenerator(model).generate(1, generate.GREEDY)[0]
+
+#Gets the most likely word to follow the predcitWord given the bigramProbabilityTable
+#Never seen bigrams count too, with their smoothed probability. Ties go to the first word alphabetically.
+#@return    Returns a list of two elements; the first is the likely next word, and the second is the probability of that word
+def getLikelyNextWord(bigramProbabilityTable, predictWord):
+    predictWord = predictWord.lower()
+
+    #a plain dictionary holds every bigram it knows about, so just look through them
+    if not isinstance(bigramProbabilityTable, BigramTable):
+        return _getLikelyNextWordInDict(bigramProbabilityTable, predictWord)
+
+    #if the word isn't in the table at all, return empty strings.
+    if predictWord not in bigramProbabilityTable.vocabulary:
+        return ["",""]
+
+    likelyWord = ''
+    likelyProb = 0
+
+    #the successor index is sorted by probability, so the first entry is the best observed bigram
+    successors = bigramProbabilityTable.successors(predictWord)
+    if len(successors) > 0 and successors[0][1] > likelyProb:
+        likelyWord = successors[0][0]
+        likelyProb = successors[0][1]
+
+    #all the never seen bigrams share one probability, so only the first of them alphabetically can win
+    if len(successors) < len(bigramProbabilityTable.vocabulary):
+        unseenProb = bigramProbabilityTable.unseen[predictWord]
+        if unseenProb > 0 and unseenProb >= likelyProb:
+            seenWords = set([pair[0] for pair in successors])
+            unseenWord = min([word for word in bigramProbabilityTable.vocabulary if word not in seenWords])
+            if unseenProb > likelyProb or unseenWord < likelyWord:
+                likelyWord = unseenWord
+                likelyProb = unseenProb
+
+    #gives probability of this word out of all the recorded bigrams that have this word in it
+    return [likelyWord, int(float(likelyProb)*100)]
+
+#getLikelyNextWord for a plain dictionary of "word1 word2" -> probability
+def _getLikelyNextWordInDict(bigramProbabilityTable, predictWord):
+    likelyWord = None
+    likelyProb = 0
+    for bigram, prob in bigramProbabilityTable.items():
+        bigramParts = bigram.split()
+        if bigramParts[0] != predictWord:
+            continue
+        if likelyWord is None or prob > likelyProb or (prob == likelyProb and bigramParts[1] < likelyWord):
+            likelyWord = bigramParts[1]
+            likelyProb = prob
+
+    #if we find nothing, return empty strings.
+    if likelyWord is None:
         return ["",""]
+    return [likelyWord, int(float(likelyProb)*100)]
 
             
-#Makes and returns the bigram probability table (dictionary) given a bigrm frequency list and a token frequency list
+#Makes and returns the bigram probability table given a bigram frequency list and a token frequency list.
+#For a BigramTable from makeBigramFreqList, the returned table is a BigramTable too, so unseen bigrams are
+#not stored. Nothing is copied: the normalizing total is summed once here, and each probability is worked
+#out from the counts when it is looked up. A plain dictionary of "word1 word2" -> frequency gets a plain
+#dictionary back, normalized over the bigrams it holds.
 def getBigramProbTable(bigramFrequencyList, tokenFrequencyList):
     bigramProbabilityTable = {} #holds the final probability table
     
     #check the input lists exist:
     if len(tokenFrequencyList) > 0 and len(bigramFrequencyList) > 0:
-             
-        #copy all the bigrams into a new table that will report their probabilities.
-        #causes memory issues; ideally we would just reuse bigramFrequencyList but no time.
-        bigramProbabilityTable = copy.deepcopy(bigramFrequencyList)
-        
-        #Now calculate the probability of the bigram by using conditional probability
-        #the two words are statistically independant, so the formula that follows describes the bigram probability:
-        #P(word1 + word2) = count(bigram) / count(word1)
-        for bigram in bigramProbabilityTable.keys():
-            #get the two words that make up the bigram
-            parts = bigram.split()
-            #print "Freq [" + bigram + "] = " + str(bigramFrequencyList[bigram]) + "/" + str(tokenFrequencyList[parts[0]])
-            bigramProbabilityTable[bigram] = float(bigramFrequencyList[bigram]) / tokenFrequencyList[parts[0]]
-
-        #lastly, normalize
-        total = 0
-        for key in bigramProbabilityTable.keys():
-            total += bigramProbabilityTable[key]
+        if isinstance(bigramFrequencyList, BigramTable):
+            with profiling.stage("normalize", bigramFrequencyList.observed.counts.numBigrams()):
+                bigramProbabilityTable = _getBigramProbTable(bigramFrequencyList, tokenFrequencyList)
+        else:
+            with profiling.stage("normalize", len(bigramFrequencyList)):
+                bigramProbabilityTable = _getBigramProbDict(bigramFrequencyList, tokenFrequencyList)
+
+    return bigramProbabilityTable
 
-        for key in bigramProbabilityTable.keys():
-            bigramProbabilityTable[key] = bigramProbabilityTable[key]/total
+def _getBigramProbTable(bigramFrequencyList, tokenFrequencyList):
+    observedFrequencies = bigramFrequencyList.observed
+    unseenFrequencies = bigramFrequencyList.unseen.values
+    corpusCounts = observedFrequencies.counts
+
+    #word counts by the bigrams' word ids (the token list may have been counted separately)
+    if getattr(tokenFrequencyList, "counts", None) is corpusCounts:
+        wordCounts = corpusCounts.wordCounts
+    else:
+        wordCounts = [tokenFrequencyList[word] for word in corpusCounts.vocabulary]
+
+    #Now calculate the probability of the bigram by using conditional probability
+    #the two words are statistically independant, so the formula that follows describes the bigram probability:
+    #P(word1 + word2) = count(bigram) / count(word1)
+    #then normalize over every bigram, seen or not.
+    observedProbs = counts.BigramProbView(corpusCounts, observedFrequencies.values, observedFrequencies.adjustedCounts,
+                                          unseenFrequencies, wordCounts)
+    observedProbs.total()
+
+    return BigramTable(counts.WordFreqView(corpusCounts), observedProbs, counts.UnseenProbView(observedProbs))
+
+#the probability table of a plain dictionary of bigram frequencies, worked out the same way
+def _getBigramProbDict(bigramFrequencyList, tokenFrequencyList):
+    bigramProbabilityTable = {}
+    for bigram, freq in bigramFrequencyList.items():
+        bigramProbabilityTable[bigram] = float(freq) / tokenFrequencyList[bigram.split()[0]]
+
+    #lastly, normalize
+    total = 0
+    for prob in bigramProbabilityTable.itervalues():
+        total += prob
+    for bigram in bigramProbabilityTable:
+        bigramProbabilityTable[bigram] = bigramProbabilityTable[bigram] / total
 
     return bigramProbabilityTable
 
@@ -240,9 +1296,8 @@ def getBigramProbTable(bigramFrequencyList, tokenFrequencyList):
 def getNumBigramsOfFreq(bigramFrequencyList, x):
 
     occurances = 0
-    for bigram in bigramFrequencyList.keys():
-        #get how many times this bigram occurs
-        countNum = bigramFrequencyList[bigram]
+    #go through how many times each bigram occurs
+    for countNum in bigramFrequencyList.itervalues():
         if countNum == x:
             occurances += 1
 
@@ -252,139 +1307,226 @@ def getNumBigramsOfFreq(bigramFrequencyList, x):
 #finds the maximum frequency out of all bigrams
 def getMaxBigramFreq(bigramFrequencyList):
     maxFreq = 0
-    for bigram in bigramFrequencyList.keys():
-        #get how many times this bigram occurs
-        countNum = bigramFrequencyList[bigram]
+    #go through how many times each bigram occurs
+    for countNum in bigramFrequencyList.itervalues():
         if countNum > maxFreq:
             maxFreq = countNum
 
     return maxFreq
 
 #returns an array with how many bigrams of each frequency occur
-def queryBigramStats(bigramFrequencyList):
-    statArray = []
-
-    #first check the maximum count that is reached ('C' in Good-Turing discounting)
-    maxFreq = getMaxBigramFreq(bigramFrequencyList)
+# @numUnseen    How many bigrams of frequency 0 exist that are not stored in bigramFrequencyList
+def queryBigramStats(bigramFrequencyList, numUnseen=0):
 
-    #go through 0-maxFreq and get how many of each frequency occurs. +1 due to 0-based index.
-    for i in range(0,maxFreq+1):
-        occurs = getNumBigramsOfFreq(bigramFrequencyList, i)
-        statArray.append(occurs)
+    #raw counts can be read straight from the count arrays
+    if isinstance(bigramFrequencyList, counts.BigramFreqView) and bigramFrequencyList.values is None \
+            and bigramFrequencyList.adjustedCounts is None:
+        rawCounts = bigramFrequencyList.counts.bigramCounts
+    else:
+        rawCounts = bigramFrequencyList.itervalues()
 
+    #count how many of each frequency occurs in a single pass.
     #return array has C as index and value as Nc
-    return statArray
+    return smoothing.countOfCounts(rawCounts, numUnseen)
 
 #Gets the probability table for single words.
+#For a word frequency list from makeWordFreqList, each probability is worked out when it is looked up;
+#only the total count is kept. A plain dictionary of word -> frequency gets a plain dictionary back.
+#@return    Returns a word -> probability table over the same vocabulary as tokenFrequencyList.
 def getWordProbTable(tokenFrequencyList):
-    #maybe do the same for single word probabilities if we need those to calculate bigram probabilities.
-    wordProbabilityTable = copy.deepcopy(tokenFrequencyList)
+    #count / total number of words (non-stop words), for each word
+    if isinstance(tokenFrequencyList, counts.WordFreqView):
+        return counts.WordProbView(tokenFrequencyList.counts, values=tokenFrequencyList.values)
 
     totalWords = 0
-    #get total number of words (non-stop words)
-    for word in tokenFrequencyList.keys():
-        totalWords += tokenFrequencyList[word]
-
-    #Get the probability of each word
-    for word in wordProbabilityTable.keys():
-        wordProbabilityTable[word] = float(tokenFrequencyList[word])/totalWords
-
-    return wordProbabilityTable
+    for freq in tokenFrequencyList.itervalues():
+        totalWords += freq
+    return dict((word, float(freq) / totalWords) for word, freq in tokenFrequencyList.items())
+
+#Loads the stop words from STOPWORDS_FILENAME. The set is kept for as long as the file keeps the same
+#size and modified time, and read again once either changes.
+def getStopWords():
+    return loadStopWords()[0]
+
+#@return    Returns the stop word set and the SHA-1 digest of the file contents it was read from, which
+#           always go together. Compiled models store the digest, so it has to match the words counted with.
+def loadStopWords():
+    global _stopWords
+    fileStat = _fileStat(STOPWORDS_FILENAME)
+    if _stopWords is None or _stopWords[0] != fileStat:
+        wordFile = open(STOPWORDS_FILENAME, "rb")
+        try:
+            contents = wordFile.read()
+        finally:
+            wordFile.close()
+
+        stopWords = set()
+        #read the lines as a text mode file would
+        for stopWord in io.BytesIO(contents.replace(os.linesep, "\n")).readlines():
+            #everything up to the newline is the word
+            stopWords.add(stopWord[:stopWord.find('\n')])
+        _stopWords = (fileStat, stopWords, hashlib.sha1(contents).digest())
+    return _stopWords[1], _stopWords[2]
 
 #checks if a word exists in a text file full of stop words. returns True or False.
-def isStopWord(word):
-    wordFile = open("stopwords.txt")
-    
-    stopWords = wordFile.readlines()
-
-    #check if any of the words in the file equal the input word
-    for stopWord in stopWords:
-        fixedWord = stopWord[:stopWord.find('\n')]
-        #if they do, return true
-        if fixedWord == word:
-            return True
-    
-    #else...
-    return False
+# @stopWords    The stop word set to check. Defaults to getStopWords(), which checks the stop word
+#               file; loops pass it in so that is only done once, as with tokenize.
+def isStopWord(word, stopWords=None):
+    if stopWords is None:
+        stopWords = getStopWords()
+    return word in stopWords
     
 
 #checks if a word has punctuation attached to it, and if so, returns the word stripped of punctuation.    
 def removePunctuation(word):
-    punctuationList = [".",",",":",";","!","?", "(", ")", "[", "]", '"', "'", "-"] #maybe more?
-    updatedWord = word
-
-    #check a piece of punctuation exists in the updatedWord, anywhere
-
-    for punct in punctuationList:
-        #if it does, remove the punctuation, set the new updatedWord, and start the search over
-        #do this until no punctuation can be found in the word anymore
-        while updatedWord.find(punct) >=0:
-            pIndex = updatedWord.find(punct)
-            updatedWord = updatedWord[:pIndex] + updatedWord[pIndex+1:]
-
-    #lastly, return the updatedWord
-    return updatedWord
+    if isinstance(word, unicode):
+        return word.translate(UNICODE_PUNCTUATION_TABLE)
+    return word.translate(None, PUNCTUATION)
+
+#Turns a sentence into the tokens (words) the bigrammer counts: lowercased, stripped of
+#punctuation, with stop words and empty tokens removed.
+# @stopWords    The stop word set to remove. Defaults to getStopWords(); loops pass it in so the stop
+#               word file is only checked once, and every sentence is tokenized with the same words.
+#@return    Returns a list of the tokens in the sentence, in order.
+def tokenize(sen, stopWords=None):
+    if stopWords is None:
+        stopWords = getStopWords()
+    #Make tokens (words) from the sentence by splitting on whitespace. Punctuation is never whitespace,
+    #so stripping it from the whole sentence first gives the same tokens as stripping each one.
+    return [token for token in removePunctuation(sen.lower()).split() if token not in stopWords]
 
 #makes a bigram frequency list for a given corpus
-def makeBigramFreqList(filename):
-    bigramFrequencyList = {} #track freq of each bigram
-    
-    #split the corpus into sentences. (Due to assuming bigrams cannot cross sentence ends.)
-    corpusSentences = sensplit.sen_splitter(filename)
-    
-    #quick check if we should continue - if file is not found, don't move on.
-    if len(corpusSentences) == 0:
-        return []
+#only bigrams that occur are stored; see BigramTable for how the rest are answered.
+# @smoothingMode    smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING
+# @workers          How many processes to count the corpus with (see countCorpus)
+def makeBigramFreqList(filename, smoothingMode=smoothing.GOOD_TURING, workers=1):
 
-    wordFreqList = makeWordFreqList(filename)
-    
-    #make a combinatorial list of all bigram pairs first. (extras smoothed later)
-    for word1 in wordFreqList:
-        for word2 in wordFreqList:
-            bigram = word1 + " " + word2
-            bigramFrequencyList[bigram] = 0
+    #split the corpus into sentences (due to assuming bigrams cannot cross sentence ends) and count them.
+    corpusCounts = countCorpus(filename, workers)
     
-    #for each sentence...
-    for sen in corpusSentences:
-        #Make tokens (words) from the sentence by splitting on whitespace.
-        senTokens = sen.split()
-        
-        tokenPair = [] #keep track of our current bigram pair as we go through the sentence
-        
-        #for each 'word' in the current sentence...
-        for token in senTokens:
-            #ignore any stop words (function words, etc).
-            #stop words will be found in stopwords.txt
-            
-            #first turn the token lowercase for easier comparison!
-            token = token.lower()
-           
-            #remove punctuation if it exists in the current token.
-            token = removePunctuation(token)
-            
-            #if not a stop word...
-            if not isStopWord(token) and len(token.strip()) > 0:
-
-                #add to our current tokenpair
-                tokenPair.append(token)
-                #if our tokenpair is now two words, add the pair to the bigramFreq list by
-                #   combining the two words as the key; ex: "word1 word2" as a key, seperated by space
-                #   Steps: check if pair exists already, if not add pair and set freq to 1 
-                #      Ex.    bigramFrequencyList["word1 word2"] = 1
-                #   If pair exists already, simply increment frequency for that pair by 1.
-                if len(tokenPair) == 2:
-                    pairKey = tokenPair[0] + ' ' + tokenPair[1]
-                    if pairKey in bigramFrequencyList:
-                        bigramFrequencyList[pairKey] += 1
-                    else:
-                        bigramFrequencyList[pairKey] = 1
-
-                #if we put the tokenpair into the bigramFreq list, clear the current pair and start a new pair
-                #   this pair will start with the current token as the first word.
-                tokenPair = []
-                tokenPair.append(token)
+    #quick check if we should continue - if file is not found (or has no words), don't move on.
+    if corpusCounts.numWords() == 0:
+        return []
 
+    wordFreqList = counts.WordFreqView(corpusCounts)
+    bigramFrequencyList = counts.BigramFreqView(corpusCounts)
+
+    #only observed bigrams are stored, so every other pair of words counts towards frequency 0 (N0).
+    numUnseen = len(wordFreqList) * len(wordFreqList) - len(bigramFrequencyList)
+    newBigramFrequencies = getGoodTuringCounts(bigramFrequencyList, numUnseen, smoothingMode)
+
+    return smoothBigramFreqList(bigramFrequencyList, wordFreqList, newBigramFrequencies)
+
+#Counts the tokens and bigrams of a list (or generator) of sentences in a single pass, without any smoothing.
+#Each sentence is tokenized once and both counts are taken from the same tokens.
+# @memoryBudget     If given, new bigram counts are spilled to temporary files whenever they take up more
+#                   than about this many bytes, and merged back when counting is done
+# @stopWords        The stop words to remove (see tokenize). Defaults to getStopWords().
+#@return    Returns a frozen CorpusCounts holding the word counts and the counts of the bigrams that occur.
+def countSentences(corpusSentences, memoryBudget=None, stopWords=None):
+    if stopWords is None:
+        stopWords = getStopWords()
+    if memoryBudget is None:
+        corpusCounts = counts.CorpusCounts()
+    else:
+        corpusCounts = external.SpillingCounts(memoryBudget)
 
+    if profiling.active():
+        _countSentencesProfiled(corpusSentences, corpusCounts, stopWords)
+    else:
+        for sen in corpusSentences:
+            corpusCounts.addSentence(tokenize(sen, stopWords))
+
+    corpusCounts.freeze()
+    return corpusCounts
+
+#Counts sentences the same way as countSentences, timing the splitting, tokenizing and counting
+#of each sentence separately. Only used while profiling, since the timing slows the loop down.
+def _countSentencesProfiled(corpusSentences, corpusCounts, stopWords):
+    splitTime = tokenizeTime = countTime = 0.0
+    numSentences = numTokens = 0
+
+    corpusSentences = iter(corpusSentences)
+    while True:
+        start = time.time()
+        sen = next(corpusSentences, None)
+        splitDone = time.time()
+        splitTime += splitDone - start
+        if sen is None:
+            break
+
+        tokens = tokenize(sen, stopWords)
+        tokenizeDone = time.time()
+        corpusCounts.addSentence(tokens)
+        countTime += time.time() - tokenizeDone
+        tokenizeTime += tokenizeDone - splitDone
+
+        numSentences += 1
+        numTokens += len(tokens)
+
+    profiling.record("split", splitTime, numSentences)
+    profiling.record("tokenize", tokenizeTime, numTokens)
+    profiling.record("count", countTime, numTokens)
+
+#Counts the tokens and bigrams of a corpus file.
+#With more than one worker, the file is split into byte ranges on sentence boundaries and each
+#range is counted in its own process. The partial counts are merged in file order, so the result
+#(word ids included) is exactly what a single pass over the file gives.
+# @filename     The corpus to count
+# @workers      How many processes to count with. 1 counts in this process; None uses every CPU.
+# @memoryBudget Bytes the new bigram counts can take up before they are spilled to disk, shared between
+#               the workers and the merge. Defaults to COUNT_MEMORY_BUDGET.
+# @stopWords    The stop words to remove, in every worker. Defaults to getStopWords().
+#@return    Returns a frozen CorpusCounts
+def countCorpus(filename, workers=1, memoryBudget=None, stopWords=None):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if memoryBudget is None:
+        memoryBudget = COUNT_MEMORY_BUDGET
+    if stopWords is None:
+        stopWords = getStopWords()
+
+    #small files aren't worth starting processes for
+    if workers <= 1 or not os.path.isfile(filename) or os.path.getsize(filename) < MIN_SHARD_SIZE * 2:
+        return countSentences(sensplit.iter_sentences(filename), memoryBudget, stopWords)
+
+    numShards = min(workers, os.path.getsize(filename) // MIN_SHARD_SIZE)
+    shardRanges = sensplit.shard_file(filename, numShards)
+    numWorkers = min(workers, len(shardRanges))
+
+    #every worker and the merge get an equal share of the budget
+    shardBudget = None
+    if memoryBudget is not None:
+        shardBudget = memoryBudget // (numWorkers + 1)
+    shards = [(filename, start, end, shardBudget, stopWords) for start, end in shardRanges]
+
+    if shardBudget is None:
+        corpusCounts = counts.CorpusCounts()
+    else:
+        corpusCounts = external.SpillingCounts(shardBudget)
+    pool = multiprocessing.Pool(numWorkers)
+    try:
+        with profiling.stage("countShards", len(shards)):
+            for shardCounts in pool.imap(_countShard, shards):
+                corpusCounts.merge(shardCounts)
+    finally:
+        pool.close()
+        pool.join()
+
+    corpusCounts.freeze()
+    return corpusCounts
+
+#counts one (filename, start, end, memoryBudget, stopWords) byte range of a corpus; runs in a worker process.
+def _countShard(shard):
+    filename, start, end, memoryBudget, stopWords = shard
+    return countSentences(sensplit.iter_sentences(filename, start=start, end=end), memoryBudget, stopWords)
+
+#Works out the Good Turing adjusted count for every raw bigram frequency.
+# @bigramFrequencyList  Raw counts of the observed bigrams
+# @numUnseen            How many possible bigrams never occur (N0)
+# @smoothingMode        smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING
+#@return    Returns an array with the raw frequency as index and the adjusted frequency as value
+def getGoodTuringCounts(bigramFrequencyList, numUnseen, smoothingMode=smoothing.GOOD_TURING):
     #SMOOTHING TIME
     #use Good Turing discount formula to modify the frequency of the bigram table
     #Formula:
@@ -393,64 +1535,34 @@ def makeBigramFreqList(filename):
     #NOTE: There is an inherent issue with Good Turing smoothing when numBigramsOfFreq(C+1) == 0
     #This becomes almost a non-issue with any regular sized corpus, but this smoothing will ruin
     #the frequencies by setting them to 0 if there are any interm frequency counts that are 0.
-    #Moral: Don't use tiny data sets.
+    #Moral: Don't use tiny data sets. (Or use smoothing.SIMPLE_GOOD_TURING, which doesn't have this problem.)
     #Source: http://www.ee.ucla.edu/~weichu/htkbook/node214_mn.html
 
-    #Now, get some data we'll need for our formula...
-
     #get a list of all frequencies and occurances of those frequencies in the freq. list
-    bigramStats = queryBigramStats(bigramFrequencyList)
-
-    #make a new list to hold the new bigram frequencies we will replace the old ones with
-    newBigramFrequencies = copy.deepcopy(bigramStats)
+    with profiling.stage("smooth") as stage:
+        bigramStats = queryBigramStats(bigramFrequencyList, numUnseen)
+        stage.items = len(bigramStats)
+        return smoothing.adjustedCounts(bigramStats, smoothingMode)
 
-    #for each frequency... (Use -1 due to using c+1 and c being an index)
-    for c in range(0,len(bigramStats)-1):
-        #avoid division by 0 error
-        if bigramStats[c] != 0:
-            #Adjust the counts using the Good Turing Discount formula
-            newBigramFrequencies[c] = float((c+1)*bigramStats[c+1])/bigramStats[c]
-        else:
-            newBigramFrequencies[c] = 0
+#Makes the smoothed bigram frequency table from raw counts and their Good Turing adjusted counts.
+#Nothing is copied: the old frequency is used as the index into the new array to get the updated count
+#whenever a bigram is looked up.
+def smoothBigramFreqList(bigramFrequencyList, wordFreqList, newBigramFrequencies):
+    corpusCounts = wordFreqList.counts
+    smoothedFrequencies = counts.BigramFreqView(corpusCounts, adjustedCounts=newBigramFrequencies)
 
-    #Then replace the old frequency counts with the new frequency counts
-    #The old frequency will be the index into the new array to get the updated count
-    for bigram in bigramFrequencyList.keys():
-        oldBigramFreq = bigramFrequencyList[bigram]
-        bigramFrequencyList[bigram] = newBigramFrequencies[oldBigramFreq]
+    #every bigram that never occurred gets the adjusted count for frequency 0
+    unseenFrequencies = counts.WordFreqView(corpusCounts, values=[newBigramFrequencies[0]] * corpusCounts.numWords())
 
-    return bigramFrequencyList
+    return BigramTable(wordFreqList, smoothedFrequencies, unseenFrequencies)
 
 #makes a monogram (word) frequency list for a given corpus
 def makeWordFreqList(filename):
-    tokenFrequencyList = {} #track freq of each token
+    corpusCounts = counts.CorpusCounts() #track freq of each token
+    stopWords = getStopWords()
     
-    #split the corpus into sentences.
-    corpusSentences = sensplit.sen_splitter(filename)
-    
-    #for each sentence...
-    for sen in corpusSentences:
-        #Make tokens (words) from the sentence by splitting on whitespace.
-        senTokens = sen.split()
-
-        #for each 'word' in the current sentence...
-        for token in senTokens:
-            #ignore any stop words (function words, etc).
-            #stop words will be found in stopwords.txt
-            
-            #first turn the token lowercase for easier comparison!
-            token = token.lower()
-           
-            #remove punctuation if it exists in the current token.
-            token = removePunctuation(token)
-            
-            #if not a stop word...
-            if not isStopWord(token) and len(token.strip()) > 0:
-
-                #add to the list
-                if token in tokenFrequencyList:
-                    tokenFrequencyList[token] += 1
-                else:
-                    tokenFrequencyList[token] = 1
+    #for each sentence... (read one at a time, so the corpus is never held in memory)
+    for sen in sensplit.iter_sentences(filename):
+        corpusCounts.addWords(tokenize(sen, stopWords))
 
-    return tokenFrequencyList
+    return counts.WordFreqView(corpusCounts)
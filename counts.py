@@ -0,0 +1,475 @@
+import array
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import profiling
+import smoothing
+
+# Integer id vocabulary and array-backed corpus counts
+#
+# Every token is interned to a dense integer id the first time it is seen. Word counts live in an
+# array indexed by word id, and bigram counts in a CSR (compressed row) layout: the bigrams that
+# start with word id i are at positions rowStarts[i] to rowStarts[i+1] of bigramWords (the id of
+# the second word) and bigramCounts, sorted by the second word id.
+#
+# While counting, new bigrams go into a dictionary keyed by the packed id pair (id1 << 32 | id2),
+# so no "word1 word2" strings are ever made. freeze() merges them into the arrays; with NumPy, the
+# existing arrays are copied over once with the new bigrams inserted, instead of rebuilt one by one.
+#
+# The views at the bottom give the old dictionary interface ("word" and "word1 word2" keys) on top
+# of the arrays, without copying them. The probability views work each probability out when it is
+# looked up, from the counts and a normalizing total that is only summed once.
+
+#bits the first word id is shifted by in a packed bigram key
+PAIR_SHIFT = 32
+PAIR_MASK = (1 << PAIR_SHIFT) - 1
+
+
+#Maps each word to a dense integer id, in the order the words were first seen.
+class Vocabulary(object):
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+
+    #@return    Returns the id of a word, adding it to the vocabulary if it's new.
+    def intern(self, word):
+        wordId = self.ids.get(word)
+        if wordId is None:
+            wordId = len(self.words)
+            self.ids[word] = wordId
+            self.words.append(word)
+        return wordId
+
+    #@return    Returns the id of a word, or -1 if the word is not in the vocabulary.
+    def wordId(self, word):
+        return self.ids.get(word, -1)
+
+    def word(self, wordId):
+        return self.words[wordId]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def __iter__(self):
+        return iter(self.words)
+
+
+#Raw word and bigram counts of a corpus, stored by word id.
+class CorpusCounts(object):
+
+    def __init__(self):
+        self.vocabulary = Vocabulary()
+        self.wordCounts = array.array('L')
+        self.rowStarts = array.array('L', [0])
+        self.bigramWords = array.array('I')
+        self.bigramCounts = array.array('I')
+        self.pending = {} #packed bigram key -> count, for bigrams not merged into the arrays yet
+
+    #Counts the words of one sentence, without counting its bigrams.
+    def addWords(self, tokens):
+        intern = self.vocabulary.intern
+        wordCounts = self.wordCounts
+        for token in tokens:
+            wordId = intern(token)
+            if wordId == len(wordCounts):
+                wordCounts.append(0)
+            wordCounts[wordId] += 1
+
+    #Counts the words and bigrams of one sentence. Bigrams never cross sentence ends.
+    def addSentence(self, tokens):
+        intern = self.vocabulary.intern
+        wordCounts = self.wordCounts
+        pending = self.pending
+        prevId = -1
+        for token in tokens:
+            wordId = intern(token)
+            if wordId == len(wordCounts):
+                wordCounts.append(0)
+            wordCounts[wordId] += 1
+            if prevId >= 0:
+                pairKey = (prevId << PAIR_SHIFT) | wordId
+                pending[pairKey] = pending.get(pairKey, 0) + 1
+            prevId = wordId
+
+    #Adds all of another CorpusCounts' counts to these. Words new to this vocabulary get ids in the
+    #order the other vocabulary has them, so merging the counts of consecutive parts of a corpus in
+    #order gives the same ids as counting the whole corpus at once.
+    def merge(self, other):
+        pending = self.pending
+        for pairKey, count in self._mergeWords(other):
+            pending[pairKey] = pending.get(pairKey, 0) + count
+
+    #Adds another CorpusCounts' words and word counts to these.
+    #@return    Returns a generator of (packed key, count) for the other counts' bigrams, in these ids
+    def _mergeWords(self, other):
+        intern = self.vocabulary.intern
+        idMap = [intern(word) for word in other.vocabulary]
+        if len(self.wordCounts) < len(self.vocabulary):
+            self.wordCounts.extend([0] * (len(self.vocabulary) - len(self.wordCounts)))
+        for otherId in range(len(other.wordCounts)):
+            self.wordCounts[idMap[otherId]] += other.wordCounts[otherId]
+        return _mappedBigrams(other, idMap)
+
+    #Merges the pending bigram counts into the arrays. Queries by index only see merged counts.
+    def freeze(self):
+        numRows = len(self.vocabulary)
+        if len(self.pending) == 0 and len(self.rowStarts) == numRows + 1:
+            return
+
+        with profiling.stage("freeze") as stage:
+            if numpy is not None:
+                self._mergePendingNumpy()
+            else:
+                self._mergePending()
+            stage.items = self.numBigrams()
+
+    def _mergePendingNumpy(self):
+        numRows = len(self.vocabulary)
+        pending = self.pending
+        pendingKeys = numpy.fromiter(pending.iterkeys(), numpy.uint64, len(pending))
+        pendingCounts = numpy.fromiter(pending.itervalues(), numpy.uint64, len(pending))
+        order = numpy.argsort(pendingKeys)
+        pendingKeys = pendingKeys[order]
+        pendingCounts = pendingCounts[order]
+
+        #the arrays as sorted packed keys, with rows past the end of rowStarts empty
+        rowLengths = numpy.diff(smoothing.asNumpy(self.rowStarts).astype(numpy.int64))
+        rows = numpy.repeat(numpy.arange(len(rowLengths), dtype=numpy.uint64), rowLengths)
+        keys = (rows << numpy.uint64(PAIR_SHIFT)) | smoothing.asNumpy(self.bigramWords).astype(numpy.uint64)
+        bigramCounts = smoothing.asNumpy(self.bigramCounts).astype(numpy.uint64)
+
+        #add the counts of bigrams already in the arrays, and insert the rest where they sort
+        positions = numpy.searchsorted(keys, pendingKeys)
+        found = positions < len(keys)
+        found[found] = keys[positions[found]] == pendingKeys[found]
+        bigramCounts[positions[found]] += pendingCounts[found]
+        keys = numpy.insert(keys, positions[~found], pendingKeys[~found])
+        bigramCounts = numpy.insert(bigramCounts, positions[~found], pendingCounts[~found])
+
+        rows = keys >> numpy.uint64(PAIR_SHIFT)
+        rowStarts = numpy.searchsorted(rows, numpy.arange(numRows + 1, dtype=numpy.uint64))
+        self.rowStarts = _toArray('L', rowStarts)
+        self.bigramWords = _toArray('I', keys & numpy.uint64(PAIR_MASK))
+        self.bigramCounts = _toArray('I', bigramCounts)
+        self.pending = {}
+
+    def _mergePending(self):
+        numRows = len(self.vocabulary)
+        pendingKeys = sorted(self.pending)
+        pending = self.pending
+        oldWords = self.bigramWords
+        oldCounts = self.bigramCounts
+
+        rowStarts = array.array('L', [0])
+        bigramWords = array.array('I')
+        bigramCounts = array.array('I')
+
+        p = 0
+        for wordId1 in range(numRows):
+            index, end = self.row(wordId1)
+            #merge this row of the arrays with this row of the (sorted) pending keys
+            while index < end or (p < len(pendingKeys) and pendingKeys[p] >> PAIR_SHIFT == wordId1):
+                pendingId = -1
+                if p < len(pendingKeys) and pendingKeys[p] >> PAIR_SHIFT == wordId1:
+                    pendingId = pendingKeys[p] & PAIR_MASK
+                if index < end and (pendingId < 0 or oldWords[index] <= pendingId):
+                    wordId2 = oldWords[index]
+                    count = oldCounts[index]
+                    index += 1
+                    if wordId2 == pendingId:
+                        count += pending[pendingKeys[p]]
+                        p += 1
+                else:
+                    wordId2 = pendingId
+                    count = pending[pendingKeys[p]]
+                    p += 1
+                bigramWords.append(wordId2)
+                bigramCounts.append(count)
+            rowStarts.append(len(bigramWords))
+
+        self.rowStarts = rowStarts
+        self.bigramWords = bigramWords
+        self.bigramCounts = bigramCounts
+        self.pending = {}
+
+    #@return    Returns the (start, end) positions of the merged bigrams starting with a word id
+    def row(self, wordId1):
+        if wordId1 + 1 >= len(self.rowStarts):
+            return len(self.bigramWords), len(self.bigramWords)
+        return self.rowStarts[wordId1], self.rowStarts[wordId1 + 1]
+
+    #@return    Returns the position of the merged bigram (wordId1, wordId2), or -1 if there is none
+    def bigramIndex(self, wordId1, wordId2):
+        start, end = self.row(wordId1)
+        index = bisect.bisect_left(self.bigramWords, wordId2, start, end)
+        if index < end and self.bigramWords[index] == wordId2:
+            return index
+        return -1
+
+    def wordCount(self, wordId):
+        return self.wordCounts[wordId]
+
+    #@return    Returns the raw count of the bigram (wordId1, wordId2), merged or not
+    def bigramCount(self, wordId1, wordId2):
+        count = self.pending.get((wordId1 << PAIR_SHIFT) | wordId2, 0)
+        index = self.bigramIndex(wordId1, wordId2)
+        if index >= 0:
+            count += self.bigramCounts[index]
+        return count
+
+    def numWords(self):
+        return len(self.vocabulary)
+
+    #@return    Returns the number of distinct merged bigrams
+    def numBigrams(self):
+        return len(self.bigramWords)
+
+    #generates (wordId1, wordId2, position) for every merged bigram, in row order
+    def bigrams(self):
+        bigramWords = self.bigramWords
+        for wordId1 in range(len(self.rowStarts) - 1):
+            start, end = self.row(wordId1)
+            for index in range(start, end):
+                yield wordId1, bigramWords[index], index
+
+
+#turns a NumPy array into an array.array of a type code
+def _toArray(typecode, values):
+    result = array.array(typecode)
+    result.fromstring(numpy.ascontiguousarray(values, dtype=numpy.dtype(typecode)).tostring())
+    return result
+
+#generates (packed key, count) for every bigram of a CorpusCounts, merged or not, with its word ids
+#mapped through idMap
+def _mappedBigrams(corpusCounts, idMap):
+    for wordId1, wordId2, index in corpusCounts.bigrams():
+        yield (idMap[wordId1] << PAIR_SHIFT) | idMap[wordId2], corpusCounts.bigramCounts[index]
+    for otherKey, count in corpusCounts.pending.iteritems():
+        yield (idMap[otherKey >> PAIR_SHIFT] << PAIR_SHIFT) | idMap[otherKey & PAIR_MASK], count
+
+
+#Dictionary views ------------------------------------------------------------------------------------------------
+
+#A read-only dictionary of word -> value over a CorpusCounts. The values come from a sequence
+#indexed by word id; by default, the word counts.
+class WordFreqView(object):
+
+    # @counts   The CorpusCounts the words come from
+    # @values   Sequence of values by word id. Defaults to counts.wordCounts.
+    def __init__(self, counts, values=None):
+        self.counts = counts
+        if values is None:
+            values = counts.wordCounts
+        self.values = values
+
+    #@return    Returns the value of a word by id. Counts come out of unsigned arrays as longs; they are
+    #           given back as plain ints, as the old dictionaries had them.
+    def value(self, wordId):
+        if self.values is self.counts.wordCounts:
+            return int(self.values[wordId])
+        return self.values[wordId]
+
+    def __getitem__(self, word):
+        wordId = self.counts.vocabulary.wordId(word)
+        if wordId < 0:
+            raise KeyError(word)
+        return self.value(wordId)
+
+    def __contains__(self, word):
+        return word in self.counts.vocabulary
+
+    def __len__(self):
+        return len(self.counts.vocabulary)
+
+    def __iter__(self):
+        return iter(self.counts.vocabulary)
+
+    def get(self, word, default=None):
+        wordId = self.counts.vocabulary.wordId(word)
+        if wordId < 0:
+            return default
+        return self.value(wordId)
+
+    def keys(self):
+        return list(self.counts.vocabulary)
+
+    def itervalues(self):
+        for wordId in range(len(self.counts.vocabulary)):
+            yield self.value(wordId)
+
+    def items(self):
+        for wordId in range(len(self.counts.vocabulary)):
+            yield self.counts.vocabulary.word(wordId), self.value(wordId)
+
+
+#A read-only dictionary of "word1 word2" -> value over the merged bigrams of a CorpusCounts.
+#By default the values are the raw counts. Bigrams that never occur are not in the view.
+class BigramFreqView(object):
+
+    # @counts           The CorpusCounts the bigrams come from (frozen)
+    # @values           Sequence of values by bigram position, replacing the raw counts
+    # @adjustedCounts   Sequence of values by raw count (ex: Good Turing adjusted counts)
+    def __init__(self, counts, values=None, adjustedCounts=None):
+        self.counts = counts
+        self.values = values
+        self.adjustedCounts = adjustedCounts
+
+    #@return    Returns the value of the bigram at a position
+    def value(self, index):
+        if self.values is not None:
+            return self.values[index]
+        if self.adjustedCounts is not None:
+            return self.adjustedCounts[self.counts.bigramCounts[index]]
+        return int(self.counts.bigramCounts[index])
+
+    def _index(self, bigram):
+        parts = bigram.split()
+        if len(parts) != 2:
+            return -1
+        wordId1 = self.counts.vocabulary.wordId(parts[0])
+        wordId2 = self.counts.vocabulary.wordId(parts[1])
+        if wordId1 < 0 or wordId2 < 0:
+            return -1
+        return self.counts.bigramIndex(wordId1, wordId2)
+
+    def __getitem__(self, bigram):
+        index = self._index(bigram)
+        if index < 0:
+            raise KeyError(bigram)
+        return self.value(index)
+
+    def __contains__(self, bigram):
+        return self._index(bigram) >= 0
+
+    def __len__(self):
+        return self.counts.numBigrams()
+
+    def __iter__(self):
+        return self.keys()
+
+    def get(self, bigram, default=None):
+        index = self._index(bigram)
+        if index < 0:
+            return default
+        return self.value(index)
+
+    #generates every "word1 word2" key, in row order
+    def keys(self):
+        word = self.counts.vocabulary.word
+        for wordId1, wordId2, index in self.counts.bigrams():
+            yield word(wordId1) + " " + word(wordId2)
+
+    def itervalues(self):
+        for index in range(self.counts.numBigrams()):
+            yield self.value(index)
+
+    def items(self):
+        word = self.counts.vocabulary.word
+        for wordId1, wordId2, index in self.counts.bigrams():
+            yield word(wordId1) + " " + word(wordId2), self.value(index)
+
+    #@return    Returns a list of (word2, value) for the bigrams starting with word1, largest value first.
+    #           Ties are sorted alphabetically.
+    def successors(self, word1):
+        wordId1 = self.counts.vocabulary.wordId(word1)
+        if wordId1 < 0:
+            return []
+        start, end = self.counts.row(wordId1)
+        word = self.counts.vocabulary.word
+        successors = [(word(self.counts.bigramWords[index]), self.value(index)) for index in range(start, end)]
+        successors.sort(key=lambda pair: (-pair[1], pair[0]))
+        return successors
+
+
+#Probability views -----------------------------------------------------------------------------------------------
+
+#A read-only dictionary of word -> probability (count / total count) over a CorpusCounts.
+class WordProbView(WordFreqView):
+
+    # @counts   The CorpusCounts the words come from
+    # @values   Sequence of counts by word id. Defaults to counts.wordCounts.
+    def __init__(self, counts, values=None):
+        WordFreqView.__init__(self, counts, values)
+        self.totalCount = None
+
+    #@return    Returns the total of all the counts, summed the first time it's needed
+    def total(self):
+        if self.totalCount is None:
+            totalCount = 0
+            for count in self.values:
+                totalCount += count
+            self.totalCount = totalCount
+        return self.totalCount
+
+    def value(self, wordId):
+        return float(self.values[wordId]) / self.total()
+
+
+#A read-only dictionary of "word1 word2" -> normalized bigram probability over the merged bigrams of
+#a CorpusCounts, worked out as in smoothing.bigramProbs but one bigram at a time. Bigrams that never
+#occur are not in the view; their probability, which only depends on the first word, is unseenValue.
+class BigramProbView(BigramFreqView):
+
+    # @counts           The CorpusCounts the bigrams come from (frozen)
+    # @values           Smoothed count of each bigram, by position. Defaults to the raw counts.
+    # @adjustedCounts   Smoothed count by raw count, used instead of values (ex: Good Turing adjusted counts)
+    # @unseenCounts     Smoothed count of a never seen bigram, by first word id
+    # @wordCounts       Count of each word, by word id. Defaults to counts.wordCounts.
+    def __init__(self, counts, values=None, adjustedCounts=None, unseenCounts=None, wordCounts=None):
+        BigramFreqView.__init__(self, counts, values, adjustedCounts)
+        if unseenCounts is None:
+            unseenCounts = [0] * counts.numWords()
+        if wordCounts is None:
+            wordCounts = counts.wordCounts
+        self.unseenCounts = unseenCounts
+        self.wordCounts = wordCounts
+        self.totalProb = None
+
+    #@return    Returns the total every probability is divided by, summed the first time it's needed
+    def total(self):
+        if self.totalProb is None:
+            if self.values is not None:
+                self.totalProb = smoothing.bigramProbTotal(self.counts.rowStarts, self.values,
+                                                           self.unseenCounts, self.wordCounts)
+            else:
+                self.totalProb = smoothing.bigramProbTotal(self.counts.rowStarts, self.counts.bigramCounts,
+                                                           self.unseenCounts, self.wordCounts, self.adjustedCounts)
+        return self.totalProb
+
+    #@return    Returns the probability of the bigram at a position, whose first word id is wordId1
+    def prob(self, wordId1, index):
+        return float(BigramFreqView.value(self, index)) / self.wordCounts[wordId1] / self.total()
+
+    def value(self, index):
+        #find the row the position is in; empty rows share their start with the next row
+        wordId1 = bisect.bisect_right(self.counts.rowStarts, index) - 1
+        return self.prob(wordId1, index)
+
+    def items(self):
+        word = self.counts.vocabulary.word
+        for wordId1, wordId2, index in self.counts.bigrams():
+            yield word(wordId1) + " " + word(wordId2), self.prob(wordId1, index)
+
+    #@return    Returns the probability of any never seen bigram starting with a word id
+    def unseenValue(self, wordId1):
+        return float(self.unseenCounts[wordId1]) / self.wordCounts[wordId1] / self.total()
+
+
+#A read-only dictionary of word1 -> probability of a never seen bigram starting with word1, over a
+#BigramProbView.
+class UnseenProbView(WordFreqView):
+
+    def __init__(self, bigramProbs):
+        WordFreqView.__init__(self, bigramProbs.counts, bigramProbs.unseenCounts)
+        self.bigramProbs = bigramProbs
+
+    def value(self, wordId):
+        return self.bigramProbs.unseenValue(wordId)
@@ -0,0 +1,197 @@
+import array
+import heapq
+import tempfile
+
+import counts
+import profiling
+
+# External count aggregation
+#
+# New bigram counts are kept in a dictionary until they are frozen into the count arrays, and that
+# dictionary costs about PENDING_BYTES per distinct bigram, many times what the arrays do. On a big
+# enough corpus it runs out of memory long before the arrays would.
+#
+# SpillingCounts is a CorpusCounts that keeps that dictionary under a memory budget. When it fills
+# up, its bigram counts are sorted by packed key and written to a temporary file as a run, and the
+# dictionary starts again empty. freeze() merges every run, the dictionary and any counts already in
+# the arrays in one k-way pass. Keys sort by first word id then second word id, which is exactly the
+# order of the arrays, so the merged counts are appended straight onto them.
+#
+# The vocabulary, word counts and the final arrays (about 8 bytes per distinct bigram) still have to
+# fit in memory; only the counting is bounded by the budget.
+#
+# Each run is a sequence of (packed key, count) pairs of unsigned longs.
+
+#about how many bytes a new bigram takes up in the pending dictionary, key and count included
+PENDING_BYTES = 100
+
+#how many (key, count) pairs are read or written at a time
+RUN_BLOCK = 1 << 16
+
+#the most runs of one level. Spilled runs are level 0, and whenever a level has this many runs they
+#are merged into one run of the next level up. Only runs of about the same size are merged, so each
+#count is rewritten once per level (log base MAX_MERGE_RUNS of the number of spills), and there are
+#never more than MAX_MERGE_RUNS - 1 runs of any level open.
+MAX_MERGE_RUNS = 64
+
+
+#A CorpusCounts that spills its new bigram counts to disk to stay under a memory budget.
+class SpillingCounts(counts.CorpusCounts):
+
+    # @memoryBudget     About how many bytes the new bigram counts can take up before they are spilled
+    # @tempDir          Where to write runs. Defaults to the system's temporary directory.
+    def __init__(self, memoryBudget, tempDir=None):
+        counts.CorpusCounts.__init__(self)
+        self.maxPending = max(1, memoryBudget // PENDING_BYTES)
+        self.tempDir = tempDir
+        self.runs = [] #open temporary files, each holding one sorted run, oldest first
+        self.runLevels = [] #the level of each run; never higher than the level of an older run
+
+    def addSentence(self, tokens):
+        counts.CorpusCounts.addSentence(self, tokens)
+        if len(self.pending) >= self.maxPending:
+            self.spill()
+
+    #Same as CorpusCounts.merge, but checks the budget after every bigram, since the other counts can
+    #have many more bigrams than the budget allows.
+    def merge(self, other):
+        maxPending = self.maxPending
+        for pairKey, count in self._mergeWords(other):
+            pending = self.pending
+            pending[pairKey] = pending.get(pairKey, 0) + count
+            if len(pending) >= maxPending:
+                self.spill()
+
+    #Writes the new bigram counts to a run and empties the dictionary.
+    def spill(self):
+        if len(self.pending) == 0:
+            return
+        with profiling.stage("spill", len(self.pending)):
+            pending = self.pending
+            runFile = self._newRun(0)
+            _writeRun(runFile, ((pairKey, pending[pairKey]) for pairKey in sorted(pending)))
+            self.pending = {}
+        #the newest runs have the lowest levels, so a full level is always the newest MAX_MERGE_RUNS runs
+        while len(self.runs) >= MAX_MERGE_RUNS and self.runLevels[-MAX_MERGE_RUNS] == self.runLevels[-1]:
+            self._mergeNewestRuns()
+
+    #Merges the runs, the new bigram counts and the arrays into the arrays.
+    def freeze(self):
+        if len(self.runs) == 0:
+            counts.CorpusCounts.freeze(self)
+            return
+
+        with profiling.stage("mergeRuns", len(self.runs)) as stage:
+            try:
+                pending = self.pending
+                sources = [_readRun(runFile) for runFile in self.runs]
+                sources.append((pairKey, pending[pairKey]) for pairKey in sorted(pending))
+                sources.append(self._mergedBigrams())
+                self._fillArrays(_mergeSorted(sources))
+            finally:
+                for runFile in self.runs:
+                    runFile.close()
+                self.runs = []
+                self.runLevels = []
+            stage.items = self.numBigrams()
+
+    #merges the MAX_MERGE_RUNS newest runs, all of one level, into one run of the next level
+    def _mergeNewestRuns(self):
+        with profiling.stage("mergeRuns", MAX_MERGE_RUNS):
+            level = self.runLevels[-1]
+            group = self.runs[-MAX_MERGE_RUNS:]
+            del self.runs[-MAX_MERGE_RUNS:]
+            del self.runLevels[-MAX_MERGE_RUNS:]
+            runFile = self._newRun(level + 1)
+            try:
+                _writeRun(runFile, _mergeSorted([_readRun(groupFile) for groupFile in group]))
+            finally:
+                for groupFile in group:
+                    groupFile.close()
+
+    #generates (packed key, count) for every bigram already in the arrays, in order
+    def _mergedBigrams(self):
+        bigramCounts = self.bigramCounts
+        for wordId1, wordId2, index in self.bigrams():
+            yield (wordId1 << counts.PAIR_SHIFT) | wordId2, bigramCounts[index]
+
+    #replaces the arrays with the bigrams of a sorted (packed key, count) sequence
+    def _fillArrays(self, merged):
+        rowStarts = array.array('L', [0])
+        bigramWords = array.array('I')
+        bigramCounts = array.array('I')
+
+        numRows = len(self.vocabulary)
+        row = 0
+        for pairKey, count in merged:
+            wordId1 = pairKey >> counts.PAIR_SHIFT
+            while row < wordId1:
+                rowStarts.append(len(bigramWords))
+                row += 1
+            bigramWords.append(pairKey & counts.PAIR_MASK)
+            bigramCounts.append(count)
+        while row < numRows:
+            rowStarts.append(len(bigramWords))
+            row += 1
+
+        self.rowStarts = rowStarts
+        self.bigramWords = bigramWords
+        self.bigramCounts = bigramCounts
+        self.pending = {}
+
+    def _newRun(self, level):
+        runFile = tempfile.TemporaryFile(prefix="bigrammer-run-", dir=self.tempDir)
+        self.runs.append(runFile)
+        self.runLevels.append(level)
+        return runFile
+
+    #runs are open files, so they can't be sent to another process; freeze first
+    def __getstate__(self):
+        if len(self.runs) > 0:
+            raise ValueError("SpillingCounts must be frozen before it can be pickled")
+        return self.__dict__
+
+
+#Writes a sorted (packed key, count) sequence to an open run file, and rewinds it for reading.
+def _writeRun(runFile, pairs):
+    block = array.array('L')
+    for pairKey, count in pairs:
+        block.append(pairKey)
+        block.append(count)
+        if len(block) >= RUN_BLOCK * 2:
+            block.tofile(runFile)
+            block = array.array('L')
+    block.tofile(runFile)
+    runFile.flush()
+    runFile.seek(0)
+
+#generates the (packed key, count) pairs of a run file
+def _readRun(runFile):
+    runFile.seek(0)
+    while True:
+        block = array.array('L')
+        try:
+            block.fromfile(runFile, RUN_BLOCK * 2)
+        except EOFError:
+            #the last block is short; what there was has still been read
+            pass
+        if len(block) == 0:
+            return
+        for i in xrange(0, len(block), 2):
+            yield block[i], block[i + 1]
+
+#generates the (packed key, count) pairs of several sorted sequences in order, with the counts of
+#equal keys added together
+def _mergeSorted(sources):
+    lastKey = -1
+    lastCount = 0
+    for pairKey, count in heapq.merge(*sources):
+        if pairKey == lastKey:
+            lastCount += count
+            continue
+        if lastKey >= 0:
+            yield lastKey, lastCount
+        lastKey = pairKey
+        lastCount = count
+    if lastKey >= 0:
+        yield lastKey, lastCount
@@ -0,0 +1,224 @@
+import bisect
+import math
+import random
+
+# Sentence generation
+#
+# Makes sentences from a loaded model (a CompiledModel or a BigramModel) in one of three ways:
+#   GREEDY  always takes the most likely next word, like printLikelySen
+#   SAMPLE  draws each next word at random from the bigram probabilities, sharpened or flattened
+#           by a temperature (probabilities are raised to the power 1/temperature)
+#   BEAM    keeps the beamWidth most likely sentences so far at every step, and returns the best
+#
+# Sampling uses a table per (word, temperature), made the first time that word is sampled from and
+# kept for every sentence after. The observed successors of a word go in an alias table, so drawing
+# one is O(1). Every never seen successor of a word has the same probability, so they are drawn as
+# a group: a random rank among them is turned into a word id with one binary search.
+
+#Generation modes
+GREEDY = 0
+SAMPLE = 1
+BEAM = 2
+
+#how many words a sentence has unless told otherwise, as in printLikelySen
+SENTENCE_LENGTH = 8
+
+#how many sentences beam search keeps at each step unless told otherwise
+BEAM_WIDTH = 4
+
+
+#Draws indexes in proportion to a list of weights in O(1) each (Vose's alias method).
+class AliasTable(object):
+
+    # @weights  The weight of each index. They don't have to add up to 1.
+    def __init__(self, weights):
+        size = len(weights)
+        total = float(sum(weights))
+        self.probs = [0.0] * size
+        self.aliases = [0] * size
+
+        scaled = [weight * size / total for weight in weights]
+        small = [index for index in range(size) if scaled[index] < 1.0]
+        large = [index for index in range(size) if scaled[index] >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probs[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        #whatever is left is 1 give or take rounding
+        for index in small + large:
+            self.probs[index] = 1.0
+
+    #@return    Returns a random index
+    def draw(self, rng):
+        index = int(rng.random() * len(self.probs))
+        if rng.random() < self.probs[index]:
+            return index
+        return self.aliases[index]
+
+
+#The next word distribution of one word at one temperature.
+class _SuccessorTable(object):
+
+    # @successorIds     Ids of the observed successors, in increasing order
+    # @weights          Their weights
+    # @unseenWeight     The weight of each never seen successor
+    # @vocabSize        How many words the model has
+    def __init__(self, successorIds, weights, unseenWeight, vocabSize):
+        self.successorIds = successorIds
+        self.observedWeight = float(sum(weights))
+        self.alias = AliasTable(weights) if len(weights) > 0 else None
+        self.numUnseen = vocabSize - len(successorIds)
+        self.totalWeight = self.observedWeight + unseenWeight * self.numUnseen
+
+        #(successor id - how many successors come before it) only goes up, and finding where a rank
+        #among the unseen ids falls in it gives how many observed ids are below the unseen one
+        self.gaps = [successorIds[index] - index for index in range(len(successorIds))]
+
+    #@return    Returns a random next word id, or -1 if no word can follow
+    def draw(self, rng):
+        if self.totalWeight <= 0:
+            return -1
+        if rng.random() * self.totalWeight < self.observedWeight:
+            return self.successorIds[self.alias.draw(rng)]
+        rank = int(rng.random() * self.numUnseen)
+        return rank + bisect.bisect_right(self.gaps, rank)
+
+
+#Generates sentences from one model, keeping its sampling tables between sentences.
+class SentenceGenerator(object):
+
+    # @model    A CompiledModel or BigramModel
+    def __init__(self, model):
+        self.model = model
+        self.tables = {} #(word id, temperature) -> _SuccessorTable
+        self.startTables = {} #temperature -> AliasTable of first words
+        self.modelVersion = getattr(model, "version", 0)
+
+    #@return    Returns a list of sentences, each a string ending in a period
+    # @count        How many sentences to make
+    # @mode         GREEDY, SAMPLE or BEAM
+    # @length       Most words per sentence. A sentence ends early if no word can follow.
+    # @start        The first word of every sentence. Defaults to the most likely word, or for
+    #               SAMPLE, a word drawn from the word probabilities.
+    # @temperature  For SAMPLE; below 1 favours likely words, above 1 evens the odds out
+    # @beamWidth    For BEAM; how many sentences to keep at each step
+    # @seed         For SAMPLE; the same seed always gives the same sentences
+    def generate(self, count, mode=SAMPLE, length=SENTENCE_LENGTH, start=None, temperature=1.0,
+                 beamWidth=BEAM_WIDTH, seed=None):
+        #a BigramModel that had text added since the tables were made needs new ones
+        if getattr(self.model, "version", 0) != self.modelVersion:
+            self.tables = {}
+            self.startTables = {}
+            self.modelVersion = getattr(self.model, "version", 0)
+
+        #sampling draws from the probability of every word, which only exact models have
+        if mode == SAMPLE and not hasattr(self.model, "successorIds"):
+            raise ValueError("SAMPLE needs a CompiledModel or BigramModel; use GREEDY or BEAM with this model")
+
+        if self.model.vocabSize == 0:
+            return []
+
+        if mode == SAMPLE:
+            rng = random.Random(seed)
+            return [_sentence(self.sample(rng, length, start, temperature)) for i in range(count)]
+
+        #greedy and beam search always make the same sentence from the same start
+        if mode == GREEDY:
+            words = self.greedy(length, start)
+        elif mode == BEAM:
+            words = self.beam(length, start, beamWidth)
+        else:
+            raise ValueError("unknown generation mode " + repr(mode))
+        return [_sentence(words)] * count
+
+    #@return    Returns the words of a sentence made by always taking the most likely next word
+    def greedy(self, length=SENTENCE_LENGTH, start=None):
+        if start is None:
+            start = self.model.likelyWord()
+        words = [start]
+        while len(words) < length:
+            probPair = self.model.likelyNextWord(words[-1])
+            if probPair is None:
+                break
+            words.append(probPair[0])
+        return words
+
+    #@return    Returns the words of a sentence drawn at random
+    # @rng  A random.Random
+    def sample(self, rng, length=SENTENCE_LENGTH, start=None, temperature=1.0):
+        if temperature <= 0:
+            return self.greedy(length, start)
+
+        if start is None:
+            wordId = self._startTable(temperature).draw(rng)
+        else:
+            wordId = self.model.wordId(start)
+            if wordId < 0:
+                return [start]
+
+        wordIds = [wordId]
+        while len(wordIds) < length:
+            wordId = self._successorTable(wordId, temperature).draw(rng)
+            if wordId < 0:
+                break
+            wordIds.append(wordId)
+        return [self.model.word(wordId) for wordId in wordIds]
+
+    #@return    Returns the words of the most likely sentence found by a beam search. Sentences are
+    #           scored by the product of their bigram probabilities.
+    def beam(self, length=SENTENCE_LENGTH, start=None, beamWidth=BEAM_WIDTH):
+        if start is None:
+            start = self.model.likelyWord()
+
+        beams = [(0.0, [start])] #(log probability, words)
+        for step in range(length - 1):
+            candidates = []
+            for logProb, words in beams:
+                nextWords = self.model.topNextWords(words[-1], beamWidth)
+                if len(nextWords) == 0:
+                    #nothing can follow; keep the sentence as it is
+                    candidates.append((logProb, words))
+                for nextWord, prob in nextWords:
+                    candidates.append((logProb + math.log(prob), words + [nextWord]))
+            #sort is stable, so equally likely sentences keep the order topNextWords gave them
+            candidates.sort(key=lambda candidate: -candidate[0])
+            beams = candidates[:beamWidth]
+
+        return beams[0][1]
+
+    def _startTable(self, temperature):
+        table = self.startTables.get(temperature)
+        if table is None:
+            table = self.startTables[temperature] = AliasTable(_weights(self.model.wordProbArray(), temperature))
+        return table
+
+    def _successorTable(self, wordId, temperature):
+        key = (wordId, temperature)
+        table = self.tables.get(key)
+        if table is None:
+            successorIds, probs = self.model.successorIds(wordId)
+            unseen = self.model.unseenProb(wordId)
+            weights = _weights(list(probs) + [unseen], temperature)
+            table = self.tables[key] = _SuccessorTable(successorIds, weights[:-1], weights[-1], self.model.vocabSize)
+        return table
+
+
+#@return    Returns probabilities raised to the power 1/temperature. They are divided by the largest
+#           first, so small ones don't all round to 0 at low temperatures.
+def _weights(probs, temperature):
+    largest = max(probs) if len(probs) > 0 else 0
+    if largest <= 0:
+        return [0.0] * len(probs)
+    if temperature == 1.0:
+        return [prob / largest for prob in probs]
+    exponent = 1.0 / temperature
+    return [(prob / largest) ** exponent for prob in probs]
+
+def _sentence(words):
+    return " ".join(words) + "."
@@ -0,0 +1,435 @@
+import array
+import mmap
+import struct
+
+import counts
+import smoothing
+
+# Compiled bigram model files
+#
+# A compiled model holds everything the bigrammer needs to answer queries about a corpus:
+# the vocabulary, word counts and probabilities, raw bigram counts, the Good Turing adjusted
+# counts and the normalized bigram probabilities. The file is memory-mapped when loaded, so
+# opening a model costs almost nothing no matter how large the corpus was.
+#
+# Layout (native byte order, every section starts on an 8 byte boundary):
+#   header
+#   wordCounts      uint64[V]       count of each word
+#   wordProbs       double[V]       probability of each word
+#   wordOffsets     uint64[V+1]     where each word starts in the word blob
+#   rowStarts       uint64[V+1]     where the bigrams starting with each word start
+#   unseenProbs     double[V]       probability of a never seen bigram starting with each word
+#   adjustedCounts  double[C+1]     Good Turing adjusted count, indexed by raw count
+#   bigramProbs     double[N]       probability of each observed bigram
+#   bigramCounts    uint32[N]       raw count of each observed bigram
+#   bigramWords     uint32[N]       id of the second word of each observed bigram
+#   successorOrder  uint32[N]       the bigrams of each row by position in the row, most likely first
+#   word blob                       all words, sorted, back to back
+#
+# Words are sorted, so a word's id is its position in sorted order, and the bigrams of a row
+# are sorted by the id of their second word. The successor order lists the same rows again by
+# probability, so the likeliest next words can be read off without scanning.
+
+MAGIC = "BGRM"
+VERSION = 3
+
+HEADER = struct.Struct("=4sI20s20sQdQQQqQI")
+
+UINT64 = struct.Struct("=Q")
+UINT32 = struct.Struct("=I")
+DOUBLE = struct.Struct("=d")
+
+#how many values are packed at once when writing an array
+WRITE_CHUNK = 65536
+
+
+#pads a section size up to the next 8 byte boundary
+def _align(size):
+    return (size + 7) & ~7
+
+#writes a list of values to a file as a packed array, padded to 8 bytes
+def _writeArray(modelFile, code, values):
+    for i in range(0, len(values), WRITE_CHUNK):
+        chunk = values[i:i+WRITE_CHUNK]
+        modelFile.write(struct.pack("=%d%s" % (len(chunk), code), *chunk))
+    size = len(values) * struct.calcsize("=" + code)
+    modelFile.write("\0" * (_align(size) - size))
+
+
+#Writes a compiled model to an open file.
+# @modelFile        The file to write the model to
+# @corpusInfo       Dictionary with the corpusHash, stopwordsHash, corpusSize, corpusMtime and smoothingMode
+# @corpusCounts     The frozen CorpusCounts of the corpus
+# @wordProbs        Probability of each word, by word id
+# @adjustedCounts   Good Turing adjusted count for each raw count
+# @bigramProbs      Probability of each bigram, by position in corpusCounts
+# @unseenProbs      Probability of a never seen bigram starting with each word, by word id
+def writeModelFile(modelFile, corpusInfo, corpusCounts, wordProbs, adjustedCounts, bigramProbs, unseenProbs):
+    vocabulary = corpusCounts.vocabulary
+
+    #the model numbers words in sorted order; order maps a model id to a counts id, and modelIds back.
+    order = sorted(range(len(vocabulary)), key=vocabulary.word)
+    modelIds = array.array('I', [0]) * len(order)
+    for modelId in range(len(order)):
+        modelIds[order[modelId]] = modelId
+    words = [vocabulary.word(wordId) for wordId in order]
+
+    #find the most likely single word; ties go to the first word in sorted order
+    likelyWord = -1
+    likelyProb = 0
+    for modelId in range(len(order)):
+        if wordProbs[order[modelId]] > likelyProb:
+            likelyProb = wordProbs[order[modelId]]
+            likelyWord = modelId
+
+    #lay the rows out in model id order, each sorted by the model id of the second word
+    #(in arrays rather than lists, since these are as long as the number of distinct bigrams)
+    rowStarts = array.array('L', [0])
+    bigramWords = array.array('I')
+    bigramCounts = array.array('I')
+    rowProbs = array.array('d')
+    successorOrder = array.array('I')
+    for wordId1 in order:
+        start, end = corpusCounts.row(wordId1)
+        row = [(modelIds[corpusCounts.bigramWords[index]], index) for index in range(start, end)]
+        row.sort()
+        for modelId2, index in row:
+            bigramWords.append(modelId2)
+            bigramCounts.append(corpusCounts.bigramCounts[index])
+            rowProbs.append(bigramProbs[index])
+        rowStarts.append(len(bigramWords))
+
+        #within each row, order the bigrams by probability (ties stay in word order, since the sort is stable)
+        positions = range(len(row))
+        positions.sort(key=lambda position: -bigramProbs[row[position][1]])
+        successorOrder.extend(positions)
+
+    wordOffsets = [0]
+    for word in words:
+        wordOffsets.append(wordOffsets[-1] + len(word))
+
+    blob = "".join(words)
+
+    modelFile.write(HEADER.pack(MAGIC, VERSION, corpusInfo["corpusHash"], corpusInfo["stopwordsHash"],
+                                corpusInfo["corpusSize"], corpusInfo["corpusMtime"], len(words), len(bigramWords),
+                                len(adjustedCounts), likelyWord, len(blob), corpusInfo["smoothingMode"]))
+    modelFile.write("\0" * (_align(HEADER.size) - HEADER.size))
+
+    _writeArray(modelFile, "Q", [corpusCounts.wordCount(wordId) for wordId in order])
+    _writeArray(modelFile, "d", [wordProbs[wordId] for wordId in order])
+    _writeArray(modelFile, "Q", wordOffsets)
+    _writeArray(modelFile, "Q", rowStarts)
+    _writeArray(modelFile, "d", [unseenProbs[wordId] for wordId in order])
+    _writeArray(modelFile, "d", [float(count) for count in adjustedCounts])
+    _writeArray(modelFile, "d", rowProbs)
+    _writeArray(modelFile, "I", bigramCounts)
+    _writeArray(modelFile, "I", bigramWords)
+    _writeArray(modelFile, "I", successorOrder)
+    modelFile.write(blob)
+
+#@return    Returns a dictionary of the header fields; raises ValueError if this is not a model file.
+def _parseHeader(data):
+    if len(data) < HEADER.size:
+        raise ValueError("not a compiled bigram model")
+    fields = HEADER.unpack_from(data, 0)
+    if fields[0] != MAGIC or fields[1] != VERSION:
+        raise ValueError("not a compiled bigram model (or an old version)")
+    return {
+        "corpusHash": fields[2],
+        "stopwordsHash": fields[3],
+        "corpusSize": fields[4],
+        "corpusMtime": fields[5],
+        "vocabSize": fields[6],
+        "numBigrams": fields[7],
+        "numAdjusted": fields[8],
+        "likelyWord": fields[9],
+        "blobLength": fields[10],
+        "smoothingMode": fields[11],
+    }
+
+
+#A memory-mapped compiled model. Nothing is read up front besides the header; every query
+#reads straight out of the mapped file.
+class CompiledModel(object):
+
+    # @modelFile    An open file object (or a filename) of a compiled model
+    def __init__(self, modelFile):
+        if isinstance(modelFile, basestring):
+            modelFile = open(modelFile, "rb")
+            try:
+                self.data = mmap.mmap(modelFile.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                modelFile.close()
+        else:
+            self.data = mmap.mmap(modelFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = _parseHeader(self.data[:HEADER.size])
+        self.corpusHash = header["corpusHash"]
+        self.stopwordsHash = header["stopwordsHash"]
+        self.corpusSize = header["corpusSize"]
+        self.corpusMtime = header["corpusMtime"]
+        self.vocabSize = header["vocabSize"]
+        self.numBigrams = header["numBigrams"]
+        self.likelyWordId = header["likelyWord"]
+        self.smoothingMode = header["smoothingMode"]
+        self.numAdjusted = header["numAdjusted"]
+
+        #work out where each section starts
+        offset = _align(HEADER.size)
+        self.wordCountsAt = offset
+        offset += _align(self.vocabSize * 8)
+        self.wordProbsAt = offset
+        offset += _align(self.vocabSize * 8)
+        self.wordOffsetsAt = offset
+        offset += _align((self.vocabSize + 1) * 8)
+        self.rowStartsAt = offset
+        offset += _align((self.vocabSize + 1) * 8)
+        self.unseenProbsAt = offset
+        offset += _align(self.vocabSize * 8)
+        self.adjustedCountsAt = offset
+        offset += _align(header["numAdjusted"] * 8)
+        self.bigramProbsAt = offset
+        offset += _align(self.numBigrams * 8)
+        self.bigramCountsAt = offset
+        offset += _align(self.numBigrams * 4)
+        self.bigramWordsAt = offset
+        offset += _align(self.numBigrams * 4)
+        self.successorOrderAt = offset
+        offset += _align(self.numBigrams * 4)
+        self.blobAt = offset
+
+        if len(self.data) < self.blobAt + header["blobLength"]:
+            raise ValueError("compiled bigram model is truncated")
+
+    def close(self):
+        self.data.close()
+
+    #@return    Returns how many bytes of memory the model maps
+    def memorySize(self):
+        return len(self.data)
+
+    #Low level access by id -----------------------------------------------------------------------------------
+
+    def word(self, wordId):
+        start = UINT64.unpack_from(self.data, self.wordOffsetsAt + wordId * 8)[0]
+        end = UINT64.unpack_from(self.data, self.wordOffsetsAt + wordId * 8 + 8)[0]
+        return self.data[self.blobAt + start:self.blobAt + end]
+
+    #@return    Returns the id of a word, or -1 if the word is not in the model
+    def wordId(self, word):
+        low = 0
+        high = self.vocabSize
+        while low < high:
+            mid = (low + high) // 2
+            if self.word(mid) < word:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.vocabSize and self.word(low) == word:
+            return low
+        return -1
+
+    def rowRange(self, wordId):
+        start = UINT64.unpack_from(self.data, self.rowStartsAt + wordId * 8)[0]
+        end = UINT64.unpack_from(self.data, self.rowStartsAt + wordId * 8 + 8)[0]
+        return start, end
+
+    def bigramWord(self, index):
+        return UINT32.unpack_from(self.data, self.bigramWordsAt + index * 4)[0]
+
+    def bigramCount(self, index):
+        return UINT32.unpack_from(self.data, self.bigramCountsAt + index * 4)[0]
+
+    def bigramProbAt(self, index):
+        return DOUBLE.unpack_from(self.data, self.bigramProbsAt + index * 8)[0]
+
+    #@return    Returns the index of the rank'th most likely observed bigram of a row
+    def successorAt(self, start, rank):
+        return start + UINT32.unpack_from(self.data, self.successorOrderAt + (start + rank) * 4)[0]
+
+    def unseenProb(self, wordId):
+        return DOUBLE.unpack_from(self.data, self.unseenProbsAt + wordId * 8)[0]
+
+    #Plain Good Turing leaves the largest count at its Nc, a whole number, and it comes back as one,
+    #the same as from smoothing.goodTuringCounts.
+    def adjustedCount(self, count):
+        adjustedCount = DOUBLE.unpack_from(self.data, self.adjustedCountsAt + count * 8)[0]
+        if count == self.numAdjusted - 1 and self.smoothingMode == smoothing.GOOD_TURING:
+            return int(adjustedCount)
+        return adjustedCount
+
+    #@return    Returns the probability of every word, by word id
+    def wordProbArray(self):
+        return self._readArray('d', "d", self.wordProbsAt, self.vocabSize)
+
+    #@return    Returns (second word ids, probabilities) of the observed bigrams starting with a word id,
+    #           in order of second word id
+    def successorIds(self, wordId):
+        start, end = self.rowRange(wordId)
+        return (self._readArray('I', "I", self.bigramWordsAt + start * 4, end - start),
+                self._readArray('d', "d", self.bigramProbsAt + start * 8, end - start))
+
+    #@return    Returns the index of the first bigram of a row whose second word id is at least wordId2
+    def _searchRow(self, wordId1, wordId2):
+        low, high = self.rowRange(wordId1)
+        while low < high:
+            mid = (low + high) // 2
+            if self.bigramWord(mid) < wordId2:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    #@return    Returns the index of the bigram (wordId1, wordId2), or -1 if it was never seen
+    def bigramIndex(self, wordId1, wordId2):
+        index = self._searchRow(wordId1, wordId2)
+        if index < self.rowRange(wordId1)[1] and self.bigramWord(index) == wordId2:
+            return index
+        return -1
+
+    #@return    Returns the lowest word id, at least fromId, that never follows wordId1; -1 if there is none
+    def nextUnseen(self, wordId1, fromId):
+        index = self._searchRow(wordId1, fromId)
+        end = self.rowRange(wordId1)[1]
+        while index < end and self.bigramWord(index) == fromId:
+            index += 1
+            fromId += 1
+        if fromId < self.vocabSize:
+            return fromId
+        return -1
+
+    #@return    Returns (words, rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs), the whole
+    #           model copied out into a list of words and arrays by id, for working on every bigram at once
+    def probArrays(self):
+        wordOffsets = self._readArray('L', "Q", self.wordOffsetsAt, self.vocabSize + 1)
+        blob = self.data[self.blobAt:self.blobAt + wordOffsets[-1]]
+        words = [blob[wordOffsets[wordId]:wordOffsets[wordId + 1]] for wordId in range(self.vocabSize)]
+        return (words,
+                self._readArray('L', "Q", self.rowStartsAt, self.vocabSize + 1),
+                self._readArray('I', "I", self.bigramWordsAt, self.numBigrams),
+                self._readArray('d', "d", self.bigramProbsAt, self.numBigrams),
+                self._readArray('d', "d", self.unseenProbsAt, self.vocabSize),
+                self.wordProbArray())
+
+    #@return    Returns the raw counts stored in the model as a CorpusCounts, with the model's word ids
+    def corpusCounts(self):
+        corpusCounts = counts.CorpusCounts()
+        for wordId in range(self.vocabSize):
+            corpusCounts.vocabulary.intern(self.word(wordId))
+        corpusCounts.wordCounts = self._readArray('L', "Q", self.wordCountsAt, self.vocabSize)
+        corpusCounts.rowStarts = self._readArray('L', "Q", self.rowStartsAt, self.vocabSize + 1)
+        corpusCounts.bigramCounts = self._readArray('I', "I", self.bigramCountsAt, self.numBigrams)
+        corpusCounts.bigramWords = self._readArray('I', "I", self.bigramWordsAt, self.numBigrams)
+        return corpusCounts
+
+    #copies a section of the file into an array.array
+    def _readArray(self, typecode, code, offset, length):
+        return array.array(typecode, struct.unpack_from("=%d%s" % (length, code), self.data, offset))
+
+    #Queries by word -----------------------------------------------------------------------------------------
+
+    #generates every word in the model, in sorted order
+    def vocabulary(self):
+        for wordId in range(self.vocabSize):
+            yield self.word(wordId)
+
+    def wordCount(self, word):
+        wordId = self.wordId(word)
+        if wordId < 0:
+            return 0
+        return UINT64.unpack_from(self.data, self.wordCountsAt + wordId * 8)[0]
+
+    def wordProb(self, word):
+        wordId = self.wordId(word)
+        if wordId < 0:
+            return 0.0
+        return DOUBLE.unpack_from(self.data, self.wordProbsAt + wordId * 8)[0]
+
+    #@return    Returns the most likely single word, or '' if the model is empty
+    def likelyWord(self):
+        if self.likelyWordId < 0:
+            return ''
+        return self.word(self.likelyWordId)
+
+    #@return    Returns the smoothed frequency of a bigram, or None if either word is not in the model
+    def bigramFreq(self, word1, word2):
+        wordId1 = self.wordId(word1)
+        wordId2 = self.wordId(word2)
+        if wordId1 < 0 or wordId2 < 0:
+            return None
+        index = self.bigramIndex(wordId1, wordId2)
+        if index < 0:
+            return self.adjustedCount(0)
+        return self.adjustedCount(self.bigramCount(index))
+
+    #@return    Returns the probability of a bigram, or None if either word is not in the model
+    def bigramProb(self, word1, word2):
+        wordId1 = self.wordId(word1)
+        wordId2 = self.wordId(word2)
+        if wordId1 < 0 or wordId2 < 0:
+            return None
+        index = self.bigramIndex(wordId1, wordId2)
+        if index < 0:
+            return self.unseenProb(wordId1)
+        return self.bigramProbAt(index)
+
+    #Finds the most likely word to follow a word. Never seen bigrams count too (with their smoothed
+    #probability), and ties go to the first word in sorted order.
+    #@return    Returns a (word, probability) pair, or None if the word is not in the model
+    def likelyNextWord(self, word):
+        likelyWords = self.topNextWords(word, 1)
+        if len(likelyWords) == 0:
+            return None
+        return likelyWords[0]
+
+    #Finds the k most likely words to follow a word, ranked the same way as likelyNextWord.
+    #Observed bigrams come from the successor order and never seen ones (which all share one
+    #probability) are merged in by word id, so only about k entries of the row are looked at.
+    #@return    Returns a list of up to k (word, probability) pairs, most likely first
+    def topNextWords(self, word, k):
+        wordId = self.wordId(word)
+        if wordId < 0:
+            return []
+
+        start, end = self.rowRange(wordId)
+        unseen = self.unseenProb(wordId)
+        unseenId = self.nextUnseen(wordId, 0)
+        rank = 0
+
+        likelyWords = []
+        while len(likelyWords) < k:
+            nextId = -1
+            nextProb = 0
+            if start + rank < end:
+                index = self.successorAt(start, rank)
+                nextId = self.bigramWord(index)
+                nextProb = self.bigramProbAt(index)
+
+            if unseenId >= 0 and (unseen > nextProb or (unseen == nextProb and unseenId < nextId)):
+                nextId = unseenId
+                nextProb = unseen
+                unseenId = self.nextUnseen(wordId, unseenId + 1)
+            else:
+                rank += 1
+
+            #stop once nothing is left, or only impossible words are
+            if nextId < 0 or nextProb <= 0:
+                break
+            likelyWords.append((self.word(nextId), nextProb))
+
+        return likelyWords
+
+    #generates (bigram, smoothed frequency, probability) for every pair of words in the model,
+    #including the ones that never occur.
+    def bigrams(self):
+        unseenCount = self.adjustedCount(0) if self.vocabSize > 0 else 0
+        for wordId1 in range(self.vocabSize):
+            word1 = self.word(wordId1)
+            unseen = self.unseenProb(wordId1)
+            index, end = self.rowRange(wordId1)
+            for wordId2 in range(self.vocabSize):
+                if index < end and self.bigramWord(index) == wordId2:
+                    yield word1 + " " + self.word(wordId2), self.adjustedCount(self.bigramCount(index)), self.bigramProbAt(index)
+                    index += 1
+                else:
+                    yield word1 + " " + self.word(wordId2), unseenCount, unseen
@@ -0,0 +1,369 @@
+import array
+import bisect
+import heapq
+import sys
+
+import counts
+import profiling
+import smoothing
+
+# N-gram models
+#
+# Counts and queries n-grams of any order. Counting works like CorpusCounts: every word gets an
+# integer id, and each n-gram is counted in a dictionary under its ids packed into one integer
+# (ID_BITS bits per word). NgramModel then lays the counts out as a trie of sorted arrays, one level
+# per order, in which n-grams that start the same way share their prefix:
+#
+#   level 1         the words, by id (wordCounts)
+#   level n         the n-grams, sorted. words[n] holds the last word id of each and counts[n] its
+#                   count; the rest of the n-gram is its parent at level n-1.
+#   childStarts[n]  where the children of each level n node start in level n+1, so the n-grams that
+#                   extend a node are words[n+1][childStarts[n][node]:childStarts[n][node+1]],
+#                   sorted by word id (the same layout CorpusCounts uses for bigrams)
+#   alphas[n]       the backoff weight of each level n node, as the context of longer n-grams
+#
+# That is 24 bytes per stored n-gram below the top order and 8 at it, next to the ~100 a packed
+# dictionary entry takes and the ~150 of a "word1 word2" string key.
+#
+# Probabilities use Katz backoff on top of the smoothing module's adjusted counts:
+#   P(w | h) = d(c) * c(h w) / c(h)         if the n-gram h w occurs
+#            = alpha(h) * P(w | h minus its first word)     otherwise
+#   P(w)     = c(w) / total words
+# The discount d(c) is Katz's: counts above KATZ_THRESHOLD are kept as they are, and smaller ones
+# are scaled by c*/c (renormalized so the discounted mass matches what N1 leaves for unseen
+# n-grams), where c* is the Good Turing (or Simple Good-Turing) adjusted count of that order. alpha(h)
+# hands exactly the mass the discounts took off to the words never seen after h.
+
+#the highest count that is discounted; larger counts are reliable enough to keep
+KATZ_THRESHOLD = 5
+
+#bits each word id takes up in a packed n-gram key
+ID_BITS = counts.PAIR_SHIFT
+ID_MASK = counts.PAIR_MASK
+
+
+#Raw counts of every n-gram of a corpus, from single words up to a given order.
+class NgramCounts(object):
+
+    # @order    The longest n-grams to count
+    def __init__(self, order):
+        if order < 1:
+            raise ValueError("n-gram order must be at least 1")
+        self.order = order
+        self.vocabulary = counts.Vocabulary()
+        self.wordCounts = array.array('L')
+        self.ngrams = [{} for n in range(order + 1)] #n -> packed key -> count, for n of 2 and up
+
+    #Counts the words and n-grams of one sentence. N-grams never cross sentence ends.
+    def addSentence(self, tokens):
+        intern = self.vocabulary.intern
+        wordCounts = self.wordCounts
+        wordIds = []
+        for token in tokens:
+            wordId = intern(token)
+            if wordId == len(wordCounts):
+                wordCounts.append(0)
+            wordCounts[wordId] += 1
+            wordIds.append(wordId)
+
+        #every n-gram starting at a position is the one an order shorter with one more word packed on
+        ngrams = self.ngrams
+        numWords = len(wordIds)
+        for start in range(numWords - 1):
+            key = wordIds[start]
+            for n in range(2, min(self.order, numWords - start) + 1):
+                key = (key << ID_BITS) | wordIds[start + n - 1]
+                ngramCounts = ngrams[n]
+                ngramCounts[key] = ngramCounts.get(key, 0) + 1
+
+    #@return    Returns how many distinct n-grams of an order were counted
+    def numNgrams(self, n):
+        if n == 1:
+            return len(self.vocabulary)
+        return len(self.ngrams[n])
+
+
+#A Katz backoff n-gram model over a trie of sorted arrays. Queries are by word, like the bigram
+#models', and take the words before the one asked about as a list.
+class NgramModel(object):
+
+    # @ngramCounts      The NgramCounts of the corpus
+    # @smoothingMode    smoothing.GOOD_TURING (the default) or smoothing.SIMPLE_GOOD_TURING; the
+    #                   adjusted counts the Katz discounts are worked out from
+    def __init__(self, ngramCounts, smoothingMode=smoothing.GOOD_TURING):
+        self.order = ngramCounts.order
+        self.smoothingMode = smoothingMode
+        self.vocabulary = ngramCounts.vocabulary
+        self.wordCounts = ngramCounts.wordCounts
+        self.totalWords = sum(self.wordCounts)
+
+        #levels are indexed by order; level 1 is the words themselves, so it only has counts
+        self.words = [None, None]
+        self.counts = [None, self.wordCounts]
+        self.childStarts = [None]
+        self.alphas = [None]
+        self.discounts = [None, None]
+
+        #word ids by count, most frequent first (ties alphabetically), for predictions that back off
+        #all the way to single words
+        self.wordsByCount = sorted(range(len(self.vocabulary)),
+                                   key=lambda wordId: (-self.wordCounts[wordId], self.vocabulary.word(wordId)))
+
+        with profiling.stage("trie") as stage:
+            self._build(ngramCounts)
+            stage.items = sum([len(self.words[n]) for n in range(2, self.order + 1)])
+
+    @property
+    def vocabSize(self):
+        return len(self.vocabulary)
+
+    #Building ------------------------------------------------------------------------------------------------
+
+    def _build(self, ngramCounts):
+        prevKeys = None #sorted packed keys of the level above; level 1's keys are the word ids
+        numParents = len(self.vocabulary)
+        for n in range(2, self.order + 1):
+            ngrams = ngramCounts.ngrams[n]
+            keys = sorted(ngrams)
+
+            #sorted keys come grouped by their prefix, which is the parent, in the parents' order
+            words = array.array('I')
+            levelCounts = array.array('I')
+            childStarts = array.array('L')
+            parent = 0
+            for key in keys:
+                prefix = key >> ID_BITS
+                if prevKeys is None:
+                    parent = prefix
+                else:
+                    while prevKeys[parent] != prefix:
+                        parent += 1
+                while len(childStarts) <= parent:
+                    childStarts.append(len(words))
+                words.append(key & ID_MASK)
+                levelCounts.append(ngrams[key])
+            while len(childStarts) <= numParents:
+                childStarts.append(len(words))
+
+            self.words.append(words)
+            self.counts.append(levelCounts)
+            self.childStarts.append(childStarts)
+            self.discounts.append(_katzDiscounts(levelCounts, self.smoothingMode))
+
+            #now the children of the level above are known, so are its backoff weights
+            with profiling.stage("backoff", numParents):
+                self.alphas.append(self._backoffWeights(n - 1, prevKeys))
+
+            prevKeys = keys
+            numParents = len(keys)
+
+    #@return    Returns the backoff weight of every node of a level, as an array
+    # @n        The level
+    # @keys     The packed keys of the level's nodes, or None for level 1
+    def _backoffWeights(self, n, keys):
+        childStarts = self.childStarts[n]
+        words = self.words[n + 1]
+        childCounts = self.counts[n + 1]
+        discounts = self.discounts[n + 1]
+        contextCounts = self.counts[n]
+
+        alphas = array.array('d')
+        for node in range(len(childStarts) - 1):
+            #the context without its first word, which the children back off to
+            if keys is None:
+                shorter = []
+            else:
+                shorter = _unpack(keys[node], n)[1:]
+
+            kept = 0.0 #probability the children keep after discounting
+            lowerKept = 0.0 #probability the same words get from the shorter context
+            for index in range(childStarts[node], childStarts[node + 1]):
+                count = childCounts[index]
+                kept += _discount(discounts, count) * count / contextCounts[node]
+                lowerKept += self._prob(shorter + [words[index]])
+
+            if lowerKept >= 1.0:
+                alphas.append(0.0)
+            else:
+                alphas.append(max(0.0, 1.0 - kept) / (1.0 - lowerKept))
+        return alphas
+
+    #Access by id --------------------------------------------------------------------------------------------
+
+    def word(self, wordId):
+        return self.vocabulary.word(wordId)
+
+    def wordId(self, word):
+        return self.vocabulary.wordId(word)
+
+    #@return    Returns the node of an n-gram of word ids at its level, or -1 if it never occurs
+    def _find(self, wordIds):
+        node = wordIds[0]
+        for n in range(2, len(wordIds) + 1):
+            words = self.words[n]
+            start = self.childStarts[n - 1][node]
+            end = self.childStarts[n - 1][node + 1]
+            index = bisect.bisect_left(words, wordIds[n - 1], start, end)
+            if index == end or words[index] != wordIds[n - 1]:
+                return -1
+            node = index
+        return node
+
+    #@return    Returns P(last id | the ids before it), backing off as far as it needs to
+    def _prob(self, wordIds):
+        wordIds = wordIds[-self.order:]
+        weight = 1.0
+        while len(wordIds) > 1:
+            n = len(wordIds)
+            context = -1
+            if min(wordIds[:-1]) >= 0:
+                context = self._find(wordIds[:-1])
+            if context >= 0:
+                words = self.words[n]
+                start = self.childStarts[n - 1][context]
+                end = self.childStarts[n - 1][context + 1]
+                index = bisect.bisect_left(words, wordIds[-1], start, end)
+                if index < end and words[index] == wordIds[-1]:
+                    count = self.counts[n][index]
+                    return weight * _discount(self.discounts[n], count) * count / self.counts[n - 1][context]
+                weight *= self.alphas[n - 1][context]
+            wordIds = wordIds[1:]
+        return weight * self.wordCounts[wordIds[0]] / self.totalWords
+
+    #@return    Returns the ids of the context words that can matter: at most order - 1 of them, and
+    #           none from before a word that isn't in the model
+    def _contextIds(self, contextWords):
+        contextIds = []
+        if self.order > 1:
+            for word in contextWords[-(self.order - 1):]:
+                wordId = self.wordId(word)
+                if wordId < 0:
+                    contextIds = []
+                else:
+                    contextIds.append(wordId)
+        return contextIds
+
+    #@return    Returns whether the last word of a context is in the model, or there is no context. An
+    #           unknown word before it only shortens the context, but with the last one unknown there
+    #           would be nothing left to go on but the word probabilities.
+    def _knownContext(self, contextWords):
+        return len(contextWords) == 0 or self.order == 1 or self.wordId(contextWords[-1]) >= 0
+
+    #Queries -------------------------------------------------------------------------------------------------
+
+    #@return    Returns the count of an n-gram of at most order words, or None if a word is not in the model
+    def ngramCount(self, words):
+        wordIds = [self.wordId(word) for word in words]
+        if len(wordIds) == 0 or min(wordIds) < 0:
+            return None
+        if len(wordIds) == 1:
+            return self.wordCounts[wordIds[0]]
+        node = self._find(wordIds)
+        if node < 0:
+            return 0
+        return self.counts[len(wordIds)][node]
+
+    #@return    Returns P(last word | the words before it), or None if the last word or the one just
+    #           before it is not in the model. Only the last order - 1 words before it are used.
+    def ngramProb(self, words):
+        wordId = self.wordId(words[-1])
+        if wordId < 0 or not self._knownContext(words[:-1]):
+            return None
+        return self._prob(self._contextIds(words[:-1]) + [wordId])
+
+    #@return    Returns a list of up to k (word, probability) pairs for the words most likely to follow
+    #           a list of words, most likely first, with ties going to the first word alphabetically.
+    #           Words with no probability left after backoff are never listed, and nothing is listed
+    #           after a word that is not in the model.
+    def topNextWordsAfter(self, contextWords, k):
+        if not self._knownContext(contextWords):
+            return []
+        contextIds = self._contextIds(contextWords)
+
+        #the same backoff as _prob, for every word at once: the words seen after the longest context
+        #take their discounted probability from it, the words seen only after a shorter one take theirs
+        #from that times the alphas of the longer ones, and so on down to single words
+        probs = {} #word id -> probability
+        weight = 1.0
+        for start in range(len(contextIds)):
+            n = len(contextIds) - start
+            node = self._find(contextIds[start:])
+            if node < 0:
+                continue
+            words = self.words[n + 1]
+            childCounts = self.counts[n + 1]
+            discounts = self.discounts[n + 1]
+            contextCount = self.counts[n][node]
+            for index in range(self.childStarts[n][node], self.childStarts[n][node + 1]):
+                wordId = words[index]
+                if wordId not in probs:
+                    count = childCounts[index]
+                    probs[wordId] = weight * _discount(discounts, count) * count / contextCount
+            weight *= self.alphas[n][node]
+
+        #every other word gets weight * P(word), so only the k most frequent of them can make the list
+        added = 0
+        for wordId in self.wordsByCount:
+            if added == k:
+                break
+            if wordId not in probs:
+                probs[wordId] = weight * self.wordCounts[wordId] / self.totalWords
+                added += 1
+
+        scored = heapq.nsmallest(k, [(-prob, self.word(wordId)) for wordId, prob in probs.iteritems()])
+        #impossible words are never predicted
+        return [(word, -negProb) for negProb, word in scored if negProb < 0]
+
+    #@return    Returns a (word, probability) pair for the word most likely to follow a list of words,
+    #           or None if the model is empty
+    def likelyNextWordAfter(self, contextWords):
+        likelyWords = self.topNextWordsAfter(contextWords, 1)
+        if len(likelyWords) == 0:
+            return None
+        return likelyWords[0]
+
+    #@return    Returns about how many bytes the model takes up: the trie arrays, and the vocabulary's
+    #           dictionary, list and words and the wordsByCount list measured with sys.getsizeof
+    def memorySize(self):
+        size = self.wordCounts.itemsize * len(self.wordCounts)
+        for levelArrays in (self.words, self.counts[2:], self.childStarts, self.alphas):
+            for levelArray in levelArrays:
+                if levelArray is not None:
+                    size += levelArray.itemsize * len(levelArray)
+        size += sys.getsizeof(self.vocabulary.ids) + sys.getsizeof(self.vocabulary.words)
+        size += sum([sys.getsizeof(word) for word in self.vocabulary])
+        size += sys.getsizeof(self.wordsByCount) + sum([sys.getsizeof(wordId) for wordId in self.wordsByCount])
+        return size
+
+
+#@return    Returns the Katz discount of each count up to KATZ_THRESHOLD, by count
+# @levelCounts  The counts of every n-gram of one order
+def _katzDiscounts(levelCounts, smoothingMode):
+    stats = smoothing.countOfCounts(levelCounts)
+    adjusted = smoothing.adjustedCounts(stats, smoothingMode)
+    discounts = [1.0] * (KATZ_THRESHOLD + 1)
+
+    numOnce = stats[1] if len(stats) > 1 else 0
+    numAbove = stats[KATZ_THRESHOLD + 1] if len(stats) > KATZ_THRESHOLD + 1 else 0
+    if numOnce == 0:
+        return discounts
+    #the share of the counts at or below the threshold that Good Turing would leave them
+    common = float((KATZ_THRESHOLD + 1) * numAbove) / numOnce
+    if common >= 1.0:
+        return discounts
+
+    for c in range(1, min(KATZ_THRESHOLD + 1, len(adjusted))):
+        discount = (float(adjusted[c]) / c - common) / (1.0 - common)
+        #adjusted counts with gaps in them (plain Good Turing) can give nonsense; leave those counts be
+        if 0.0 < discount <= 1.0:
+            discounts[c] = discount
+    return discounts
+
+def _discount(discounts, count):
+    if count < len(discounts):
+        return discounts[count]
+    return 1.0
+
+#@return    Returns the word ids of a packed n-gram key
+def _unpack(key, n):
+    return [(key >> (ID_BITS * (n - 1 - i))) & ID_MASK for i in range(n)]
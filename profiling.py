@@ -0,0 +1,181 @@
+import collections
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Build and query instrumentation
+#
+# The model build and the queries are split into named stages. While profiling is on, every stage
+# records how long it took, how many items it handled and the peak memory of the process when it
+# finished, into a Profile and to any hooks that were added. While it's off, a stage costs one
+# function call that returns a shared do-nothing object.
+#
+# Stages:
+#   split       splitting the corpus into sentences (items: sentences)
+#   tokenize    lowercasing, stripping punctuation and stop words (items: tokens kept)
+#   count       counting words and bigrams, or n-grams (items: tokens)
+#   countShards counting a corpus in worker processes, including the merge (items: shards)
+#   sketch      counting a corpus approximately into a sketch.SketchModel (items: tokens)
+#   freeze      merging new bigram counts into the count arrays (items: distinct bigrams)
+#   spill       writing new bigram counts to a temporary file (items: distinct bigrams)
+#   mergeRuns   merging spilled bigram counts, into bigger runs or back into the count arrays
+#   update      adding new counts to a BigramModel (items: distinct new bigrams)
+#   smooth      count of counts and Good Turing adjusted counts (items: distinct counts)
+#   normalize   word and bigram probabilities (items: distinct bigrams)
+#   write       writing a compiled model (items: bytes)
+#   hash        hashing a corpus or the stop word list (items: bytes)
+#   load        loading a compiled model, compiling it if needed, or building an n-gram model
+#               (items: bytes mapped, or bytes of the n-gram model)
+#   trie        laying n-gram counts out as an ngrams.NgramModel, backoff included (items: n-grams)
+#   backoff     backoff weights of one order of n-grams (items: contexts)
+#   chance, predict, topk, sentence    answering queries (items: queries)
+#   score       scoring a batch of documents (items: tokens)
+#
+#   stats = profiling.start()
+#   bigrammer.getBigramChance("corpora/IT.txt", "information", "technology")
+#   profiling.stop()
+#   print stats.report()
+
+#The totals of one stage.
+class StageStats(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.items = 0
+        self.peakRssKb = None
+
+    def asDict(self):
+        return {"calls": self.calls, "seconds": self.seconds, "items": self.items, "peakRssKb": self.peakRssKb}
+
+
+#The totals of every stage run while profiling was on, in the order they first ran.
+class Profile(object):
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+
+    #adds one run of a stage to its totals
+    def add(self, name, seconds, items=0, peakRssKb=None):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats(name)
+        stage.calls += 1
+        stage.seconds += seconds
+        stage.items += items
+        if peakRssKb is not None:
+            stage.peakRssKb = max(stage.peakRssKb, peakRssKb)
+
+    #@return    Returns the stage totals as a dictionary of name -> dictionary, for writing as JSON
+    def asDict(self):
+        return collections.OrderedDict((name, stage.asDict()) for name, stage in self.stages.items())
+
+    #@return    Returns the stage totals as a table, one stage per line
+    def report(self):
+        lines = ["%-12s %8s %12s %14s %12s" % ("stage", "calls", "seconds", "items", "peak RSS KB")]
+        for stage in self.stages.values():
+            peakRss = "-" if stage.peakRssKb is None else str(stage.peakRssKb)
+            lines.append("%-12s %8d %12.6f %14d %12s" % (stage.name, stage.calls, stage.seconds, stage.items, peakRss))
+        return "\n".join(lines)
+
+
+#the Profile being recorded into, if any
+_profile = None
+#functions called as hook(name, seconds, items, peakRssKb) every time a stage finishes
+_hooks = []
+#whether anything is listening; checked first by every stage
+_active = False
+
+
+#A stage being timed. Set items before it finishes to record how much it handled.
+class _Stage(object):
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        record(self.name, time.time() - self.start, self.items)
+        return False
+
+
+#Stands in for a stage while profiling is off.
+class _NoStage(object):
+
+    items = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_NO_STAGE = _NoStage()
+
+
+#@return    Returns whether profiling is on
+def active():
+    return _active
+
+#Starts recording stages.
+# @profile  The Profile to add to. A new one is made if None.
+#@return    Returns the Profile being recorded into
+def start(profile=None):
+    global _profile
+    if profile is None:
+        profile = Profile()
+    _profile = profile
+    _update()
+    return profile
+
+#Stops recording stages into the Profile. Hooks keep being called until they are removed.
+#@return    Returns the Profile that was being recorded into, or None
+def stop():
+    global _profile
+    profile = _profile
+    _profile = None
+    _update()
+    return profile
+
+#Adds a function to call every time a stage finishes, as hook(name, seconds, items, peakRssKb).
+def addHook(hook):
+    _hooks.append(hook)
+    _update()
+
+def removeHook(hook):
+    _hooks.remove(hook)
+    _update()
+
+def _update():
+    global _active
+    _active = _profile is not None or len(_hooks) > 0
+
+#@return    Returns a context manager that times a stage, or one that does nothing if profiling is off
+# @items    How many items the stage handles, if known up front
+def stage(name, items=0):
+    if not _active:
+        return _NO_STAGE
+    return _Stage(name, items)
+
+#Records one run of a stage that was timed some other way.
+def record(name, seconds, items=0):
+    if not _active:
+        return
+    peakRssKb = None
+    if resource is not None:
+        peakRssKb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if _profile is not None:
+        _profile.add(name, seconds, items, peakRssKb)
+    for hook in list(_hooks):
+        hook(name, seconds, items, peakRssKb)
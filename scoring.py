@@ -0,0 +1,210 @@
+import array
+import bisect
+import collections
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import profiling
+import smoothing
+
+# Document scoring
+#
+# Scores tokenized documents against a model: the log probability of each document and its
+# perplexity. The first word of every sentence is scored by its word probability, and every word
+# after that by its probability of following the word before it, P(word2 | word1): the model's
+# smoothed bigram probabilities divided by the total of their row, so each row adds up to 1. Words
+# not in the model are left out and counted as out of vocabulary, and the word after one is scored
+# as if it started a sentence. Logs are natural logs, and perplexity is exp(-logProb / tokens).
+#
+# Documents are scored in batches of about BATCH_TOKENS tokens. With NumPy, each batch is scored in
+# a few array operations: every (word1, word2) pair of the model is packed into one sorted key
+# (word1 * vocabSize + word2), so all the pairs of a batch are found with one searchsorted, and the
+# log probabilities are summed per document with one bincount. Without NumPy the same numbers come
+# from a loop with a binary search per pair.
+
+#about how many tokens are scored at once
+BATCH_TOKENS = 1 << 16
+
+#The score of one document. perplexity is None if none of its words are in the model.
+DocumentScore = collections.namedtuple("DocumentScore", "logProb tokens oov perplexity")
+
+
+#Scores documents against one model. Made once per model, since it works out the log probability of
+#every bigram up front.
+class DocumentScorer(object):
+
+    # @model    A CompiledModel or BigramModel
+    def __init__(self, model):
+        self.modelVersion = getattr(model, "version", 0)
+        words, rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs = model.probArrays()
+        self.vocabSize = len(words)
+        self.wordIds = dict((words[wordId], wordId) for wordId in range(len(words)))
+
+        if numpy is not None:
+            self._prepareNumpy(rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs)
+        else:
+            self._preparePython(rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs)
+
+    #generates a DocumentScore for each document, in order
+    # @documents    Documents, each a list of sentences, each a list of tokens (see bigrammer.tokenize)
+    def score(self, documents):
+        batch = []
+        batchTokens = 0
+        for document in documents:
+            batch.append(document)
+            for sentence in document:
+                batchTokens += len(sentence)
+            if batchTokens >= BATCH_TOKENS:
+                for documentScore in self.scoreBatch(batch):
+                    yield documentScore
+                batch = []
+                batchTokens = 0
+        for documentScore in self.scoreBatch(batch):
+            yield documentScore
+
+    #@return    Returns a list of DocumentScores for a list of documents, scored all at once
+    def scoreBatch(self, documents):
+        if len(documents) == 0:
+            return []
+
+        #turn every token into a word id (-1 if it's not in the model), next to the id before it in
+        #its sentence (-1 at the start)
+        get = self.wordIds.get
+        wordIds = []
+        prevIds = []
+        docLengths = []
+        for document in documents:
+            docLength = 0
+            for sentence in document:
+                sentenceIds = [get(token, -1) for token in sentence]
+                wordIds.extend(sentenceIds)
+                prevIds.append(-1)
+                prevIds.extend(sentenceIds[:-1])
+                #prevIds gets one too many when a sentence is empty
+                if len(sentenceIds) == 0:
+                    prevIds.pop()
+                docLength += len(sentenceIds)
+            docLengths.append(docLength)
+
+        with profiling.stage("score", len(wordIds)):
+            if numpy is not None:
+                totals = self._scoreNumpy(wordIds, prevIds, docLengths)
+            else:
+                totals = self._scorePython(wordIds, prevIds, docLengths)
+
+        scores = []
+        for logProb, tokens, oov in totals:
+            perplexity = None
+            if tokens > 0:
+                perplexity = math.exp(-logProb / tokens)
+            scores.append(DocumentScore(logProb, tokens, oov, perplexity))
+        return scores
+
+    #NumPy ---------------------------------------------------------------------------------------------------
+
+    def _prepareNumpy(self, rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs):
+        vocabSize = self.vocabSize
+        rowStarts = smoothing.asNumpy(rowStarts).astype(numpy.int64)
+        rowLengths = numpy.diff(rowStarts)
+        rowOf = numpy.repeat(numpy.arange(vocabSize, dtype=numpy.int64), rowLengths)
+        bigramProbs = smoothing.asNumpy(bigramProbs)
+        unseenProbs = smoothing.asNumpy(unseenProbs)
+
+        #every row adds up to its observed probabilities plus one unseen probability per unseen successor
+        #(bincount gives integers when there are no weights at all, as when the model has no bigrams)
+        rowTotals = numpy.bincount(rowOf, weights=bigramProbs, minlength=vocabSize).astype(numpy.float64)
+        rowTotals += unseenProbs * (vocabSize - rowLengths)
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            logRowTotals = numpy.log(rowTotals)
+            self.logBigramProbs = numpy.log(bigramProbs) - logRowTotals[rowOf]
+            self.logUnseenProbs = numpy.log(unseenProbs) - logRowTotals
+            self.logWordProbs = numpy.log(smoothing.asNumpy(wordProbs))
+        self.pairKeys = rowOf * vocabSize + smoothing.asNumpy(bigramWords)
+
+    #@return    Returns a (logProb, tokens, oov) tuple for each document of a batch
+    def _scoreNumpy(self, wordIds, prevIds, docLengths):
+        numDocs = len(docLengths)
+        wordIds = numpy.array(wordIds, dtype=numpy.int64)
+        prevIds = numpy.array(prevIds, dtype=numpy.int64)
+        docIndex = numpy.repeat(numpy.arange(numDocs), docLengths)
+        logProbs = numpy.zeros(len(wordIds))
+
+        known = wordIds >= 0
+        starts = known & (prevIds < 0)
+        logProbs[starts] = self.logWordProbs[wordIds[starts]]
+
+        pairs = known & (prevIds >= 0)
+        pairIds = prevIds[pairs]
+        pairKeys = pairIds * self.vocabSize + wordIds[pairs]
+        pairLogProbs = self.logUnseenProbs[pairIds]
+        if len(self.pairKeys) > 0:
+            indexes = numpy.minimum(numpy.searchsorted(self.pairKeys, pairKeys), len(self.pairKeys) - 1)
+            found = self.pairKeys[indexes] == pairKeys
+            pairLogProbs = numpy.where(found, self.logBigramProbs[indexes], pairLogProbs)
+        logProbs[pairs] = pairLogProbs
+
+        docLogProbs = numpy.bincount(docIndex[known], weights=logProbs[known], minlength=numDocs)
+        docTokens = numpy.bincount(docIndex[known], minlength=numDocs)
+        docOov = numpy.bincount(docIndex[~known], minlength=numDocs)
+        return zip(docLogProbs.tolist(), docTokens.tolist(), docOov.tolist())
+
+    #Plain Python ---------------------------------------------------------------------------------------------
+
+    def _preparePython(self, rowStarts, bigramWords, bigramProbs, unseenProbs, wordProbs):
+        vocabSize = self.vocabSize
+        self.rowStarts = rowStarts
+        self.bigramWords = bigramWords
+        self.logBigramProbs = array.array('d')
+        self.logUnseenProbs = array.array('d')
+        for wordId in range(vocabSize):
+            start = rowStarts[wordId]
+            end = rowStarts[wordId + 1]
+            rowTotal = unseenProbs[wordId] * (vocabSize - (end - start))
+            for index in range(start, end):
+                rowTotal += bigramProbs[index]
+            logRowTotal = _log(rowTotal)
+            for index in range(start, end):
+                self.logBigramProbs.append(_log(bigramProbs[index]) - logRowTotal)
+            self.logUnseenProbs.append(_log(unseenProbs[wordId]) - logRowTotal)
+        self.logWordProbs = array.array('d', [_log(prob) for prob in wordProbs])
+
+    def _scorePython(self, wordIds, prevIds, docLengths):
+        bigramWords = self.bigramWords
+        rowStarts = self.rowStarts
+        totals = []
+        docStart = 0
+        for docLength in docLengths:
+            logProb = 0.0
+            tokens = oov = 0
+            for position in range(docStart, docStart + docLength):
+                wordId = wordIds[position]
+                prevId = prevIds[position]
+                if wordId < 0:
+                    oov += 1
+                    continue
+                tokens += 1
+                if prevId < 0:
+                    logProb += self.logWordProbs[wordId]
+                    continue
+                start = rowStarts[prevId]
+                end = rowStarts[prevId + 1]
+                index = bisect.bisect_left(bigramWords, wordId, start, end)
+                if index < end and bigramWords[index] == wordId:
+                    logProb += self.logBigramProbs[index]
+                else:
+                    logProb += self.logUnseenProbs[prevId]
+            totals.append((logProb, tokens, oov))
+            docStart += docLength
+        return totals
+
+
+#@return    Returns the natural log of a probability, or -infinity for 0
+def _log(prob):
+    if prob <= 0:
+        return float("-inf")
+    return math.log(prob)
@@ -1,49 +1,135 @@
 #From ps4 2.5 function II - Sentence splitter
 # - Logan Mitchell
 
+import os
+
+#how much of the file is read at a time
+CHUNK_SIZE = 1 << 16
+
+#characters that end a sentence when they end a word
+SENTENCE_ENDS = ".!?"
+
 #returns a list of sentences made from the give corpus.
+#(this holds the whole corpus in memory; use iter_sentences for large files.)
 def sen_splitter(fileName):
-    #try:
+        return list(iter_sentences(fileName))
+
+#generates the sentences of the given corpus one at a time.
+#the file is read in fixed size chunks, so only the current sentence is ever held in memory.
+#a sentence is terminated by a word ending in . ! or ?, and any trailing words with no
+#terminating punctuation are generated as a last sentence.
+# @fileName     The file to read
+# @chunkSize    How many bytes to read at a time
+# @start        Where in the file to start reading (should be a sentence boundary)
+# @end          Where in the file to stop reading, or None to read to the end
+def iter_sentences(fileName, chunkSize=CHUNK_SIZE, start=0, end=None):
         #read the file data from the file
         try:
                 senFile = open(fileName, "r")
         except:
                 print "ERROR: File '" + fileName + "' not found."
-                return []
-                
-        punctuationList = [".","!","?"]
-
-        fileString = ""
-
-        #read each line in the file and add it to the master string
-        for line in senFile:
-            fileString += line
-
-        senFile.close()
-        #split the string by spaces to get all the words
-        wordList = fileString.split()
-
-        #run through and make sentences from the word list.
-        #we will determine a sentence to be terminated by anything in the
-        #punctuation list.
-        senList = []
-
-        #keep a current sentence to be written to the sentence list.
-        curSentence = ""
-        for word in wordList:
-            if word != "\n": #ignore newlines
-                #check if this word ends in punctuation.
-                finalChar = word[len(word)-1:]
+                return
+
+        try:
+                for sentence in split_sentences(_read_chunks(senFile, chunkSize, start, end)):
+                        yield sentence
+        finally:
+                senFile.close()
+
+#generates the sentences of a string of text, split the same way as iter_sentences.
+def iter_text_sentences(text):
+        return split_sentences([text])
+
+#generates the sentences made from a sequence of text chunks. A chunk can end anywhere, even in
+#the middle of a word; only the chunks joined together matter.
+def split_sentences(chunks):
+        #keep the words of the current sentence until it ends.
+        curSentence = []
+        #a word cut in half by the end of a chunk, to be finished by the next chunk.
+        partialWord = ""
+
+        for chunk in chunks:
+                if len(chunk) == 0:
+                        continue
+                chunk = partialWord + chunk
+                #split the chunk by whitespace to get all the words
+                wordList = chunk.split()
+
+                #if the chunk doesn't end on whitespace, its last word may carry on in the next chunk
+                partialWord = ""
+                if len(wordList) > 0 and not chunk[-1].isspace():
+                        partialWord = wordList.pop()
+
+                for word in wordList:
+                        curSentence.append(word)
+                        #check if this word ends in punctuation.
+                        #if it does, it ends the sentence.
+                        finalChar = word[-1]
+                        if finalChar == "." or finalChar == "?" or finalChar == "!":
+                                yield " ".join(curSentence) + "\n"
+                                curSentence = []
+
+        if len(partialWord) > 0:
+                curSentence.append(partialWord)
+                finalChar = partialWord[-1]
                 if finalChar == "." or finalChar == "?" or finalChar == "!":
-                    #if our word ends in punctuation, it ends the sentence.
-                    #add the sentence to the list and clear the current sentence.
-                    curSentence += word + "\n"
-                    senList.append(curSentence)
-                    curSentence = ""
-                else:
-                    #if we don't end in punctuation, just continue adding to the current sentence.
-                    curSentence += word + " "
-                
-        return senList
-        
-        
+                        yield " ".join(curSentence) + "\n"
+                        curSentence = []
+
+        #whatever is left had no terminating punctuation, but is still a sentence.
+        if len(curSentence) > 0:
+                yield " ".join(curSentence)
+
+#generates the chunks of an open file between start and end
+def _read_chunks(senFile, chunkSize, start, end):
+        senFile.seek(start)
+        position = start
+        chunk = senFile.read(_chunk_length(chunkSize, position, end))
+        while chunk:
+                position += len(chunk)
+                yield chunk
+                chunk = senFile.read(_chunk_length(chunkSize, position, end))
+
+#how much to read next, without going past the end
+def _chunk_length(chunkSize, position, end):
+        if end is None:
+                return chunkSize
+        return max(0, min(chunkSize, end - position))
+
+#finds the first sentence boundary at or after a position in a file: the first whitespace
+#character that follows a . ! or ? (the end of a word that ends a sentence).
+#@return    Returns the position of the boundary, or the file size if there is none
+def find_sentence_boundary(fileName, position, chunkSize=CHUNK_SIZE):
+        senFile = open(fileName, "r")
+        try:
+                #keep one character before the position, to see if it ends a sentence
+                readFrom = max(0, position - 1)
+                senFile.seek(readFrom)
+                chunk = senFile.read(chunkSize)
+                while chunk:
+                        for i in range(position - readFrom, len(chunk)):
+                                if i > 0 and chunk[i].isspace() and chunk[i-1] in SENTENCE_ENDS:
+                                        return readFrom + i
+                        #carry the last character over, in case the boundary straddles the chunks
+                        readFrom += len(chunk) - 1
+                        position = readFrom + 1
+                        chunk = chunk[-1] + senFile.read(chunkSize)
+                        if len(chunk) == 1:
+                                break
+                return readFrom + len(chunk)
+        finally:
+                senFile.close()
+
+#splits a file into byte ranges that start and end on sentence boundaries, so each range can
+#be read with iter_sentences on its own and gives the same sentences as reading the whole file.
+# @numShards    How many ranges to aim for; fewer are returned if the file is short on sentences
+#@return    Returns a list of (start, end) pairs covering the whole file
+def shard_file(fileName, numShards):
+        fileSize = os.path.getsize(fileName)
+        boundaries = [0]
+        for shard in range(1, numShards):
+                boundary = find_sentence_boundary(fileName, fileSize * shard // numShards)
+                if boundary > boundaries[-1] and boundary < fileSize:
+                        boundaries.append(boundary)
+        boundaries.append(fileSize)
+        return [(boundaries[i], boundaries[i+1]) for i in range(len(boundaries) - 1)]
@@ -0,0 +1,354 @@
+import argparse
+import asynchat
+import asyncore
+import json
+import math
+import os
+import socket
+import threading
+
+import bigrammer
+import generate
+import profiling
+
+# Bigrammer query server
+#
+# Loads one or more corpora once and answers queries about them over a TCP or Unix socket, so
+# callers don't pay for a model load on every query. Python 2 has no asyncio, so the server runs on
+# the standard library's asyncore event loop, which handles any number of clients in one thread.
+#
+# The protocol is one JSON object per line each way. A request names an operation and its
+# arguments, and may carry an "id" that is copied into the response:
+#
+#   {"id": 1, "op": "chance", "corpus": "corpora/IT.txt", "word1": "information", "word2": "technology"}
+#   {"id": 1, "result": 7.903529679083505e-05}
+#
+# Operations:
+#   chance      word1, word2    Probability of the bigram (null if either word is not in the corpus)
+#   predict     word            Most likely word to follow a word (null if there is none)
+#   topk        word, k         List of up to k [word, probability] pairs, most likely first
+#   sentence                    A likely sentence, like printLikelySen
+#   sentences   count, and optionally mode ("sample", "greedy" or "beam"), length, start,
+#               temperature, beamWidth and seed: a list of generated sentences
+#   corpora                     The loaded corpora
+#
+# "corpus" can be left out when only one corpus is loaded. Failed requests get {"error": message},
+# including words that aren't strings and counts, lengths, k, beamWidth or temperature out of range
+# (see MAX_*).
+#
+# A background thread watches the corpus files and the stop word file. When a corpus changes, its
+# model is rebuilt in that thread and then swapped in with a single assignment, so queries never wait
+# on a rebuild; queries already holding the old model finish with it. When the stop words change,
+# every model is rebuilt that way.
+
+#how often the corpus files are checked for changes, in seconds
+RELOAD_INTERVAL = 5.0
+
+#the longest request line accepted, in bytes
+MAX_REQUEST_LENGTH = 1 << 16
+
+#the most sentences one request can ask for, the most words each can have, and the most words all of
+#them can have together, so one request can't hold up the event loop for long
+MAX_SENTENCES = 10000
+MAX_SENTENCE_LENGTH = 100
+MAX_SENTENCE_WORDS = 100000
+
+#the widest beam and the most predictions one request can ask for
+MAX_BEAM_WIDTH = 64
+MAX_TOPK = 1000
+
+#the highest sampling temperature one request can ask for (0 always takes the most likely word)
+MAX_TEMPERATURE = 100.0
+
+#generation modes by name
+GENERATION_MODES = {"greedy": generate.GREEDY, "sample": generate.SAMPLE, "beam": generate.BEAM}
+
+
+#Holds the loaded model of every corpus and keeps them up to date.
+class ModelSet(object):
+
+    # @corpora          Filenames of the corpora to load
+    # @reloadInterval   Seconds between checks for changed corpora
+    def __init__(self, corpora, reloadInterval=RELOAD_INTERVAL):
+        self.reloadInterval = reloadInterval
+        self.corpusStats = {}
+        self.stopwordsStat = _fileStat(bigrammer.STOPWORDS_FILENAME)
+        self.models = {}
+        for corpusFilename in corpora:
+            self.models[corpusFilename] = self._load(corpusFilename)
+
+        self.stopped = threading.Event()
+        self.watcher = None
+
+    #@return    Returns the model of a corpus. Raises KeyError if the corpus isn't loaded, and ValueError
+    #           if no corpus is given while more than one is loaded.
+    def get(self, corpusFilename=None):
+        #take one reference to the current models, so a swap can't happen half way through
+        models = self.models
+        if corpusFilename is None:
+            if len(models) != 1:
+                raise ValueError("corpus must be given when more than one is loaded")
+            return models.values()[0]
+        return models[corpusFilename]
+
+    def corpora(self):
+        return sorted(self.models)
+
+    #starts checking for changed corpora in a background thread
+    def startWatching(self):
+        self.watcher = threading.Thread(target=self._watch, name="bigrammer-reload")
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def stopWatching(self):
+        self.stopped.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
+
+    #Rebuilds the model of every corpus that changed since it was loaded, or of every corpus if the stop
+    #word file changed, since the models are counted without the stop words.
+    #@return    Returns the corpora that were reloaded
+    def reloadChanged(self):
+        reloaded = []
+        stopwordsStat = _fileStat(bigrammer.STOPWORDS_FILENAME)
+        stopwordsChanged = stopwordsStat != self.stopwordsStat
+        self.stopwordsStat = stopwordsStat
+        for corpusFilename in self.corpora():
+            if not stopwordsChanged and _fileStat(corpusFilename) == self.corpusStats.get(corpusFilename):
+                continue
+            model = self._load(corpusFilename)
+
+            #swap in a new dictionary rather than changing the one queries may be reading
+            models = dict(self.models)
+            models[corpusFilename] = model
+            self.models = models
+            reloaded.append(corpusFilename)
+        return reloaded
+
+    def _watch(self):
+        while not self.stopped.wait(self.reloadInterval):
+            try:
+                for corpusFilename in self.reloadChanged():
+                    print "Reloaded '" + corpusFilename + "'."
+            except (IOError, OSError, MemoryError), error:
+                print "Unable to reload corpus: " + str(error)
+
+    def _load(self, corpusFilename):
+        #note the file before loading, so a change made while loading is picked up next time
+        self.corpusStats[corpusFilename] = _fileStat(corpusFilename)
+        model = bigrammer.loadModel(corpusFilename)
+        if model is None:
+            raise IOError("unable to load corpus '" + corpusFilename + "'")
+        return model
+
+
+#@return    Returns what is checked to see if a file changed, or None if it doesn't exist
+def _fileStat(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+#Answers one request.
+# @models   The ModelSet to query
+# @request  The decoded request
+#@return    Returns the result of the request. Raises KeyError, ValueError or TypeError for bad requests.
+def answerRequest(models, request):
+    op = request["op"]
+    if op == "corpora":
+        return models.corpora()
+
+    model = models.get(request.get("corpus"))
+    if op == "chance":
+        pair = (_word(request, "word1"), _word(request, "word2"))
+        return list(bigrammer.getBigramChances(model, [pair]))[0][2]
+    if op == "predict":
+        predictions = list(bigrammer.predictNextWords(model, [_word(request, "word")], 1))[0][1]
+        if len(predictions) == 0:
+            return None
+        return predictions[0][0]
+    if op == "topk":
+        k = _integer(request, "k", 1, 1, MAX_TOPK)
+        return [list(pair) for pair in list(bigrammer.predictNextWords(model, [_word(request, "word")], k))[0][1]]
+    if op == "sentence":
+        if model.vocabSize == 0:
+            return ""
+        return bigrammer.makeLikelySen(model)
+    if op == "sentences":
+        count = _integer(request, "count", None, 0, MAX_SENTENCES)
+        length = _integer(request, "length", generate.SENTENCE_LENGTH, 1, MAX_SENTENCE_LENGTH)
+        if count * length > MAX_SENTENCE_WORDS:
+            raise ValueError("at most " + str(MAX_SENTENCE_WORDS) + " words can be asked for at once")
+        mode = GENERATION_MODES[request.get("mode", "sample")]
+        start = None
+        if request.get("start") is not None:
+            start = _word(request, "start").lower()
+        return bigrammer.generateSentences(model, count, mode, length, start,
+                                           _number(request, "temperature", 1.0, 0.0, MAX_TEMPERATURE),
+                                           _integer(request, "beamWidth", generate.BEAM_WIDTH, 1, MAX_BEAM_WIDTH),
+                                           request.get("seed"))
+    raise ValueError("unknown op " + json.dumps(op))
+
+#corpus words are byte strings, so query with byte strings too
+#@return    Returns a word argument of a request. Raises ValueError if it isn't a string.
+def _word(request, name):
+    value = request[name]
+    if not isinstance(value, basestring):
+        raise ValueError(name + " must be a string")
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+#@return    Returns an integer argument of a request, or default if it's left out. Raises ValueError if
+#           it isn't an integer from low to high.
+def _integer(request, name, default, low, high):
+    return int(_number(request, name, default, low, high))
+
+#@return    Returns a number argument of a request, or default if it's left out. Raises ValueError if
+#           it isn't a number from low to high (so never NaN or infinite).
+def _number(request, name, default, low, high):
+    value = request.get(name, default)
+    if value is None:
+        raise KeyError(name)
+    if isinstance(value, bool) or not isinstance(value, (int, long, float, basestring)):
+        raise ValueError(name + " must be a number")
+    try:
+        value = float(value)
+    except OverflowError:
+        value = float("inf")
+    if math.isnan(value) or value < low or value > high:
+        raise ValueError(name + " must be from " + str(low) + " to " + str(high))
+    return value
+
+
+#One client connection. Reads a request per line and writes a response per line.
+class QueryHandler(asynchat.async_chat):
+
+    def __init__(self, sock, models, socketMap):
+        asynchat.async_chat.__init__(self, sock, socketMap)
+        self.models = models
+        self.buffer = []
+        self.bufferLength = 0
+        self.set_terminator("\n")
+
+    def collect_incoming_data(self, data):
+        self.bufferLength += len(data)
+        if self.bufferLength > MAX_REQUEST_LENGTH:
+            self.push(json.dumps({"error": "request too long"}) + "\n")
+            self.close_when_done()
+            return
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        line = "".join(self.buffer).strip()
+        self.buffer = []
+        self.bufferLength = 0
+        if len(line) == 0:
+            return
+
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            if "id" in request:
+                response["id"] = request["id"]
+            response["result"] = answerRequest(self.models, request)
+        except KeyError, error:
+            response.pop("result", None)
+            response["error"] = "missing or unknown " + str(error)
+        except (ValueError, TypeError), error:
+            response.pop("result", None)
+            response["error"] = str(error)
+        except Exception, error:
+            #any other failure is a bug, but it only fails this request, not the whole connection
+            response.pop("result", None)
+            response["error"] = "internal error: " + repr(error)
+
+        try:
+            self.push(json.dumps(response) + "\n")
+        except UnicodeDecodeError:
+            self.push(json.dumps({"id": response.get("id"), "error": "result is not valid UTF-8"}) + "\n")
+
+
+#Listens for clients and hands each one to a QueryHandler.
+class QueryServer(asyncore.dispatcher):
+
+    # @models   The ModelSet to answer queries from
+    # @address  A (host, port) pair to listen on TCP, or a path to listen on a Unix socket
+    def __init__(self, models, address):
+        self.socketMap = {}
+        asyncore.dispatcher.__init__(self, map=self.socketMap)
+        self.models = models
+
+        if isinstance(address, basestring):
+            if os.path.exists(address):
+                os.remove(address)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.address = self.socket.getsockname()
+        self.listen(128)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            QueryHandler(pair[0], self.models, self.socketMap)
+
+    #runs the event loop until stopped (or interrupted)
+    def serveForever(self):
+        self.models.startWatching()
+        try:
+            asyncore.loop(timeout=1.0, use_poll=True, map=self.socketMap)
+        finally:
+            self.models.stopWatching()
+
+    def stop(self):
+        for dispatcher in self.socketMap.values():
+            dispatcher.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bigram queries about one or more corpora.")
+    parser.add_argument("corpora", nargs="+", help="corpus files to load")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8642, help="TCP port to listen on (default 8642)")
+    parser.add_argument("--socket", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time spent in each build and query stage when the server stops")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="seconds between checks for changed corpora (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    stats = None
+    if args.profile:
+        stats = profiling.start()
+
+    try:
+        models = ModelSet(args.corpora, args.reload_interval)
+    except (IOError, MemoryError), error:
+        print "Unable to start server: " + str(error)
+        return 1
+
+    address = args.socket if args.socket else (args.host, args.port)
+    server = QueryServer(models, address)
+    print "Serving " + ", ".join(models.corpora()) + " on " + str(server.address)
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
+
+    if stats is not None:
+        profiling.stop()
+        print stats.report()
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import array
+import heapq
+import math
+import sys
+
+# Approximate counting in fixed memory
+#
+# For corpora whose exact counts don't fit in memory. Word and bigram counts go into count-min
+# sketches: depth rows of width counters, where each key adds to one counter per row and its count
+# is estimated as the smallest of its counters. Estimates are never too low, and are too high by at
+# most (e / width) * (total count) with probability 1 - e^-depth. Updates are conservative (only
+# the counters that are at the minimum go up), which keeps the overestimates smaller still.
+#
+# Sketches can't list what they hold, so next to them a heavy hitter table keeps the topN most
+# frequent successors of each of the maxWords most frequent words. Once a word is kept, its
+# occurrences are counted exactly, and so are its successors once they are in its table. As in the
+# Space-Saving algorithm, each successor also remembers how many times it may have been missed before
+# it got in (its sketch estimate then), and the successor with the fewest possible occurrences is the
+# one replaced when a more frequent one comes along. Predictions and top-k rank successors by their
+# exact counts. Memory is set by width, depth, topN and maxWords alone, not by the corpus.
+#
+# Probabilities are P(word2 | word1) = count(word1 word2) / count(word1), unsmoothed: without the
+# exact counts there is no count of counts to smooth with, or list of every bigram to normalize over.
+
+#default sketch width; the error is about e / width of the total count
+SKETCH_WIDTH = 1 << 18
+
+#default sketch depth; estimates are within the error with probability 1 - e^-depth
+SKETCH_DEPTH = 4
+
+#default number of successors kept per word
+TOP_N = 20
+
+#default number of words whose successors are kept
+MAX_WORDS = 10000
+
+#hash values are folded into this many bits before being split into the two row hashes
+HASH_MASK = (1 << 64) - 1
+
+
+#A count-min sketch with conservative updates.
+class CountMinSketch(object):
+
+    # @width    Counters per row
+    # @depth    Number of rows
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = array.array('L', [0]) * (width * depth)
+        self.total = 0
+        self.rows = [(row, row * width) for row in range(depth)] #(row, position of its first counter)
+
+    #@return    Returns the counter position of a key in each row
+    def _positions(self, key):
+        #double hashing: row i uses h1 + i * h2, which is as good as depth independent hashes
+        hashValue = hash(key) & HASH_MASK
+        h1 = hashValue & 0xFFFFFFFF
+        h2 = (hashValue >> 32) | 1
+        width = self.width
+        return [start + (h1 + row * h2) % width for row, start in self.rows]
+
+    #Adds to the count of a key.
+    #@return    Returns the key's new estimated count
+    def add(self, key, count=1):
+        counters = self.counters
+        positions = self._positions(key)
+        estimate = min([counters[position] for position in positions]) + count
+        for position in positions:
+            if counters[position] < estimate:
+                counters[position] = estimate
+        self.total += count
+        return estimate
+
+    #@return    Returns the estimated count of a key. It is never lower than the true count.
+    def estimate(self, key):
+        counters = self.counters
+        return min([counters[position] for position in self._positions(key)])
+
+    #@return    Returns how far over the true count an estimate may be, at the confidence given by confidence()
+    def errorBound(self):
+        return math.e / self.width * self.total
+
+    #@return    Returns the probability that an estimate is within errorBound() of the true count
+    def confidence(self):
+        return 1.0 - math.exp(-self.depth)
+
+    def memorySize(self):
+        return self.counters.itemsize * len(self.counters)
+
+
+#An approximate bigram model made of two count-min sketches and a heavy hitter table.
+#Queries work like CompiledModel's, with probabilities as described at the top of this file.
+class SketchModel(object):
+
+    # @width    Counters per sketch row
+    # @depth    Rows per sketch
+    # @topN     Successors kept per word
+    # @maxWords Words whose successors are kept
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, topN=TOP_N, maxWords=MAX_WORDS):
+        self.wordSketch = CountMinSketch(width, depth)
+        self.bigramSketch = CountMinSketch(width, depth)
+        self.topN = topN
+        self.maxWords = maxWords
+        self.successors = {} #word1 -> {word2: [count since it was kept, times it may have been missed]}
+        self.keptCounts = {} #word1 -> count since it was kept, for the kept words
+        self.smallestSuccessor = {} #word1 -> fewest possible occurrences of its successors, once it has topN
+        self.keptWords = [] #heap of (count, word) for the kept words; counts may have gone up since
+
+    #Counting ------------------------------------------------------------------------------------------------
+
+    #Counts the words and bigrams of one sentence. Bigrams never cross sentence ends.
+    def addSentence(self, tokens):
+        keptCounts = self.keptCounts
+        prevWord = None
+        for token in tokens:
+            count = self.wordSketch.add(token)
+            if prevWord is not None:
+                estimate = self.bigramSketch.add((prevWord, token))
+                if prevWord in keptCounts:
+                    self._keepSuccessor(prevWord, token, estimate)
+            #after the bigram, so a repeated word can't count as its own successor before it is kept
+            if token in keptCounts:
+                keptCounts[token] += 1
+            else:
+                self._keepWord(token, count)
+            prevWord = token
+
+    #Counts a bigram of a kept word in the heavy hitter table, if it is in (or gets into) the word's
+    #successors.
+    # @estimate     The bigram's sketch estimate, this occurrence included
+    def _keepSuccessor(self, word1, word2, estimate):
+        successors = self.successors[word1]
+        entry = successors.get(word2)
+        if entry is not None:
+            entry[0] += 1
+        elif len(successors) < self.topN:
+            successors[word2] = [1, estimate - 1]
+        elif estimate > self.smallestSuccessor[word1]:
+            #the table is full: replace the successor with the fewest possible occurrences, since this
+            #one may now have more
+            smallest = min(successors, key=lambda word: (sum(successors[word]), word))
+            del successors[smallest]
+            successors[word2] = [1, estimate - 1]
+        else:
+            return
+
+        if len(successors) == self.topN:
+            self.smallestSuccessor[word1] = min([sum(entry) for entry in successors.itervalues()])
+
+    #Starts keeping a word and its successors if there is room, or if it is more frequent than the
+    #least frequent kept word, which it then replaces.
+    # @count    The word's sketch estimate, this occurrence included
+    def _keepWord(self, word, count):
+        keptWords = self.keptWords
+        if len(self.successors) < self.maxWords:
+            heapq.heappush(keptWords, (count, word))
+            self.successors[word] = {}
+            self.keptCounts[word] = 1
+            return
+
+        #counts in the heap can only be too low, so a word no more frequent than the top of the heap
+        #is no more frequent than any kept word
+        if count <= keptWords[0][0]:
+            return
+
+        #bring the top of the heap up to date until it's the real least frequent kept word
+        while True:
+            keptCount, keptWord = keptWords[0]
+            currentCount = self.wordSketch.estimate(keptWord)
+            if currentCount == keptCount:
+                break
+            heapq.heapreplace(keptWords, (currentCount, keptWord))
+        if count <= keptCount:
+            return
+
+        heapq.heapreplace(keptWords, (count, word))
+        del self.successors[keptWord]
+        del self.keptCounts[keptWord]
+        self.smallestSuccessor.pop(keptWord, None)
+        self.successors[word] = {}
+        self.keptCounts[word] = 1
+
+    #Queries -------------------------------------------------------------------------------------------------
+
+    #the number of words whose successors are kept
+    @property
+    def vocabSize(self):
+        return len(self.successors)
+
+    #generates every word whose successors are kept, in sorted order
+    def vocabulary(self):
+        return iter(sorted(self.successors))
+
+    #@return    Returns the estimated count of a word
+    def wordCount(self, word):
+        return self.wordSketch.estimate(word)
+
+    #@return    Returns the estimated count of a bigram
+    def bigramFreq(self, word1, word2):
+        return self.bigramSketch.estimate((word1, word2))
+
+    #@return    Returns a (lowest, highest) range the true count of a bigram is in, at the
+    #           confidence given by confidence()
+    def bigramFreqBounds(self, word1, word2):
+        estimate = self.bigramFreq(word1, word2)
+        return max(0, int(math.ceil(estimate - self.bigramSketch.errorBound()))), estimate
+
+    #@return    Returns the estimated P(word2 | word1), or None if word1 never occurs
+    def bigramProb(self, word1, word2):
+        wordCount = self.wordCount(word1)
+        if wordCount == 0:
+            return None
+        return min(1.0, float(self.bigramFreq(word1, word2)) / wordCount)
+
+    #@return    Returns the most frequent kept word, or '' if nothing was counted
+    def likelyWord(self):
+        likelyWord = ''
+        likelyCount = 0
+        for word in self.vocabulary():
+            count = self.wordCount(word)
+            if count > likelyCount:
+                likelyWord = word
+                likelyCount = count
+        return likelyWord
+
+    #@return    Returns a (word, probability) pair for the most likely word to follow a word, or None
+    def likelyNextWord(self, word):
+        likelyWords = self.topNextWords(word, 1)
+        if len(likelyWords) == 0:
+            return None
+        return likelyWords[0]
+
+    #@return    Returns a list of up to k (word, probability) pairs for the kept successors of a word,
+    #           most likely first, with ties going to the first word alphabetically. Probabilities are
+    #           exact counts since the word was kept: (count of the bigram) / (count of the word), so
+    #           a successor that got into the table late can only be under, never over. Only the topN
+    #           successors of a word are kept, so k can't usefully be larger than that.
+    def topNextWords(self, word, k):
+        successors = self.successors.get(word)
+        if not successors:
+            return []
+        wordCount = float(self.keptCounts[word])
+        ranked = sorted(successors, key=lambda nextWord: (-successors[nextWord][0], nextWord))[:k]
+        return [(nextWord, successors[nextWord][0] / wordCount) for nextWord in ranked]
+
+    #@return    Returns a dictionary of the error bounds of the counts
+    def errorBounds(self):
+        return {
+            "wordError": self.wordSketch.errorBound(),
+            "bigramError": self.bigramSketch.errorBound(),
+            "confidence": self.bigramSketch.confidence(),
+            "totalWords": self.wordSketch.total,
+            "totalBigrams": self.bigramSketch.total,
+        }
+
+    #@return    Returns about how many bytes the model takes up. The sketches are fixed; the heavy
+    #           hitter table grows to at most maxWords * topN entries, and is measured with
+    #           sys.getsizeof: its dictionaries, heap, words and counts, each word counted once.
+    def memorySize(self):
+        size = self.wordSketch.memorySize() + self.bigramSketch.memorySize()
+        size += sys.getsizeof(self.successors) + sys.getsizeof(self.keptCounts) + sys.getsizeof(self.smallestSuccessor)
+        size += sys.getsizeof(self.keptWords)
+        words = {} #id -> word, so words kept in more than one place are only counted once
+        for word1, successors in self.successors.iteritems():
+            words[id(word1)] = word1
+            size += sys.getsizeof(successors)
+            for word2, entry in successors.iteritems():
+                words[id(word2)] = word2
+                size += sys.getsizeof(entry) + sum([sys.getsizeof(count) for count in entry])
+        for keptWord in self.keptWords:
+            size += sys.getsizeof(keptWord) + sys.getsizeof(keptWord[0])
+        size += sum([sys.getsizeof(count) for count in self.keptCounts.itervalues()])
+        size += sum([sys.getsizeof(count) for count in self.smallestSuccessor.itervalues()])
+        return size + sum([sys.getsizeof(word) for word in words.itervalues()])
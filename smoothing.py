@@ -0,0 +1,268 @@
+import array
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Smoothing and normalization engine
+#
+# Works on whole arrays of counts at once: count-of-counts, Good Turing adjusted counts, and the
+# normalized word and bigram probabilities. When NumPy is installed the array work is done with
+# it; otherwise the same results come from plain Python loops. Results are always returned as
+# array.array('d') so callers don't need to know which was used.
+
+#Smoothing modes
+#GOOD_TURING is the bigrammer's original discounting: c* = (c+1) * N(c+1) / N(c).
+#SIMPLE_GOOD_TURING is Gale and Sampson's Simple Good-Turing, which fits log(N(c)) against log(c)
+#so that gaps in the counts (N(c+1) == 0) don't zero out the adjusted counts.
+GOOD_TURING = 0
+SIMPLE_GOOD_TURING = 1
+
+#how many standard deviations the Turing and log-linear estimates may differ by before
+#Simple Good-Turing switches to the log-linear one
+SGT_CONFIDENCE = 1.96
+
+
+#turns an array.array or other sequence into a NumPy array, without copying arrays
+def asNumpy(values):
+    if isinstance(values, array.array):
+        if len(values) == 0:
+            return numpy.zeros(0, dtype=values.typecode)
+        return numpy.frombuffer(values, dtype=values.typecode)
+    return numpy.asarray(values)
+
+#turns a NumPy array back into an array.array('d')
+def _toArray(values):
+    result = array.array('d')
+    result.fromstring(numpy.ascontiguousarray(values, dtype=numpy.float64).tostring())
+    return result
+
+
+#Counts how many bigrams occur each number of times, in one pass.
+# @rawCounts    The raw count of every stored bigram
+# @numUnseen    How many bigrams of count 0 exist that are not in rawCounts (N0)
+#@return    Returns a list with the count C as index and the number of bigrams with that count (Nc) as value
+def countOfCounts(rawCounts, numUnseen=0):
+    if numpy is not None and isinstance(rawCounts, array.array):
+        stats = [int(n) for n in numpy.bincount(asNumpy(rawCounts).astype(numpy.int64), minlength=1)]
+    else:
+        stats = [0]
+        for count in rawCounts:
+            if count >= len(stats):
+                stats.extend([0] * (count + 1 - len(stats)))
+            stats[count] += 1
+    stats[0] += numUnseen
+    return stats
+
+#Works out the adjusted count for every raw count.
+# @stats    Count of counts, as returned by countOfCounts
+# @mode     GOOD_TURING or SIMPLE_GOOD_TURING
+#@return    Returns a list with the raw count as index and the adjusted count as value
+def adjustedCounts(stats, mode=GOOD_TURING):
+    if mode == SIMPLE_GOOD_TURING:
+        return simpleGoodTuringCounts(stats)
+    return goodTuringCounts(stats)
+
+#Good Turing discounting, exactly as the bigrammer has always done it:
+# c* = (c+1) * Nc+1 / Nc
+#A count whose Nc is 0 is set to 0, and the largest count (which has no Nc+1) keeps Nc as its value.
+def goodTuringCounts(stats):
+    newCounts = list(stats)
+
+    #for each frequency... (Use -1 due to using c+1 and c being an index)
+    for c in range(0, len(stats) - 1):
+        #avoid division by 0 error
+        if stats[c] != 0:
+            newCounts[c] = float((c+1)*stats[c+1])/stats[c]
+        else:
+            newCounts[c] = 0
+
+    return newCounts
+
+#Simple Good-Turing (Gale and Sampson, 1995).
+#Nc is smoothed by fitting log(Zc) = a + b*log(c), where Zc spreads each Nc over the gap to its
+#neighbouring counts. Small counts use the plain Turing estimate for as long as it is significantly
+#different from the fitted one; after that the fitted estimate is used. The adjusted counts of seen
+#bigrams are then scaled so that they leave N1 worth of count for the unseen ones, which each get N1/N0.
+def simpleGoodTuringCounts(stats):
+    seen = [c for c in range(1, len(stats)) if stats[c] > 0]
+    newCounts = [0.0] * len(stats)
+    if len(seen) == 0:
+        return newCounts
+
+    #average each Nc over the distance to the neighbouring counts that occur
+    logCounts = []
+    logZ = []
+    for j in range(len(seen)):
+        c = seen[j]
+        prev = seen[j-1] if j > 0 else 0
+        if j + 1 < len(seen):
+            following = seen[j+1]
+        else:
+            following = 2 * c - prev
+        logCounts.append(math.log(c))
+        logZ.append(math.log(2.0 * stats[c] / (following - prev)))
+
+    #least squares fit of the log-linear line. with a single point nothing can be fitted,
+    #so use a slope of -1, which leaves the counts as they are.
+    if len(seen) > 1:
+        meanX = sum(logCounts) / len(logCounts)
+        meanY = sum(logZ) / len(logZ)
+        sxy = sum([(x - meanX) * (y - meanY) for x, y in zip(logCounts, logZ)])
+        sxx = sum([(x - meanX) ** 2 for x in logCounts])
+        slope = sxy / sxx
+    else:
+        slope = -1.0
+
+    #log-linear estimate: c* = (c+1) * S(c+1) / S(c) = c * (1 + 1/c)^(slope+1)
+    def fitted(c):
+        return c * (1.0 + 1.0 / c) ** (slope + 1)
+
+    useFitted = False
+    for c in range(1, len(stats)):
+        if not useFitted and stats[c] > 0 and c + 1 < len(stats) and stats[c+1] > 0:
+            turing = float((c+1) * stats[c+1]) / stats[c]
+            spread = SGT_CONFIDENCE * math.sqrt(float(c+1) ** 2 * stats[c+1] / stats[c] ** 2 * (1.0 + float(stats[c+1]) / stats[c]))
+            if abs(turing - fitted(c)) > spread:
+                newCounts[c] = turing
+                continue
+        useFitted = True
+        newCounts[c] = fitted(c)
+
+    #renormalize so the seen bigrams keep (N - N1) of the total count N
+    total = 0
+    adjustedTotal = 0.0
+    for c in seen:
+        total += c * stats[c]
+        adjustedTotal += newCounts[c] * stats[c]
+    numOnce = stats[1] if len(stats) > 1 else 0
+    scale = (total - numOnce) / adjustedTotal if adjustedTotal > 0 else 0.0
+    for c in range(1, len(stats)):
+        newCounts[c] *= scale
+
+    if stats[0] > 0:
+        newCounts[0] = float(numOnce) / stats[0]
+    return newCounts
+
+#Looks up the adjusted count of each bigram by its raw count.
+#@return    Returns an array.array('d') of adjusted counts, in the same order as rawCounts
+def applyAdjustedCounts(rawCounts, newCounts):
+    if numpy is not None:
+        return _toArray(numpy.asarray(newCounts, dtype=numpy.float64)[asNumpy(rawCounts)])
+    return array.array('d', [newCounts[count] for count in rawCounts])
+
+#Gets the probability of every word from its count.
+#@return    Returns an array.array('d') of probabilities, in the same order as wordCounts
+def wordProbs(wordCounts):
+    if numpy is not None:
+        wordCounts = asNumpy(wordCounts).astype(numpy.float64)
+        if len(wordCounts) == 0:
+            return array.array('d')
+        return _toArray(wordCounts / wordCounts.sum())
+
+    totalWords = 0
+    for count in wordCounts:
+        totalWords += count
+    return array.array('d', [float(count)/totalWords for count in wordCounts])
+
+#Gets the normalized probability of every bigram, observed or not.
+#P(word1 + word2) = count(bigram) / count(word1), then everything is divided by the total over all
+#V^2 bigrams (see bigramProbTotal).
+# @rowStarts        Where each word's bigrams start in observedCounts (CSR row starts, V+1 long)
+# @observedCounts   Smoothed count of each observed bigram
+# @unseenCounts     Smoothed count of a never seen bigram, by first word id
+# @wordCounts       Count of each word, by word id
+# @adjustedCounts   If given, observedCounts are raw counts, and each is looked up in adjustedCounts
+#@return    Returns (observed probabilities by bigram position, unseen probabilities by word id)
+def bigramProbs(rowStarts, observedCounts, unseenCounts, wordCounts, adjustedCounts=None):
+    if numpy is not None:
+        #one pass gives both the values and their total
+        observed, unseen, rowLengths = _unnormalizedProbs(rowStarts, observedCounts, unseenCounts, wordCounts,
+                                                          adjustedCounts)
+        total = _unnormalizedTotal(observed, unseen, rowLengths)
+        return _toArray(observed / total), _toArray(unseen / total)
+
+    total = bigramProbTotal(rowStarts, observedCounts, unseenCounts, wordCounts, adjustedCounts)
+    if adjustedCounts is not None:
+        observedCounts = [adjustedCounts[count] for count in observedCounts]
+    observed = array.array('d')
+    unseen = array.array('d')
+    for wordId in range(len(wordCounts)):
+        wordCount = wordCounts[wordId]
+        for index in range(rowStarts[wordId], rowStarts[wordId + 1]):
+            observed.append(float(observedCounts[index]) / wordCount / total)
+        unseen.append(float(unseenCounts[wordId]) / wordCount / total)
+    return observed, unseen
+
+#Works out the total bigramProbs divides by, without keeping any of the probabilities.
+#Bigrams that never occur share one value per first word, so they are added to the total as
+#(number of unseen bigrams) * (unseen probability). Takes the same arguments as bigramProbs.
+def bigramProbTotal(rowStarts, observedCounts, unseenCounts, wordCounts, adjustedCounts=None):
+    vocabSize = len(wordCounts)
+
+    if numpy is not None:
+        return _unnormalizedTotal(*_unnormalizedProbs(rowStarts, observedCounts, unseenCounts, wordCounts,
+                                                      adjustedCounts))
+
+    total = 0
+    for wordId in range(vocabSize):
+        wordCount = wordCounts[wordId]
+        start = rowStarts[wordId]
+        end = rowStarts[wordId + 1]
+        for index in range(start, end):
+            count = observedCounts[index]
+            if adjustedCounts is not None:
+                count = adjustedCounts[count]
+            total += float(count) / wordCount
+        total += float(unseenCounts[wordId]) / wordCount * (vocabSize - (end - start))
+    return total
+
+#Breaks bigramProbTotal down so it can be kept up to date as counts change: for any adjusted counts,
+#the total is the sum over C of adjustedCounts[C] * byCount[C], plus
+#adjustedCounts[0] * (vocabSize * inverseTotal - rowLengthTotal).
+# @rowStarts        Where each word's bigrams start in rawCounts (CSR row starts, V+1 long)
+# @rawCounts        Raw count of each observed bigram
+# @wordCounts       Count of each word, by word id
+#@return    Returns (byCount, inverseTotal, rowLengthTotal): the number of bigrams of each raw count with
+#           each weighted by 1 / count(word1), the total of 1 / count(word), and the total of
+#           (row length) / count(word)
+def weightedCountOfCounts(rowStarts, rawCounts, wordCounts):
+    if numpy is not None:
+        rowLengths = numpy.diff(asNumpy(rowStarts).astype(numpy.int64))
+        weights = 1.0 / asNumpy(wordCounts).astype(numpy.float64)
+        byCount = numpy.bincount(asNumpy(rawCounts).astype(numpy.int64), weights=numpy.repeat(weights, rowLengths),
+                                 minlength=1)
+        return byCount.tolist(), float(weights.sum()), float((rowLengths * weights).sum())
+
+    byCount = [0.0]
+    inverseTotal = 0.0
+    rowLengthTotal = 0.0
+    for wordId in range(len(wordCounts)):
+        weight = 1.0 / wordCounts[wordId]
+        start = rowStarts[wordId]
+        end = rowStarts[wordId + 1]
+        for index in range(start, end):
+            count = rawCounts[index]
+            if count >= len(byCount):
+                byCount.extend([0.0] * (count + 1 - len(byCount)))
+            byCount[count] += weight
+        inverseTotal += weight
+        rowLengthTotal += (end - start) * weight
+    return byCount, inverseTotal, rowLengthTotal
+
+#count(bigram) / count(word1) for every bigram as NumPy arrays, before normalizing
+#@return    Returns (observed values by bigram position, unseen values by word id, row lengths)
+def _unnormalizedProbs(rowStarts, observedCounts, unseenCounts, wordCounts, adjustedCounts):
+    rowLengths = numpy.diff(asNumpy(rowStarts).astype(numpy.int64))
+    wordCounts = asNumpy(wordCounts).astype(numpy.float64)
+    if adjustedCounts is not None:
+        observedCounts = numpy.asarray(adjustedCounts, dtype=numpy.float64)[asNumpy(observedCounts)]
+    observed = asNumpy(observedCounts).astype(numpy.float64) / numpy.repeat(wordCounts, rowLengths)
+    unseen = asNumpy(unseenCounts).astype(numpy.float64) / wordCounts
+    return observed, unseen, rowLengths
+
+#@return    Returns the total of the values from _unnormalizedProbs over all V^2 bigrams
+def _unnormalizedTotal(observed, unseen, rowLengths):
+    return float(observed.sum() + (unseen * (len(unseen) - rowLengths)).sum())
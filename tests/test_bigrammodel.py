@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import smoothing
+
+# Checks that a BigramModel built up a piece of text at a time, with its new bigrams kept on the side
+# and folded in now and then, answers exactly like a model built from all of the text at once.
+#
+#   python -m unittest discover tests
+
+CORPUS_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "corpora", "IT.txt")
+
+#how many pieces the corpus is added in
+NUM_PIECES = 7
+
+
+class BigramModelOverlayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.foldBigrams = bigrammer.FOLD_BIGRAMS
+        self.foldFraction = bigrammer.FOLD_FRACTION
+        with open(CORPUS_FILENAME) as corpusFile:
+            self.text = corpusFile.read()
+
+    def tearDown(self):
+        bigrammer.FOLD_BIGRAMS = self.foldBigrams
+        bigrammer.FOLD_FRACTION = self.foldFraction
+
+    #@return    Returns the ends of the pieces the corpus is added in, each at a sentence end
+    def pieceEnds(self):
+        ends = []
+        end = 0
+        while end < len(self.text):
+            end = self.text.find(". ", end + len(self.text) // NUM_PIECES)
+            end = len(self.text) if end < 0 else end + 2
+            ends.append(end)
+        return ends
+
+    def assertSameModel(self, whole, added):
+        random.seed(1)
+        words = list(whole.vocabulary())
+        self.assertEqual(list(added.vocabulary()), words)
+        self.assertEqual(added.likelyWord(), whole.likelyWord())
+        for i in range(300):
+            word1, word2 = random.choice(words), random.choice(words)
+            self.assertAlmostEqual(added.bigramProb(word1, word2) / whole.bigramProb(word1, word2), 1.0, places=9)
+            self.assertAlmostEqual(added.wordProb(word1), whole.wordProb(word1), places=12)
+        for word in words[:100]:
+            self.assertEqual([nextWord for nextWord, prob in added.topNextWords(word, 5)],
+                             [nextWord for nextWord, prob in whole.topNextWords(word, 5)])
+
+    #Adds the corpus a piece at a time, checking the model against a fresh one after each piece.
+    #@return    Returns how many of the pieces left bigrams on the side
+    def checkAddedInPieces(self, smoothingMode):
+        added = bigrammer.BigramModel(smoothingMode=smoothingMode)
+        start = 0
+        overlaid = 0
+        for end in self.pieceEnds():
+            added.addText(self.text[start:end])
+            start = end
+            whole = bigrammer.BigramModel(smoothingMode=smoothingMode)
+            whole.addText(self.text[:end])
+            self.assertSameModel(whole, added)
+            #the new bigrams are folded in, or not, on the first query after they're added
+            if len(added.counts.pending) > 0:
+                overlaid += 1
+        return overlaid
+
+    def testOverlayMatchesFreshModel(self):
+        #nothing is folded in: every piece after the first stays on the side
+        bigrammer.FOLD_BIGRAMS = 1 << 30
+        bigrammer.FOLD_FRACTION = 1 << 30
+        for smoothingMode in (smoothing.GOOD_TURING, smoothing.SIMPLE_GOOD_TURING):
+            self.assertTrue(self.checkAddedInPieces(smoothingMode) > 0)
+
+    def testFoldedModelMatchesFreshModel(self):
+        #every piece is folded in as soon as it's queried
+        bigrammer.FOLD_BIGRAMS = 0
+        bigrammer.FOLD_FRACTION = 1 << 30
+        for smoothingMode in (smoothing.GOOD_TURING, smoothing.SIMPLE_GOOD_TURING):
+            self.assertEqual(self.checkAddedInPieces(smoothingMode), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import external
+import sensplit
+
+# Checks that counting with spills to disk gives exactly the counts of counting in memory.
+#
+#   python -m unittest discover tests
+
+CORPUS_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "corpora", "IT.txt")
+
+
+class SpillingCountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.maxMergeRuns = external.MAX_MERGE_RUNS
+        self.inMemory = bigrammer.countCorpus(CORPUS_FILENAME)
+
+    def tearDown(self):
+        external.MAX_MERGE_RUNS = self.maxMergeRuns
+
+    def assertSameCounts(self, spilled):
+        self.assertEqual(list(spilled.vocabulary), list(self.inMemory.vocabulary))
+        self.assertEqual(spilled.wordCounts, self.inMemory.wordCounts)
+        self.assertEqual(spilled.rowStarts, self.inMemory.rowStarts)
+        self.assertEqual(spilled.bigramWords, self.inMemory.bigramWords)
+        self.assertEqual(spilled.bigramCounts, self.inMemory.bigramCounts)
+
+    #@return    Returns the counts of the corpus, spilled with room for about maxPending new bigrams
+    def countSpilled(self, maxPending):
+        spilled = external.SpillingCounts(maxPending * external.PENDING_BYTES)
+        stopWords = bigrammer.getStopWords()
+        for sentence in sensplit.iter_sentences(CORPUS_FILENAME):
+            spilled.addSentence(bigrammer.tokenize(sentence, stopWords))
+        return spilled
+
+    def testSpilledCountsEqualInMemoryCounts(self):
+        for maxPending in (1000, 100, 10):
+            spilled = self.countSpilled(maxPending)
+            spilled.freeze()
+            self.assertSameCounts(spilled)
+
+    def testLevelsStayBounded(self):
+        #a small fan in makes several levels out of the few hundred spills
+        external.MAX_MERGE_RUNS = 4
+        spilled = self.countSpilled(10)
+        self.assertTrue(max(spilled.runLevels) >= 2)
+        for level in set(spilled.runLevels):
+            self.assertTrue(spilled.runLevels.count(level) < external.MAX_MERGE_RUNS)
+        self.assertEqual(spilled.runLevels, sorted(spilled.runLevels, reverse=True))
+        spilled.freeze()
+        self.assertSameCounts(spilled)
+
+    def testMergeSpillsAndFreezes(self):
+        spilled = external.SpillingCounts(10 * external.PENDING_BYTES)
+        spilled.merge(self.inMemory)
+        self.assertTrue(len(spilled.runs) > 0)
+        spilled.freeze()
+        self.assertSameCounts(spilled)
+
+
+if __name__ == "__main__":
+    unittest.main()
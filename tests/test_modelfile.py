@@ -0,0 +1,79 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import modelfile
+
+# Checks that a compiled model answers the same as the in-memory model it was written from, and
+# that models are written whole or not at all.
+#
+#   python -m unittest discover tests
+
+CORPUS_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "corpora", "IT.txt")
+
+
+#A model whose write fails half way through.
+class FailingModel(object):
+
+    def write(self, modelFile, corpusInfo):
+        modelFile.write("half a model")
+        raise RuntimeError("write failed")
+
+
+class CompiledModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.corpusFilename = os.path.join(self.tempDir, "IT.txt")
+        shutil.copy(CORPUS_FILENAME, self.corpusFilename)
+        self.modelFilename = self.corpusFilename + bigrammer.MODEL_EXTENSION
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def testCompiledModelMatchesInMemoryModel(self):
+        compiled = bigrammer.compileModel(self.corpusFilename)
+        inMemory = bigrammer.BigramModel(bigrammer.countCorpus(self.corpusFilename))
+        try:
+            self.assertEqual(list(compiled.vocabulary()), list(inMemory.vocabulary()))
+            for word1 in ["information", "the", "economic"]:
+                self.assertEqual(compiled.topNextWords(word1, 5), inMemory.topNextWords(word1, 5))
+                self.assertAlmostEqual(compiled.wordProb(word1), inMemory.wordProb(word1), places=15)
+                for word2 in ["technology", "impact", "market"]:
+                    self.assertAlmostEqual(compiled.bigramProb(word1, word2) / inMemory.bigramProb(word1, word2), 1.0,
+                                           places=12)
+
+            #the raw counts read back exactly
+            counts = compiled.corpusCounts()
+            self.assertEqual(sorted(counts.vocabulary), sorted(inMemory.counts.vocabulary))
+            for word in inMemory.counts.vocabulary:
+                self.assertEqual(compiled.wordCount(word), inMemory.wordCount(word))
+        finally:
+            compiled.close()
+
+    def testWritesLeaveNoTemporaryFiles(self):
+        bigrammer.compileModel(self.corpusFilename).close()
+        bigrammer.compileModel(self.corpusFilename).close()
+        self.assertEqual(sorted(os.listdir(self.tempDir)), ["IT.txt", "IT.txt" + bigrammer.MODEL_EXTENSION])
+
+    def testFailedWriteKeepsOldModel(self):
+        bigrammer.compileModel(self.corpusFilename).close()
+        with open(self.modelFilename, "rb") as modelFile:
+            before = modelFile.read()
+
+        self.assertRaises(RuntimeError, bigrammer.writeCompiledModel, FailingModel(), {}, self.modelFilename)
+        with open(self.modelFilename, "rb") as modelFile:
+            self.assertEqual(modelFile.read(), before)
+        self.assertEqual(sorted(os.listdir(self.tempDir)), ["IT.txt", "IT.txt" + bigrammer.MODEL_EXTENSION])
+
+    def testNotAModel(self):
+        self.assertRaises(ValueError, modelfile.CompiledModel, self.corpusFilename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import StringIO
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import ngrams
+import sensplit
+import smoothing
+
+# Checks that Katz backoff gives a distribution over every word after any context, that predictions
+# rank words by those probabilities, and that the bigram main functions are the two word n-gram ones.
+#
+#   python -m unittest discover tests
+
+CORPUS_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "corpora", "IT.txt")
+
+
+class NgramModelTest(unittest.TestCase):
+
+    def setUp(self):
+        stopWords = bigrammer.getStopWords()
+        self.sentences = [bigrammer.tokenize(sen, stopWords) for sen in sensplit.iter_sentences(CORPUS_FILENAME)]
+
+    #@return    Returns an NgramModel of the corpus
+    def ngramModel(self, order, smoothingMode=smoothing.GOOD_TURING):
+        ngramCounts = ngrams.NgramCounts(order)
+        for tokens in self.sentences:
+            ngramCounts.addSentence(tokens)
+        return ngrams.NgramModel(ngramCounts, smoothingMode)
+
+    #@return    Returns some contexts of a length: ones that occur in the corpus, and one that doesn't
+    def contexts(self, length):
+        contexts = []
+        for tokens in self.sentences[:40:8]:
+            if len(tokens) >= length:
+                contexts.append(tokens[:length])
+        contexts.append(["information"] * (length - 1) + ["the"])
+        return contexts
+
+    def testDistributionsSumToOne(self):
+        for smoothingMode in (smoothing.GOOD_TURING, smoothing.SIMPLE_GOOD_TURING):
+            for order in (2, 3, 4):
+                model = self.ngramModel(order, smoothingMode)
+                for context in self.contexts(order - 1):
+                    total = sum([model.ngramProb(context + [word]) for word in model.vocabulary])
+                    self.assertAlmostEqual(total, 1.0, places=9)
+
+    def testTopNextWordsRankByProbability(self):
+        for order in (2, 3):
+            model = self.ngramModel(order)
+            for context in self.contexts(order - 1):
+                ranked = sorted([(-model.ngramProb(context + [word]), word) for word in model.vocabulary])[:5]
+                expected = [(word, -negProb) for negProb, word in ranked if negProb < 0]
+                topWords = model.topNextWordsAfter(context, 5)
+                self.assertEqual([word for word, prob in topWords], [word for word, prob in expected])
+                for (word, prob), (expectedWord, expectedProb) in zip(topWords, expected):
+                    self.assertAlmostEqual(prob, expectedProb, places=12)
+
+    def testUnknownContext(self):
+        model = self.ngramModel(3)
+        self.assertEqual(model.ngramProb(["zzz", "the"]), None)
+        self.assertEqual(model.topNextWordsAfter(["information", "zzz"], 3), [])
+        #an unknown word earlier in the context only shortens it
+        self.assertEqual(model.ngramProb(["zzz", "information", "technology"]),
+                         model.ngramProb(["information", "technology"]))
+
+
+class BigramMainFunctionsTest(unittest.TestCase):
+
+    def tearDown(self):
+        bigrammer.getModelRegistry().clear()
+
+    def testPredictTopKIsTheOneWordContext(self):
+        for word in ("information", "computer", "zzz"):
+            self.assertEqual(bigrammer.predictTopK(CORPUS_FILENAME, word, 5),
+                             bigrammer.predictTopKInContext(CORPUS_FILENAME, [word], 5))
+
+    #@return    Returns what a function prints
+    def printed(self, function, *args):
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            function(*args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def testBigramChanceIsTheTwoWordNgramChance(self):
+        for word1, word2 in (("information", "technology"), ("Information", "the"), ("zzz", "the")):
+            self.assertEqual(self.printed(bigrammer.getBigramChance, CORPUS_FILENAME, word1, word2),
+                             self.printed(bigrammer.getNgramChance, CORPUS_FILENAME, [word1, word2]))
+        model = bigrammer.getModel(CORPUS_FILENAME, order=2)
+        prob = model.ngramProb(["information", "technology"])
+        self.assertEqual(self.printed(bigrammer.getBigramChance, CORPUS_FILENAME, "information", "technology"),
+                         "Probability of [information technology]: " + str(prob*100) + "%\n")
+        self.assertEqual(bigrammer.predictTopK(CORPUS_FILENAME, "information", 1)[0], ("technology", prob))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import scoring
+import sensplit
+
+# Checks that document scores are the same with and without NumPy, and against the model's own
+# probabilities.
+#
+#   python -m unittest discover tests
+
+CORPUS_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "corpora", "IT.txt")
+
+DOCUMENTS = [
+    "Information technology is the use of computers.",
+    "The economic impact of the internet. Nothing zzzqqq here.",
+    "zzzqqq",
+    "",
+]
+
+
+#@return    Returns a BigramModel of some text
+def modelOf(text):
+    return bigrammer.BigramModel(bigrammer.countSentences(sensplit.iter_text_sentences(text)))
+
+#@return    Returns the documents tokenized as scoreDocuments does
+def tokenized(documents):
+    stopWords = bigrammer.getStopWords()
+    return [[bigrammer.tokenize(sen, stopWords) for sen in sensplit.iter_text_sentences(document)]
+            for document in documents]
+
+
+class DocumentScorerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.numpy = scoring.numpy
+
+    def tearDown(self):
+        scoring.numpy = self.numpy
+
+    #@return    Returns the scores of the documents with NumPy and with plain Python
+    def scoreBothWays(self, model, documents):
+        numpyScores = None
+        if self.numpy is not None:
+            numpyScores = list(scoring.DocumentScorer(model).score(tokenized(documents)))
+        scoring.numpy = None
+        pythonScores = list(scoring.DocumentScorer(model).score(tokenized(documents)))
+        scoring.numpy = self.numpy
+        return numpyScores, pythonScores
+
+    def assertSameScores(self, numpyScores, pythonScores):
+        if numpyScores is None:
+            return
+        self.assertEqual(len(numpyScores), len(pythonScores))
+        for numpyScore, pythonScore in zip(numpyScores, pythonScores):
+            self.assertEqual(numpyScore.tokens, pythonScore.tokens)
+            self.assertEqual(numpyScore.oov, pythonScore.oov)
+            self.assertAlmostEqual(numpyScore.logProb, pythonScore.logProb, places=9)
+            if pythonScore.perplexity is None:
+                self.assertEqual(numpyScore.perplexity, None)
+            else:
+                self.assertAlmostEqual(numpyScore.perplexity / pythonScore.perplexity, 1.0, places=9)
+
+    def testNumpyAndPythonAgree(self):
+        model = bigrammer.BigramModel(bigrammer.countCorpus(CORPUS_FILENAME))
+        numpyScores, pythonScores = self.scoreBothWays(model, DOCUMENTS)
+        self.assertSameScores(numpyScores, pythonScores)
+        self.assertEqual([score.oov for score in pythonScores], [0, 3, 1, 0])
+        self.assertEqual(pythonScores[2].perplexity, None)
+
+    def testScoresMatchModelProbabilities(self):
+        model = modelOf("the cat sat. the cat ran. a dog sat.")
+        numpyScores, pythonScores = self.scoreBothWays(model, ["cat sat"])
+        self.assertSameScores(numpyScores, pythonScores)
+
+        #P(sat | cat) is its smoothed probability over the total of the cat row
+        rowTotal = sum([model.bigramProb("cat", word) for word in model.vocabulary()])
+        expected = math.log(model.wordProb("cat")) + math.log(model.bigramProb("cat", "sat") / rowTotal)
+        self.assertAlmostEqual(pythonScores[0].logProb, expected, places=9)
+
+    def testModelWithoutBigrams(self):
+        model = modelOf("Hello. World. Again.")
+        self.assertEqual(model.counts.numBigrams(), 0)
+        numpyScores, pythonScores = self.scoreBothWays(model, ["Hello world.", "Again again"])
+        self.assertSameScores(numpyScores, pythonScores)
+        self.assertEqual([score.tokens for score in pythonScores], [2, 2])
+        for score in pythonScores:
+            self.assertTrue(score.perplexity is not None and score.perplexity > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncore
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import server
+
+# Checks the query server's answers, that bad requests get an error and keep the connection open, and
+# that models are reloaded when their corpus or the stop words change.
+#
+#   python -m unittest discover tests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.corpusFilename = os.path.join(self.tempDir, "IT.txt")
+        shutil.copy(os.path.join(ROOT, "corpora", "IT.txt"), self.corpusFilename)
+        self.stopwordsFilename = bigrammer.STOPWORDS_FILENAME
+        bigrammer.STOPWORDS_FILENAME = os.path.join(self.tempDir, "stopwords.txt")
+        shutil.copy(os.path.join(ROOT, "stopwords.txt"), bigrammer.STOPWORDS_FILENAME)
+        self.models = server.ModelSet([self.corpusFilename])
+
+    def tearDown(self):
+        bigrammer.STOPWORDS_FILENAME = self.stopwordsFilename
+        shutil.rmtree(self.tempDir)
+
+    #@return    Returns the response to each request, sent one after another on one connection
+    def ask(self, requests):
+        queryServer = server.QueryServer(self.models, os.path.join(self.tempDir, "server.sock"))
+        loop = threading.Thread(target=asyncore.loop, args=(0.05, False, queryServer.socketMap))
+        loop.start()
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(os.path.join(self.tempDir, "server.sock"))
+            responses = client.makefile()
+            answers = []
+            for request in requests:
+                client.sendall(json.dumps(request) + "\n")
+                answers.append(json.loads(responses.readline()))
+            return answers
+        finally:
+            client.close()
+            for dispatcher in queryServer.socketMap.values():
+                dispatcher.close()
+            loop.join()
+
+    def testAnswers(self):
+        model = self.models.get()
+        answers = self.ask([
+            {"id": 1, "op": "chance", "word1": "information", "word2": "technology"},
+            {"id": 2, "op": "topk", "word": "information", "k": 2},
+            {"op": "sentences", "count": 3, "seed": 1},
+            {"op": "corpora"},
+        ])
+        self.assertEqual(answers[0], {"id": 1, "result": model.bigramProb("information", "technology")})
+        self.assertEqual(answers[1]["result"], [list(pair) for pair in model.topNextWords("information", 2)])
+        self.assertEqual(len(answers[2]["result"]), 3)
+        self.assertEqual(answers[3]["result"], [self.corpusFilename])
+
+    def testBadRequestsGetErrors(self):
+        badRequests = [
+            {"op": "chance", "word1": ["a"], "word2": "b"},
+            {"op": "predict", "word": None},
+            {"op": "topk", "word": "the", "k": 0},
+            {"op": "sentences", "count": 10, "length": 0},
+            {"op": "sentences", "count": server.MAX_SENTENCES, "length": server.MAX_SENTENCE_LENGTH},
+            {"op": "sentences", "count": 1e309},
+            {"op": "sentences", "count": float("nan")},
+            {"op": "sentences", "count": 2, "temperature": float("nan")},
+            {"op": "sentences", "count": 2, "temperature": float("inf")},
+            {"op": "sentences", "count": 2, "temperature": -1},
+            {"op": "sentences", "count": 2, "mode": "beam", "beamWidth": 10 ** 400},
+            {"op": "sentences"},
+            {"op": ["x"]},
+        ]
+        answers = self.ask(badRequests + [{"op": "corpora"}])
+        for request, answer in zip(badRequests, answers):
+            self.assertTrue("error" in answer, request)
+            self.assertFalse(answer["error"].startswith("internal error"), answer)
+        #the connection is still open after all of them
+        self.assertEqual(answers[-1]["result"], [self.corpusFilename])
+
+    def testReloadsWhenStopWordsChange(self):
+        self.assertEqual(self.models.reloadChanged(), [])
+        self.assertTrue(self.models.get().wordCount("technology") > 0)
+
+        with open(bigrammer.STOPWORDS_FILENAME, "ab") as stopwordsFile:
+            stopwordsFile.write("\ntechnology\n")
+        self.assertEqual(self.models.reloadChanged(), [self.corpusFilename])
+        self.assertEqual(self.models.get().wordCount("technology"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
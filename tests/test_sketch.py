@@ -0,0 +1,96 @@
+import collections
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bigrammer
+import sensplit
+import sketch
+
+# Checks that sketch counts are never too low, that the heavy hitter table counts exactly once a word
+# and its successors are in it, and that sketches are cached in the model registry.
+#
+#   python -m unittest discover tests
+
+CORPUS_FILENAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "corpora", "IT.txt")
+
+
+class SketchModelTest(unittest.TestCase):
+
+    def setUp(self):
+        stopWords = bigrammer.getStopWords()
+        self.sentences = [bigrammer.tokenize(sen, stopWords) for sen in sensplit.iter_sentences(CORPUS_FILENAME)]
+        self.wordCounts = collections.Counter()
+        self.bigramCounts = collections.Counter()
+        for tokens in self.sentences:
+            self.wordCounts.update(tokens)
+            self.bigramCounts.update(zip(tokens, tokens[1:]))
+
+    #@return    Returns a SketchModel of the corpus with the given sizes
+    def sketchModel(self, width, topN, maxWords):
+        model = sketch.SketchModel(width, 4, topN, maxWords)
+        for tokens in self.sentences:
+            model.addSentence(tokens)
+        return model
+
+    #@return    Returns the exact successor counts of a word
+    def successorCounts(self, word):
+        return dict([(word2, count) for (word1, word2), count in self.bigramCounts.iteritems() if word1 == word])
+
+    def testEstimatesAreNeverTooLow(self):
+        model = self.sketchModel(256, 5, 50)
+        for word, count in self.wordCounts.iteritems():
+            self.assertTrue(model.wordCount(word) >= count)
+        for (word1, word2), count in self.bigramCounts.iteritems():
+            lowest, highest = model.bigramFreqBounds(word1, word2)
+            self.assertTrue(lowest <= count <= highest)
+
+    def testTableIsExactWhenEverythingFits(self):
+        #a tiny sketch overestimates a lot, but a table with room for every word and successor is exact
+        model = self.sketchModel(64, 10 ** 6, 10 ** 6)
+        for word, count in self.wordCounts.iteritems():
+            successors = self.successorCounts(word)
+            if not successors:
+                continue
+            expected = sorted(successors.iteritems(), key=lambda (word2, count): (-count, word2))[:10]
+            self.assertEqual(model.topNextWords(word, 10),
+                             [(word2, successorCount / float(count)) for word2, successorCount in expected])
+
+    def testTableCountsAreNeverTooHigh(self):
+        #with a small table words and successors get in late, so their counts can only be under
+        model = self.sketchModel(256, 3, 20)
+        for word in model.successors:
+            self.assertTrue(model.keptCounts[word] <= self.wordCounts[word])
+            successors = self.successorCounts(word)
+            for word2, (count, error) in model.successors[word].iteritems():
+                self.assertTrue(count <= successors[word2] <= count + error)
+
+    def testRepeatedWords(self):
+        model = sketch.SketchModel(1024, 4, 5, 5)
+        model.addSentence(["a", "a", "a", "b"])
+        self.assertEqual(model.keptCounts["a"], 3)
+        self.assertEqual(model.topNextWords("a", 5), [("a", 2 / 3.0), ("b", 1 / 3.0)])
+
+
+class SketchRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        bigrammer.getModelRegistry().clear()
+
+    def tearDown(self):
+        bigrammer.getModelRegistry().clear()
+
+    def testSketchIsCached(self):
+        model = bigrammer.getSketchModel(CORPUS_FILENAME, 1024, 4, 5, 100)
+        self.assertTrue(bigrammer.getSketchModel(CORPUS_FILENAME, 1024, 4, 5, 100) is model)
+        self.assertFalse(bigrammer.getSketchModel(CORPUS_FILENAME, 2048, 4, 5, 100) is model)
+        self.assertFalse(bigrammer.getModel(CORPUS_FILENAME) is model)
+
+    def testMissingCorpus(self):
+        self.assertEqual(bigrammer.getSketchModel(CORPUS_FILENAME + ".missing"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()